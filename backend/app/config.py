@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# -------------------------------------------------
+# Settings: read environment (+ backend/.env) exactly once
+# -------------------------------------------------
+_HERE = os.path.dirname(os.path.abspath(__file__))          # .../backend/app
+ENV_PATH = os.path.abspath(os.path.join(_HERE, "..", ".env"))  # .../backend/.env
+
+DEFAULT_CASSETTE_DIR = os.path.abspath(os.path.join(_HERE, "..", "cassettes"))  # .../backend/cassettes
+DEFAULT_FRONTEND_DIR = os.path.abspath(os.path.join(_HERE, "..", "static_build"))  # .../backend/static_build
+DEFAULT_PLACE_INDEX_PATH = os.path.abspath(os.path.join(_HERE, "..", "data", "place_index.json"))  # .../backend/data
+
+DEFAULT_CORS_ORIGINS: Tuple[str, ...] = (
+    "http://127.0.0.1:5500",
+    "http://localhost:5500",
+    "http://127.0.0.1:5173",
+    "http://localhost:5173",
+    "http://127.0.0.1:3000",
+    "http://localhost:3000",
+)
+
+
+@dataclass(frozen=True)
+class Settings:
+    google_maps_api_key: Optional[str]
+    env_path: str
+    env_file_found: bool
+    cors_origins: Tuple[str, ...] = DEFAULT_CORS_ORIGINS
+    # Mount /legacy/* endpoints (imported lazily on first use)
+    legacy_routes: bool = True
+    # Admission control (see services/admission.py)
+    upstream_concurrency: int = 24
+    upstream_queue_depth: int = 32
+    cheap_concurrency: int = 64
+    admission_queue_timeout_s: float = 2.0
+    shed_latency_s: float = 4.0
+    degraded_concurrency: int = 2
+    # Upstream record/replay (see services/recording.py): live | record | replay
+    upstream_mode: str = "live"
+    cassette_dir: str = DEFAULT_CASSETTE_DIR
+    replay_latency: str = "recorded"  # recorded | zero
+    # Cache warm-up (see services/warmup.py): corridor JSON file, or "traffic"
+    warmup_corridors: Optional[str] = None
+    warmup_budget: int = 200
+    warmup_target: float = 0.8
+    warmup_max_wait_s: float = 120.0
+    # Upstream calls in flight per priority class (see services/priority.py)
+    upstream_limit_interactive: int = 8
+    upstream_limit_standard: int = 16
+    upstream_limit_background: int = 4
+    # Background jobs (see services/jobs.py)
+    jobs_workers: int = 4
+    jobs_max_queued: int = 100
+    jobs_ttl_s: float = 900.0
+    # Circuit breakers per upstream method (see services/circuit_breaker.py)
+    breaker_failures: int = 5
+    breaker_slow_call_s: float = 8.0
+    breaker_open_s: float = 30.0
+    breaker_legacy_fallback: bool = True
+    # Bearer token for /debug/profile and /debug/allocations (disabled when unset)
+    debug_token: Optional[str] = None
+    # Signs pagination cursors (see utils/cursor.py); random per process when unset
+    cursor_secret: Optional[str] = None
+    # Worker threads for sync handlers (see services/runtime_monitor.py); anyio's default is 40
+    threadpool_size: int = 40
+    # Built frontend served at / and /static (see services/frontend.py)
+    frontend_dir: str = DEFAULT_FRONTEND_DIR
+    # Local index of seen places (see services/place_index.py); path "none" keeps it in memory
+    place_index_enabled: bool = True
+    place_index_path: Optional[str] = DEFAULT_PLACE_INDEX_PATH
+    place_index_fresh_s: float = 3 * 86400.0
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    try:
+        return int(raw) if raw and raw.strip() else default
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    try:
+        return float(raw) if raw and raw.strip() else default
+    except ValueError:
+        return default
+
+
+def _place_index_path() -> Optional[str]:
+    raw = (os.getenv("DEESHA_PLACE_INDEX_PATH") or "").strip()
+    if raw.lower() == "none":
+        return None
+    return raw or DEFAULT_PLACE_INDEX_PATH
+
+
+def _load_env_file(path: str) -> bool:
+    """Load backend/.env into os.environ if present. python-dotenv is only imported when needed."""
+    if not os.path.exists(path):
+        return False
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return True
+    load_dotenv(dotenv_path=path)
+    return True
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    found = _load_env_file(ENV_PATH)
+
+    origins = os.getenv("DEESHA_CORS_ORIGINS")
+    cors = tuple(o.strip() for o in origins.split(",") if o.strip()) if origins else DEFAULT_CORS_ORIGINS
+
+    return Settings(
+        google_maps_api_key=os.getenv("GOOGLE_MAPS_API_KEY") or None,
+        env_path=ENV_PATH,
+        env_file_found=found,
+        cors_origins=cors,
+        legacy_routes=_env_bool("DEESHA_LEGACY_ROUTES", True),
+        upstream_concurrency=_env_int("DEESHA_UPSTREAM_CONCURRENCY", 24),
+        upstream_queue_depth=_env_int("DEESHA_UPSTREAM_QUEUE_DEPTH", 32),
+        cheap_concurrency=_env_int("DEESHA_CHEAP_CONCURRENCY", 64),
+        admission_queue_timeout_s=_env_float("DEESHA_ADMISSION_QUEUE_TIMEOUT_S", 2.0),
+        shed_latency_s=_env_float("DEESHA_SHED_LATENCY_S", 4.0),
+        degraded_concurrency=_env_int("DEESHA_DEGRADED_CONCURRENCY", 2),
+        upstream_mode=(os.getenv("DEESHA_UPSTREAM_MODE") or "live").strip().lower(),
+        cassette_dir=os.getenv("DEESHA_CASSETTE_DIR") or DEFAULT_CASSETTE_DIR,
+        replay_latency=(os.getenv("DEESHA_REPLAY_LATENCY") or "recorded").strip().lower(),
+        warmup_corridors=(os.getenv("DEESHA_WARMUP_CORRIDORS") or "").strip() or None,
+        warmup_budget=_env_int("DEESHA_WARMUP_BUDGET", 200),
+        warmup_target=_env_float("DEESHA_WARMUP_TARGET", 0.8),
+        warmup_max_wait_s=_env_float("DEESHA_WARMUP_MAX_WAIT_S", 120.0),
+        upstream_limit_interactive=_env_int("DEESHA_UPSTREAM_LIMIT_INTERACTIVE", 8),
+        upstream_limit_standard=_env_int("DEESHA_UPSTREAM_LIMIT_STANDARD", 16),
+        upstream_limit_background=_env_int("DEESHA_UPSTREAM_LIMIT_BACKGROUND", 4),
+        jobs_workers=_env_int("DEESHA_JOBS_WORKERS", 4),
+        jobs_max_queued=_env_int("DEESHA_JOBS_MAX_QUEUED", 100),
+        jobs_ttl_s=_env_float("DEESHA_JOBS_TTL_S", 900.0),
+        breaker_failures=_env_int("DEESHA_BREAKER_FAILURES", 5),
+        breaker_slow_call_s=_env_float("DEESHA_BREAKER_SLOW_CALL_S", 8.0),
+        breaker_open_s=_env_float("DEESHA_BREAKER_OPEN_S", 30.0),
+        breaker_legacy_fallback=_env_bool("DEESHA_BREAKER_LEGACY_FALLBACK", True),
+        debug_token=(os.getenv("DEESHA_DEBUG_TOKEN") or "").strip() or None,
+        cursor_secret=(os.getenv("DEESHA_CURSOR_SECRET") or "").strip() or None,
+        threadpool_size=_env_int("DEESHA_THREADPOOL_SIZE", 40),
+        frontend_dir=os.getenv("DEESHA_FRONTEND_DIR") or DEFAULT_FRONTEND_DIR,
+        place_index_enabled=_env_bool("DEESHA_PLACE_INDEX", True),
+        place_index_path=_place_index_path(),
+        place_index_fresh_s=_env_float("DEESHA_PLACE_INDEX_FRESH_S", 3 * 86400.0),
+    )
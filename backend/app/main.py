@@ -1,56 +1,249 @@
-print("✅ RUNNING FILE:", __file__)
-
-import os
-import math
-import requests
-from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Body
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, Depends, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.routing import APIRoute
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from .config import get_settings
+from .model.place import Place, parse_places, rank_places
+from .services import upstream
+from .services.admission import AdmissionController, AdmissionMiddleware
+from .services.cancellation import DisconnectCancelMiddleware
+from .services.circuit_breaker import CircuitOpen
+from .services.frontend import FrontendBundle
+from .services.jobs import Job, JobQueue, report_stage
+from .services.place_index import place_index
+from .services.itinerary_services import ItineraryEngine, normalize as normalize_trip
+from .services import profiler
+from .services.priority import PriorityMiddleware
+from .services.recording import InboundRecorderMiddleware, load_inbound
+from .services.runtime_monitor import RuntimeMonitor, RuntimeMonitorMiddleware, route_class
+from .services.warmup import Corridor, Endpoint, Step, WarmupState, corridors_from_traffic, load_corridors, start_warmup_thread
+from .utils import metrics
+from .utils.cache import TTLCache
+from .utils.cursor import decode_cursor, encode_cursor
+from .utils.http_cache import conditional_json, etag_for, json_bytes
+from .utils.geo import (
+    CorridorWindow,
+    SearchCircle,
+    corridor_circles_needed,
+    decode_polyline,
+    haversine_m,
+    join_polylines,
+    path_length_m,
+    plan_corridor_circles,
+)
+
+logger = logging.getLogger("deesha")
 
 # -------------------------------------------------
-# Load environment (.env) from backend/.env
+# Settings (env + backend/.env, read once)
 # -------------------------------------------------
-_HERE = os.path.dirname(os.path.abspath(__file__))          # .../backend/app
-_ENV_PATH = os.path.abspath(os.path.join(_HERE, "..", ".env"))  # .../backend/.env
-load_dotenv(dotenv_path=_ENV_PATH)
-print("ENV FILE EXISTS:", os.path.exists(_ENV_PATH))
-
-GOOGLE_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
+settings = get_settings()
+GOOGLE_API_KEY = settings.google_maps_api_key
 # SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")  # optional: for internet search + grounding (disabled for now)
 SERPAPI_API_KEY = None
-if not GOOGLE_API_KEY:
-    print(f"⚠️ GOOGLE_MAPS_API_KEY missing (expected in {_ENV_PATH})")
-else:
-    print(f"✅ GOOGLE_MAPS_API_KEY loaded (length={len(GOOGLE_API_KEY)}) from {_ENV_PATH}")
+# Several workers (or restarts) need DEESHA_CURSOR_SECRET for cursors to outlive the process.
+CURSOR_SECRET = settings.cursor_secret.encode("utf-8") if settings.cursor_secret else secrets.token_bytes(32)
 
 # -------------------------------------------------
 # FastAPI app + CORS
 # -------------------------------------------------
-app = FastAPI(title="Deesha Backend", version="0.1.0")
+# Threadpool occupancy, queue wait before handlers start, event-loop lag (GET /debug/runtime)
+RUNTIME = RuntimeMonitor(threadpool_size=settings.threadpool_size)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Logged at startup rather than import so `import app.main` stays side-effect free.
+    if not GOOGLE_API_KEY:
+        logger.warning("GOOGLE_MAPS_API_KEY missing (expected in env or %s)", settings.env_path)
+    else:
+        logger.info("GOOGLE_MAPS_API_KEY loaded (length=%d, .env found=%s)", len(GOOGLE_API_KEY), settings.env_file_found)
+    if settings.warmup_corridors:
+        corridors = _load_warmup_corridors(settings.warmup_corridors)
+        logger.info("Warming caches for %d corridors (budget %d upstream calls)", len(corridors), settings.warmup_budget)
+        start_warmup_thread(corridors, _warm_corridor, settings.warmup_budget, WARMUP)
+    RUNTIME.start()
+    place_index().start_autosave()
+    try:
+        yield
+    finally:
+        await RUNTIME.stop()
+        JOBS.shutdown()
+        await asyncio.to_thread(place_index().stop)
+
+
+app = FastAPI(title="Deesha Backend", version="0.1.0", lifespan=lifespan)
+# Sync handlers report how long they waited for a worker thread.
+app.router.route_class = route_class(RUNTIME)
+# Innermost: stamps arrival after admission, so queue wait is time spent waiting for a thread.
+app.add_middleware(RuntimeMonitorMiddleware)
+
+# Upstream calls take a slot of their request's priority class, so typeahead never
+# queues behind /plan-trip/batch or warm-up (see services/priority.py).
+app.add_middleware(
+    PriorityMiddleware,
+    interactive_paths=(
+        "/places/autocomplete",
+        "/places/suggest",
+        "/ws/places/suggest",
+        "/places/details",
+        "/places/details/batch",
+    ),
+    background_paths=("/plan-trip/batch",),
+)
+
+# Upstream-heavy endpoints stop issuing Google calls once their client disconnects.
+CANCEL_ON_DISCONNECT_PATHS = (
+    "/plan-trip",
+    "/places/things-to-do",
+    "/places/alternatives",
+    "/places/resolve",
+    "/places/suggest",
+    "/routes",
+    "/routes/incremental",
+    "/plan-trip/batch",
+)
+app.add_middleware(DisconnectCancelMiddleware, paths=CANCEL_ON_DISCONNECT_PATHS)
+
+# Separate concurrency limits for Google-backed endpoints vs. cheap ones (+ load shedding).
+admission = AdmissionController(
+    upstream_paths=CANCEL_ON_DISCONNECT_PATHS + ("/places/autocomplete", "/places/details", "/places/details/batch"),
+    upstream_prefixes=("/legacy/",),
+    upstream_concurrency=settings.upstream_concurrency,
+    upstream_queue_depth=settings.upstream_queue_depth,
+    cheap_concurrency=settings.cheap_concurrency,
+    queue_timeout_s=settings.admission_queue_timeout_s,
+    shed_latency_s=settings.shed_latency_s,
+    degraded_concurrency=settings.degraded_concurrency,
+)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# DEESHA_UPSTREAM_MODE=record also logs inbound requests for scripts/replay_traffic.py
+app.add_middleware(InboundRecorderMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://127.0.0.1:5500",
-        "http://localhost:5500",
-        "http://127.0.0.1:5173",
-        "http://localhost:5173",
-        "http://127.0.0.1:3000",
-        "http://localhost:3000",
-    ],
+    allow_origins=list(settings.cors_origins),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After"],
 )
 
 
+@app.exception_handler(upstream.UpstreamCancelled)
+def _upstream_cancelled(_request: Request, exc: upstream.UpstreamCancelled):
+    # Nobody is listening any more; 499 = "client closed request" (nginx convention)
+    return JSONResponse(status_code=499, content={"detail": f"Request cancelled: {exc}"})
+
+
+# Frontend built by scripts/build_frontend.py: same origin as the API, so no CORS preflights.
+FRONTEND = FrontendBundle(settings.frontend_dir)
+app.mount("/static", FRONTEND, name="static")
+
+
+@app.get("/", include_in_schema=False)
+def index(accept_encoding: str = Header(""), if_none_match: Optional[str] = Header(None)):
+    return FRONTEND.index_response(accept_encoding, if_none_match)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+# Readiness: 503 until the cache warm-up (if configured) reaches its coverage target.
+WARMUP = WarmupState(target=settings.warmup_target, max_wait_s=settings.warmup_max_wait_s)
+
+
+@app.get("/ready")
+def ready():
+    state = WARMUP.to_dict()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+
+@app.get("/metrics")
+def metrics_endpoint(format: str = "prometheus"):
+    """Process metrics: Prometheus text by default, `?format=json` for JSON."""
+    if format == "json":
+        return metrics.snapshot()
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+# async: answers even when every worker thread is busy
+@app.get("/debug/runtime")
+async def debug_runtime():
+    """Threadpool occupancy, queue wait and event-loop lag over the last minute."""
+    return RUNTIME.to_dict()
+
+
+async def _require_debug_token(authorization: Optional[str] = Header(None)) -> None:
+    """Profiling endpoints need `Authorization: Bearer $DEESHA_DEBUG_TOKEN`; without a token they do not exist."""
+    if not settings.debug_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {settings.debug_token}".encode("utf-8")
+    if not authorization or not hmac.compare_digest(authorization.encode("utf-8"), expected):
+        raise HTTPException(status_code=401, detail="Invalid debug token", headers={"WWW-Authenticate": "Bearer"})
+
+
+@app.get("/debug/profile", dependencies=[Depends(_require_debug_token)])
+async def debug_profile(seconds: float = 10.0, interval_ms: float = 10.0, format: str = "collapsed", include_idle: bool = False):
+    """Sample every thread's stack for `seconds` (max 60) in this worker process.
+
+    Returns collapsed stacks (`thread;frame;frame count`, for flamegraph.pl / speedscope),
+    or `?format=json` for the busiest frames plus the same stacks.
+    """
+    try:
+        result = await asyncio.to_thread(profiler.sample_stacks, seconds, interval_ms / 1000.0, include_idle)
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running in this process")
+    stacks = result.pop("stacks")
+    if format == "json":
+        return {**result, "top": profiler.top_functions(stacks), "stacks": dict(stacks.most_common())}
+    headers = {"X-Profile-Pid": str(result["pid"]), "X-Profile-Samples": str(result["samples"])}
+    return PlainTextResponse(profiler.collapsed_text(stacks), headers=headers)
+
+
+@app.get("/debug/allocations", dependencies=[Depends(_require_debug_token)])
+async def debug_allocations(seconds: float = 10.0, top: int = 10):
+    """Trace allocations for `seconds` (max 60); live bytes per endpoint and their top sites."""
+    ranges = profiler.endpoint_code_ranges(
+        (route.path, route.endpoint) for route in app.routes if isinstance(route, APIRoute)
+    )
+    try:
+        return await asyncio.to_thread(profiler.track_allocations, seconds, ranges, max(1, min(top, 50)))
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running in this process")
+
+
+# -------------------------------------------------
+# Caches for Places / Routes lookups
+# -------------------------------------------------
+_AUTOCOMPLETE_CACHE: TTLCache[List[Dict[str, Any]]] = TTLCache(maxsize=2000, ttl_s=600)
+# A place's name/address/location almost never change: keep details for a week.
+_DETAILS_CACHE: TTLCache[Dict[str, Any]] = TTLCache(maxsize=20000, ttl_s=7 * 24 * 3600)
+# Routes are TRAFFIC_AWARE, so durations go stale quickly; keep them a few minutes only.
+_ROUTE_CACHE: TTLCache[Dict[str, Any]] = TTLCache(maxsize=1000, ttl_s=300)
+# Single legs (stop → stop, with polyline) out of every computed route, for re-routing after a stop edit.
+_LEG_CACHE: TTLCache[Dict[str, Any]] = TTLCache(maxsize=5000, ttl_s=300)
+# Stop title (+ bias) → resolved place; searchNearby circle → candidate places.
+_RESOLVE_CACHE: TTLCache[Dict[str, Any]] = TTLCache(maxsize=5000, ttl_s=24 * 3600)
+_NEARBY_CACHE: TTLCache[List[Place]] = TTLCache(maxsize=2000, ttl_s=6 * 3600)
+
+
 # -------------------------------------------------
 # Helpers for Places API (New)
 # -------------------------------------------------
@@ -66,38 +259,14 @@ def _places_new_headers(field_mask: str | None = None) -> dict:
 
 def _places_new_post(url: str, body: dict, field_mask: str | None = None):
     """Call Places API (New) POST endpoints with consistent errors."""
-    try:
-        r = requests.post(url, json=body, headers=_places_new_headers(field_mask), timeout=12)
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Google request failed: {e}")
-
-    try:
-        data = r.json()
-    except ValueError:
-        raise HTTPException(status_code=502, detail="Google returned non-JSON response")
-
-    if r.status_code >= 400:
-        raise HTTPException(status_code=502, detail=f"Google Places error: {data}")
-
-    return data
+    return upstream.request_json(
+        "POST", url, json=body, headers=_places_new_headers(field_mask), timeout=12, error_label="Google Places"
+    )
 
 
 def _places_new_get(url: str, field_mask: str | None = None):
     """Call Places API (New) GET endpoints with consistent errors."""
-    try:
-        r = requests.get(url, headers=_places_new_headers(field_mask), timeout=12)
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Google request failed: {e}")
-
-    try:
-        data = r.json()
-    except ValueError:
-        raise HTTPException(status_code=502, detail="Google returned non-JSON response")
-
-    if r.status_code >= 400:
-        raise HTTPException(status_code=502, detail=f"Google Places error: {data}")
-
-    return data
+    return upstream.request_json("GET", url, headers=_places_new_headers(field_mask), timeout=12, error_label="Google Places")
 
 
 # -------------------------------------------------
@@ -131,6 +300,16 @@ def places_autocomplete_get(
     if not q:
         raise HTTPException(status_code=400, detail="Missing input")
 
+    return {"predictions": _autocomplete_predictions(q, sessiontoken, components)}
+
+
+def _autocomplete_predictions(q: str, sessiontoken: str | None, components: str | None) -> List[Dict[str, Any]]:
+    """Places (New) autocomplete → [{"description","place_id","types"}], cached per query."""
+    cache_key = (q.lower(), (components or "").strip().lower())
+    cached = _AUTOCOMPLETE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
     url = "https://places.googleapis.com/v1/places:autocomplete"
 
     body: dict = {
@@ -179,7 +358,8 @@ def places_autocomplete_get(
         if place_id and desc:
             preds.append({"description": desc, "place_id": place_id, "types": types})
 
-    return {"predictions": preds}
+    _AUTOCOMPLETE_CACHE.set(cache_key, preds)
+    return preds
 
 
 class AutocompleteBody(BaseModel):
@@ -203,23 +383,84 @@ def places_autocomplete_post(payload: AutocompleteBody = Body(...)):
 # -------------------------------------------------
 # /places/details
 # -------------------------------------------------
+# Browsers and proxies may keep details a day and serve them stale for a week while revalidating.
+DETAILS_CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"
+DETAILS_BATCH_MAX_IDS = 50
+
+
 @app.get("/places/details")
-def place_details(place_id: str, sessiontoken: str | None = None):
+def place_details(place_id: str, sessiontoken: str | None = None, if_none_match: Optional[str] = Header(None)):
     """Fetch details (name/address/lat/lng) for a place_id."""
     if not GOOGLE_API_KEY:
         raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
     if not place_id:
         raise HTTPException(status_code=400, detail="Missing place_id")
 
+    body = json_bytes(_place_details_cached(place_id, sessiontoken))
+    return conditional_json(body, etag_for(body), if_none_match, DETAILS_CACHE_CONTROL)
+
+
+@app.get("/places/details/batch")
+def place_details_batch(place_ids: str, if_none_match: Optional[str] = Header(None)):
+    """Details for many place_ids at once: `?place_ids=id1,id2,...` (up to 50).
+
+    Cached ids are answered from memory; only the rest go upstream, concurrently.
+    Returns {"places": [...in request order...], "errors": {place_id: detail}}.
+    """
+    if not GOOGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
+    ids = list(dict.fromkeys(p.strip() for p in place_ids.split(",") if p.strip()))
+    if not ids:
+        raise HTTPException(status_code=400, detail="Missing place_ids")
+    if len(ids) > DETAILS_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Maximum {DETAILS_BATCH_MAX_IDS} place_ids per request. You sent {len(ids)}.")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for pid in ids:
+        cached = _DETAILS_CACHE.get(pid)
+        if cached is not None:
+            results[pid] = cached
+    missing = [pid for pid in ids if pid not in results]
+    metrics.inc("details_batch_ids_total", len(ids) - len(missing), source="cache")
+    metrics.inc("details_batch_ids_total", len(missing), source="upstream")
+
+    def fetch(pid: str) -> Dict[str, Any] | str:
+        try:
+            return _place_details_cached(pid)
+        except HTTPException as e:
+            return str(e.detail)
+
+    errors: Dict[str, str] = {}
+    for pid, out in zip(missing, upstream.map_concurrent(fetch, missing)):
+        if isinstance(out, dict):
+            results[pid] = out
+        else:
+            errors[pid] = out
+
+    body = json_bytes({"places": [results[pid] for pid in ids if pid in results], "errors": errors})
+    # Don't let browsers hold on to a partial answer.
+    cache_control = DETAILS_CACHE_CONTROL if not errors else "no-store"
+    return conditional_json(body, etag_for(body), if_none_match, cache_control)
+
+
+def _place_details_cached(place_id: str, sessiontoken: str | None = None) -> Dict[str, Any]:
+    """Place details by place_id. Name/address/location rarely change, so results are cached."""
+    cached = _DETAILS_CACHE.get(place_id)
+    if cached is not None:
+        return cached
+
     field_mask = "id,displayName,formattedAddress,location,types"
     url = f"https://places.googleapis.com/v1/places/{place_id}"
+    if sessiontoken:
+        # Ends the autocomplete session the token was used for (billed as one session)
+        url += f"?sessionToken={quote(sessiontoken)}"
 
     data = _places_new_get(url, field_mask=field_mask)
 
     loc = data.get("location") or {}
     display_name = (data.get("displayName") or {}).get("text")
 
-    return {
+    out = {
         "place_id": data.get("id"),
         "name": display_name,
         "formatted_address": data.get("formattedAddress"),
@@ -227,6 +468,218 @@ def place_details(place_id: str, sessiontoken: str | None = None):
         "lng": loc.get("longitude"),
         "types": data.get("types", []),
     }
+    _DETAILS_CACHE.set(place_id, out)
+    return out
+
+
+# -------------------------------------------------
+# /places/suggest → autocomplete with coordinates for the top predictions
+# -------------------------------------------------
+SUGGEST_DEFAULT_TOP = 3
+SUGGEST_MAX_TOP = 5
+
+
+@app.get("/places/suggest")
+def places_suggest(
+    input: str | None = None,
+    text: str | None = None,
+    sessiontoken: str | None = None,
+    components: str | None = None,
+    top: int = SUGGEST_DEFAULT_TOP,
+):
+    """Autocomplete predictions with lat/lng already attached for the first `top` entries.
+
+    Details for those predictions are fetched concurrently (and cached per place_id),
+    so picking one of them needs no follow-up /places/details or /places/resolve call.
+
+    Returns:
+      {"predictions":[{"description","place_id","types","name","formatted_address","lat","lng"}, ...]}
+      (predictions beyond `top`, or whose details failed, have no lat/lng)
+    """
+    if not GOOGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
+
+    q = (input or text or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Missing input")
+
+    return {"predictions": _suggest_predictions(q, sessiontoken, components, top)}
+
+
+def _suggest_predictions(q: str, sessiontoken: str | None, components: str | None, top: int) -> List[Dict[str, Any]]:
+    top = max(0, min(int(top), SUGGEST_MAX_TOP))
+    preds = [dict(p) for p in _autocomplete_predictions(q, sessiontoken, components)]
+
+    def details_or_none(place_id: str) -> Dict[str, Any] | None:
+        try:
+            return _place_details_cached(place_id, sessiontoken)
+        except HTTPException:
+            return None
+
+    heads = preds[:top]
+    for p, d in zip(heads, upstream.map_concurrent(details_or_none, [p["place_id"] for p in heads])):
+        if d and d.get("lat") is not None and d.get("lng") is not None:
+            p["name"] = d.get("name")
+            p["formatted_address"] = d.get("formatted_address")
+            p["lat"] = d.get("lat")
+            p["lng"] = d.get("lng")
+
+    return preds
+
+
+# -------------------------------------------------
+# Cache probes: let cache-servable lookups through while shedding load
+# -------------------------------------------------
+def _first(params: Dict[str, List[str]], *names: str) -> str:
+    for n in names:
+        v = (params.get(n) or [""])[0].strip()
+        if v:
+            return v
+    return ""
+
+
+def _autocomplete_cached(q: str, components: str) -> List[Dict[str, Any]] | None:
+    return _AUTOCOMPLETE_CACHE.get((q.lower(), components.strip().lower())) if q else None
+
+
+def _probe_autocomplete(params: Dict[str, List[str]], body: bytes) -> bool:
+    if body:
+        payload = json.loads(body)
+        q = (payload.get("input") or payload.get("text") or "").strip()
+        return _autocomplete_cached(q, payload.get("components") or "") is not None
+    return _autocomplete_cached(_first(params, "input", "text"), _first(params, "components")) is not None
+
+
+def _probe_suggest(params: Dict[str, List[str]], body: bytes) -> bool:
+    preds = _autocomplete_cached(_first(params, "input", "text"), _first(params, "components"))
+    if preds is None:
+        return False
+    top = max(0, min(int(_first(params, "top") or SUGGEST_DEFAULT_TOP), SUGGEST_MAX_TOP))
+    return all(p["place_id"] in _DETAILS_CACHE for p in preds[:top])
+
+
+admission.register_cache_probe("/places/autocomplete", _probe_autocomplete)
+admission.register_cache_probe("/places/details", lambda params, body: _first(params, "place_id") in _DETAILS_CACHE)
+admission.register_cache_probe(
+    "/places/details/batch",
+    lambda params, body: all(p.strip() in _DETAILS_CACHE for p in _first(params, "place_ids").split(",") if p.strip()),
+)
+admission.register_cache_probe("/places/suggest", _probe_suggest)
+
+
+# -------------------------------------------------
+# /ws/places/suggest → WebSocket typeahead
+# -------------------------------------------------
+TYPEAHEAD_DEBOUNCE_MS = 150
+TYPEAHEAD_MAX_DEBOUNCE_MS = 1000
+
+
+@app.websocket("/ws/places/suggest")
+async def places_suggest_ws(
+    websocket: WebSocket,
+    top: int = SUGGEST_DEFAULT_TOP,
+    debounce_ms: int = TYPEAHEAD_DEBOUNCE_MS,
+    components: str | None = None,
+    sessiontoken: str | None = None,
+):
+    """Typeahead over one WebSocket instead of one HTTP request per keystroke.
+
+    Client sends the current input on every keystroke, either as plain text or as
+      {"input": "Aus", "seq": 3, "sessiontoken": "...", "components": "country:us"}
+
+    Server waits `debounce_ms` after the last message before looking anything up. A newer
+    message cancels the pending lookup: if it has not started, no upstream call is made;
+    if it has, its remaining upstream calls (e.g. details prefetch) are skipped and its
+    result is dropped. Only the latest input's predictions are pushed:
+      {"input": "Aus", "seq": 3, "predictions": [...]}   (same shape as /places/suggest)
+    """
+    await websocket.accept()
+    if not GOOGLE_API_KEY:
+        await websocket.send_json({"error": "Missing GOOGLE_MAPS_API_KEY"})
+        await websocket.close(code=1011)
+        return
+
+    debounce_s = max(0, min(int(debounce_ms), TYPEAHEAD_MAX_DEBOUNCE_MS)) / 1000.0
+    latest_seq = 0
+    pending: asyncio.Task | None = None
+    pending_token: upstream.CancelToken | None = None
+    pending_started = False
+
+    async def lookup(seq: int, q: str, token: upstream.CancelToken, session: str | None, comps: str | None):
+        nonlocal pending_started
+        await asyncio.sleep(debounce_s)
+        pending_started = True
+        metrics.inc("typeahead_lookups_total")
+
+        def work() -> List[Dict[str, Any]]:
+            with upstream.cancellable(token):
+                return _suggest_predictions(q, session, comps, top)
+
+        try:
+            preds = await run_in_threadpool(work)
+        except upstream.UpstreamCancelled:
+            return
+        except HTTPException as e:
+            if seq == latest_seq:
+                await websocket.send_json({"input": q, "seq": seq, "error": e.detail})
+            return
+
+        if seq != latest_seq or token.cancelled:
+            metrics.inc("typeahead_stale_results_dropped_total")
+            return
+        await websocket.send_json({"input": q, "seq": seq, "predictions": preds})
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            metrics.inc("typeahead_messages_total")
+
+            msg: Dict[str, Any]
+            try:
+                parsed = json.loads(raw)
+                msg = parsed if isinstance(parsed, dict) else {"input": str(parsed)}
+            except ValueError:
+                msg = {"input": raw}
+
+            q = str(msg.get("input") or msg.get("text") or "").strip()
+            try:
+                seq = int(msg.get("seq") or latest_seq + 1)
+            except (ValueError, TypeError, OverflowError):
+                await websocket.send_json({"input": q, "seq": msg.get("seq"), "error": "seq must be an integer"})
+                continue
+            latest_seq = seq
+
+            if pending is not None and not pending.done():
+                if pending_started:
+                    # Its unsent calls show up in upstream_calls_cancelled_total{reason="superseded"}
+                    metrics.inc("typeahead_lookups_superseded_total")
+                else:
+                    metrics.inc("typeahead_lookups_debounced_total")
+                pending_token.cancel("superseded")
+                pending.cancel()
+
+            if not q:
+                await websocket.send_json({"input": q, "seq": latest_seq, "predictions": []})
+                pending = None
+                continue
+
+            pending_token = upstream.CancelToken()
+            pending_started = False
+            pending = asyncio.create_task(
+                lookup(
+                    latest_seq,
+                    q,
+                    pending_token,
+                    msg.get("sessiontoken") or sessiontoken,
+                    msg.get("components") or components,
+                )
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if pending is not None and not pending.done():
+            pending_token.cancel("disconnected")
+            pending.cancel()
 
 
 # -------------------------------------------------
@@ -253,7 +706,13 @@ def resolve_place(payload: ResolvePlaceRequest = Body(...)):
     if sessiontoken:
         body["sessionToken"] = sessiontoken
 
-    data = _places_new_post(url, body, field_mask=field_mask)
+    try:
+        data = _places_new_post(url, body, field_mask=field_mask)
+    except CircuitOpen:
+        if not settings.breaker_legacy_fallback:
+            raise
+        place = _legacy_resolve(text, "/places/resolve")
+        return {"status": "OK" if place else "ZERO_RESULTS", "query": text, "place": place, "fallback": "legacy"}
     places = data.get("places", []) or []
     if not places:
         return {"status": "ZERO_RESULTS", "query": text, "place": None}
@@ -277,9 +736,39 @@ def resolve_place(payload: ResolvePlaceRequest = Body(...)):
     }
 
 
+# -------------------------------------------------
+# Legacy Places fallback while the places:searchText circuit breaker is open
+# -------------------------------------------------
+def _legacy_resolve(text: str, endpoint: str) -> Dict[str, Any] | None:
+    """routes/trip.py's old-API lookup, in the "place" shape of /places/resolve (None if not found)."""
+    from .routes.trip import legacy_places_resolve
+
+    try:
+        r = legacy_places_resolve({"text": text})
+    except HTTPException as e:
+        if e.status_code == 404:
+            return None
+        raise
+    metrics.inc("upstream_fallback_total", endpoint=endpoint, via="legacy")
+    return {
+        "place_id": r.get("place_id"),
+        "name": r.get("name"),
+        "formatted_address": None,
+        "lat": r.get("lat"),
+        "lng": r.get("lng"),
+        "types": [],
+        "source": "legacy",
+    }
+
+
 # -------------------------------------------------
 # Internal helper: resolve a stop title to lat/lng (prevents map from guessing wrong place)
 # -------------------------------------------------
+def _stop_query_key(title: str, bias_lat: float | None = None, bias_lng: float | None = None) -> tuple:
+    bias = (round(bias_lat, 4), round(bias_lng, 4)) if bias_lat is not None and bias_lng is not None else None
+    return (" ".join(title.split()).lower(), bias)
+
+
 def _resolve_stop_title(title: str, bias_lat: float | None = None, bias_lng: float | None = None) -> Dict[str, Any] | None:
     """Resolve a stop title to a canonical place with lat/lng using Places searchText.
 
@@ -293,6 +782,11 @@ def _resolve_stop_title(title: str, bias_lat: float | None = None, bias_lng: flo
     if not q:
         return None
 
+    cache_key = _stop_query_key(q, bias_lat, bias_lng)
+    cached = _RESOLVE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
     url = "https://places.googleapis.com/v1/places:searchText"
     field_mask = "places.id,places.displayName,places.formattedAddress,places.location,places.types"
 
@@ -307,7 +801,13 @@ def _resolve_stop_title(title: str, bias_lat: float | None = None, bias_lng: flo
             }
         }
 
-    data = _places_new_post(url, body, field_mask=field_mask)
+    try:
+        data = _places_new_post(url, body, field_mask=field_mask)
+    except CircuitOpen:
+        # Unbiased and less precise, so not cached: the next lookup after recovery is exact.
+        if not settings.breaker_legacy_fallback:
+            raise
+        return _legacy_resolve(q, "resolve_stop")
     places = data.get("places") or []
     if not places:
         return None
@@ -319,7 +819,7 @@ def _resolve_stop_title(title: str, bias_lat: float | None = None, bias_lng: flo
     if loc.get("latitude") is None or loc.get("longitude") is None:
         return None
 
-    return {
+    out = {
         "place_id": top.get("id"),
         "name": name,
         "formatted_address": top.get("formattedAddress"),
@@ -327,6 +827,8 @@ def _resolve_stop_title(title: str, bias_lat: float | None = None, bias_lng: flo
         "lng": loc.get("longitude"),
         "types": top.get("types", []),
     }
+    _RESOLVE_CACHE.set(cache_key, out)
+    return out
 
 
 # -------------------------------------------------
@@ -364,109 +866,24 @@ def _parse_duration_to_seconds(dur: str | None) -> int | None:
 
 
 # -------------------------------------------------
-# Polyline + geo helpers
+# Polyline + geo helpers (see utils/geo.py)
 # -------------------------------------------------
 MILES_20_M = 32187.0
 MILES_30_M = 48280.0
-
-
-def _haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
-    R = 6371000.0
-    p1 = math.radians(lat1)
-    p2 = math.radians(lat2)
-    dlat = math.radians(lat2 - lat1)
-    dlng = math.radians(lng2 - lng1)
-    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlng / 2) ** 2
-    return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-
-def _decode_polyline(encoded: str) -> List[Dict[str, float]]:
-    """Decode Google encoded polyline to a list of {lat,lng}."""
-    if not encoded:
-        return []
-    idx = 0
-    lat = 0
-    lng = 0
-    coords: List[Dict[str, float]] = []
-
-    while idx < len(encoded):
-        shift = 0
-        result = 0
-        while True:
-            b = ord(encoded[idx]) - 63
-            idx += 1
-            result |= (b & 0x1F) << shift
-            shift += 5
-            if b < 0x20:
-                break
-        dlat = ~(result >> 1) if (result & 1) else (result >> 1)
-        lat += dlat
-
-        shift = 0
-        result = 0
-        while True:
-            b = ord(encoded[idx]) - 63
-            idx += 1
-            result |= (b & 0x1F) << shift
-            shift += 5
-            if b < 0x20:
-                break
-        dlng = ~(result >> 1) if (result & 1) else (result >> 1)
-        lng += dlng
-
-        coords.append({"lat": lat / 1e5, "lng": lng / 1e5})
-
-    return coords
-
-
-def _sample_route_points(path: List[Dict[str, float]], step_m: float = 20000.0, max_points: int = 8) -> List[Dict[str, float]]:
-    """Sample points along a polyline every ~step_m meters, capped at max_points."""
-    if not path:
-        return []
-
-    sampled = [path[0]]
-    acc = 0.0
-
-    for i in range(1, len(path)):
-        a = path[i - 1]
-        b = path[i]
-        acc += _haversine_m(a["lat"], a["lng"], b["lat"], b["lng"])
-        if acc >= step_m:
-            sampled.append(b)
-            acc = 0.0
-            if len(sampled) >= max_points:
-                break
-
-    if len(sampled) < max_points and (path[-1] != sampled[-1]):
-        sampled.append(path[-1])
-
-    return sampled[:max_points]
-
-
-def _point_at_distance(path: List[Dict[str, float]], target_m: float) -> Dict[str, float] | None:
-    """Return the lat/lng point along `path` at approximately `target_m` meters from the start."""
-    if not path:
-        return None
-    if target_m <= 0:
-        return path[0]
-
-    traveled = 0.0
-    for i in range(1, len(path)):
-        a = path[i - 1]
-        b = path[i]
-        seg = _haversine_m(a["lat"], a["lng"], b["lat"], b["lng"])
-
-        if traveled + seg >= target_m:
-            remain = target_m - traveled
-            t = 0.0 if seg == 0 else max(0.0, min(1.0, remain / seg))
-            return {
-                "lat": a["lat"] + (b["lat"] - a["lat"]) * t,
-                "lng": a["lng"] + (b["lng"] - a["lng"]) * t,
-            }
-
-        traveled += seg
-
-    return path[-1]
+NEAR_DEST_RADIUS_M = 24000.0  # ~15 miles
+
+# Default searchNearby budget for the first /places/things-to-do page: what covering every
+# corridor window takes, capped here. Short routes need one circle per window (2 calls).
+# A 4 h drive's en_route window (~2¾ h, ~280 km) needs 3 circles at the 30-mile max radius,
+# so 4 calls cover it. Longer drives spread 4 circles with gaps (later pages fill in), so
+# a first page never costs more than twice a short route's; `max_upstream_calls` (up to
+# 10) buys full coverage.
+THINGS_TO_DO_FIRST_PAGE_CALLS = 4
+THINGS_TO_DO_MAX_CALLS = 10
+# Later pages (via `next_cursor`) search this many smaller circles each.
+THINGS_TO_DO_PAGE_CALLS = 4
+THINGS_TO_DO_MAX_PAGES = 3
+THINGS_TO_DO_MIN_RADIUS_M = 5000.0
 
 
 # -------------------------------------------------
@@ -484,6 +901,24 @@ class RoutesRequest(BaseModel):
     waypoints: List[LatLng] = []
 
 
+class RouteLeg(BaseModel):
+    distance_meters: Optional[int] = None
+    duration_seconds: Optional[int] = None
+    polyline: Optional[str] = None
+
+
+class StopEdit(BaseModel):
+    op: str  # "add" | "remove" | "move"
+    index: int  # position in `stops`; for "add", the position the new stop takes
+    stop: Optional[LatLng] = None  # required for "add" and "move"
+
+
+class IncrementalRouteRequest(BaseModel):
+    stops: List[LatLng]  # previous stops in order: start, waypoints..., destination
+    legs: List[RouteLeg] = []  # previous route's legs (from /routes), one per pair of stops
+    edit: StopEdit
+
+
 class AlternativesRequest(BaseModel):
     start: LatLng
     destination: LatLng
@@ -496,6 +931,9 @@ class ThingsToDoRequest(BaseModel):
     mood: Optional[str] = "scenic"
     limit: Optional[int] = 12
     destination_query: Optional[str] = None  # e.g., "Austin, TX" (reserved for future web search)
+    max_upstream_calls: Optional[int] = None  # searchNearby budget for the first page (default sized to the route, max 10)
+    cursor: Optional[str] = None  # `next_cursor` from the previous page
+    moods: Optional[List[str]] = None  # several moods at once → {"moods": {mood: {...}}} (first page only)
 
 class MidStop(BaseModel):
     title: str
@@ -523,6 +961,13 @@ class PlanTripRequest(BaseModel):
 
     mid_stops: Optional[List[MidStop]] = None
 
+    # Attach the Day 1 driving route (same shape as /routes) so the page needs no second request
+    include_route: bool = False
+    # Split the drive into days of at most max_drive_hours (default by pace), with
+    # overnight-stop candidates at each split; the whole trip is routed once
+    split_days: bool = False
+    max_drive_hours: Optional[float] = None
+
 
 # -------------------------------------------------
 # /routes → Google Routes API (DRIVE)
@@ -533,24 +978,64 @@ def routes(req: RoutesRequest):
     if not GOOGLE_API_KEY:
         raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
 
+    return _compute_route(req.start, req.destination, req.waypoints)
+
+
+def _point_key(p: LatLng) -> tuple:
+    # 5 decimals ≈ 1 m: the same stops picked twice hit the same entry.
+    return (round(p.lat, 5), round(p.lng, 5))
+
+
+def _route_cache_key(start: LatLng, destination: LatLng, waypoints: List[LatLng]) -> tuple:
+    return tuple(_point_key(p) for p in (start, *waypoints, destination))
+
+
+def _assemble_route(legs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Route response built from consecutive legs: stitched polyline, summed distance/duration."""
+    dist_m = sum(lg.get("distance_meters") or 0 for lg in legs)
+    dur_s = sum(lg.get("duration_seconds") or 0 for lg in legs)
+    return {
+        "polyline": join_polylines([lg["polyline"] for lg in legs if lg.get("polyline")]),
+        "distance_meters": dist_m,
+        "duration_seconds": dur_s,
+        "distance_text": _format_distance_meters(dist_m),
+        "duration_text": _format_duration_seconds(dur_s),
+        "legs": list(legs),
+    }
+
+
+def _compute_route(start: LatLng, destination: LatLng, waypoints: List[LatLng]) -> Dict[str, Any]:
+    """Driving route start → waypoints → destination, with per-leg distance/duration (cached briefly)."""
+    key = _route_cache_key(start, destination, waypoints)
+    cached = _ROUTE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    pairs = list(zip(key, key[1:]))
+    cached_legs = [_LEG_CACHE.get(pair) for pair in pairs]
+    if all(cached_legs):
+        route = _assemble_route(cached_legs)
+        _ROUTE_CACHE.set(key, route)
+        return route
+
     url = "https://routes.googleapis.com/directions/v2:computeRoutes"
 
     body: Dict[str, Any] = {
-        "origin": {"location": {"latLng": {"latitude": req.start.lat, "longitude": req.start.lng}}},
-        "destination": {"location": {"latLng": {"latitude": req.destination.lat, "longitude": req.destination.lng}}},
+        "origin": {"location": {"latLng": {"latitude": start.lat, "longitude": start.lng}}},
+        "destination": {"location": {"latLng": {"latitude": destination.lat, "longitude": destination.lng}}},
         "travelMode": "DRIVE",
         "routingPreference": "TRAFFIC_AWARE",
         "computeAlternativeRoutes": False,
     }
 
-    if req.waypoints:
+    if waypoints:
         # Do NOT set `via: true` here. Via points may not create separate legs.
         # We want per-stop legs so the frontend can show segment times/distances.
         body["intermediates"] = [
             {
                 "location": {"latLng": {"latitude": w.lat, "longitude": w.lng}},
             }
-            for w in req.waypoints
+            for w in waypoints
         ]
 
     headers = {
@@ -561,26 +1046,15 @@ def routes(req: RoutesRequest):
             "routes.distanceMeters,"
             "routes.duration,"
             "routes.polyline.encodedPolyline,"
-            "routes.legs,"
             "routes.legs.distanceMeters,"
             "routes.legs.duration,"
+            "routes.legs.polyline.encodedPolyline,"
             "routes.legs.startLocation,"
             "routes.legs.endLocation"
         ),
     }
 
-    try:
-        r = requests.post(url, json=body, headers=headers, timeout=20)
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Google request failed: {e}")
-
-    try:
-        data = r.json()
-    except ValueError:
-        raise HTTPException(status_code=502, detail="Google returned non-JSON response")
-
-    if r.status_code >= 400:
-        raise HTTPException(status_code=502, detail=f"Google Routes error: {data}")
+    data = upstream.request_json("POST", url, json=body, headers=headers, timeout=20, error_label="Google Routes")
 
     routes_list = data.get("routes") or []
     if not routes_list:
@@ -601,10 +1075,16 @@ def routes(req: RoutesRequest):
                 "duration_seconds": lg_dur_s,
                 "distance_text": _format_distance_meters(lg_dist_m),
                 "duration_text": _format_duration_seconds(lg_dur_s),
+                "polyline": (lg.get("polyline") or {}).get("encodedPolyline"),
             }
         )
 
-    return {
+    if len(legs_out) == len(pairs):
+        for pair, leg in zip(pairs, legs_out):
+            if leg["polyline"]:
+                _LEG_CACHE.set(pair, leg)
+
+    route = {
         "polyline": poly,
         "distance_meters": dist_m,
         "duration_seconds": dur_s,
@@ -612,11 +1092,126 @@ def routes(req: RoutesRequest):
         "duration_text": _format_duration_seconds(dur_s),
         "legs": legs_out,
     }
+    _ROUTE_CACHE.set(key, route)
+    return route
+
+
+def _probe_routes(params: Dict[str, List[str]], body: bytes) -> bool:
+    req = RoutesRequest(**json.loads(body))
+    return _route_cache_key(req.start, req.destination, req.waypoints) in _ROUTE_CACHE
+
+
+admission.register_cache_probe("/routes", _probe_routes)
+
+
+# -------------------------------------------------
+# /routes/incremental → re-route only the legs a stop edit touches
+# -------------------------------------------------
+def _apply_stop_edit(stops: List[LatLng], edit: StopEdit) -> List[LatLng]:
+    new = list(stops)
+    op = (edit.op or "").strip().lower()
+    if op == "add":
+        if edit.stop is None or not 0 <= edit.index <= len(stops):
+            raise HTTPException(status_code=400, detail="add needs `stop` and 0 <= index <= len(stops)")
+        new.insert(edit.index, edit.stop)
+    elif op == "remove":
+        if not 0 <= edit.index < len(stops) or len(stops) <= 2:
+            raise HTTPException(status_code=400, detail="remove needs 0 <= index < len(stops) and more than 2 stops")
+        del new[edit.index]
+    elif op == "move":
+        if edit.stop is None or not 0 <= edit.index < len(stops):
+            raise HTTPException(status_code=400, detail="move needs `stop` and 0 <= index < len(stops)")
+        new[edit.index] = edit.stop
+    else:
+        raise HTTPException(status_code=400, detail="edit.op must be add, remove or move")
+    return new
+
+
+@app.post("/routes/incremental")
+def routes_incremental(req: IncrementalRouteRequest):
+    """Apply one stop edit to a previous route, re-routing only the legs that changed.
+
+    Legs between stops that are still adjacent are reused from `legs` (or the leg
+    cache); each run of changed legs is routed with one computeRoutes call. The
+    response has the /routes shape plus the new `stops` and reuse counts.
+    """
+    if not GOOGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
+    if len(req.stops) < 2:
+        raise HTTPException(status_code=400, detail="stops must include start and destination")
+    if req.legs and len(req.legs) != len(req.stops) - 1:
+        raise HTTPException(status_code=400, detail="legs must have one entry per consecutive pair of stops")
+
+    new_stops = _apply_stop_edit(req.stops, req.edit)
+
+    old_keys = [_point_key(p) for p in req.stops]
+    previous: Dict[tuple, Dict[str, Any]] = {}
+    for pair, lg in zip(zip(old_keys, old_keys[1:]), req.legs):
+        if lg.polyline:
+            previous[pair] = {
+                "distance_meters": lg.distance_meters,
+                "duration_seconds": lg.duration_seconds,
+                "distance_text": _format_distance_meters(lg.distance_meters),
+                "duration_text": _format_duration_seconds(lg.duration_seconds),
+                "polyline": lg.polyline,
+            }
+
+    new_keys = [_point_key(p) for p in new_stops]
+    legs: List[Dict[str, Any] | None] = []
+    counts = {"previous": 0, "cache": 0, "upstream": 0}
+    for pair in zip(new_keys, new_keys[1:]):
+        leg = previous.get(pair)
+        source = "previous"
+        if leg is None:
+            leg = _LEG_CACHE.get(pair)
+            source = "cache"
+        if leg is not None:
+            counts[source] += 1
+        legs.append(leg)
+
+    # Consecutive missing legs form one run → one computeRoutes call with the run's inner stops as waypoints.
+    runs: List[tuple] = []
+    for i, leg in enumerate(legs):
+        if leg is not None:
+            continue
+        if runs and runs[-1][1] == i - 1:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+
+    def route_run(run: tuple) -> List[Dict[str, Any]]:
+        pts = new_stops[run[0] : run[1] + 2]
+        return _compute_route(pts[0], pts[-1], pts[1:-1])["legs"]
+
+    for (i0, i1), run_legs in zip(runs, upstream.map_concurrent(route_run, runs)):
+        if len(run_legs) != i1 - i0 + 1:
+            raise HTTPException(status_code=502, detail="Google Routes returned an unexpected number of legs")
+        legs[i0 : i1 + 1] = run_legs
+        counts["upstream"] += len(run_legs)
+
+    for source, n in counts.items():
+        if n:
+            metrics.inc("route_legs_total", n, source=source)
+
+    route = _assemble_route(legs)
+    _ROUTE_CACHE.set(_route_cache_key(new_stops[0], new_stops[-1], new_stops[1:-1]), route)
+    return {
+        **route,
+        "stops": [{"lat": p.lat, "lng": p.lng, "place_id": p.place_id} for p in new_stops],
+        "incremental": {
+            "legs_reused": counts["previous"] + counts["cache"],
+            "legs_recomputed": counts["upstream"],
+            "upstream_calls": len(runs),
+        },
+    }
 
 
 # -------------------------------------------------
 # /places/alternatives → one nice midpoint stop
 # -------------------------------------------------
+ALTERNATIVES_RADIUS_M = 30000.0
+
+
 @app.post("/places/alternatives")
 def places_alternatives(req: AlternativesRequest):
     """Return one suggested stop near the midpoint between start and destination."""
@@ -647,6 +1242,20 @@ def places_alternatives(req: AlternativesRequest):
 
     included = list(dict.fromkeys(included))[:3]
 
+    index = place_index()
+    local = index.query(mid_lat, mid_lng, ALTERNATIVES_RADIUS_M, included, 5)
+    if local:
+        best = local[0]
+        return {
+            "title": best.name or "New stop",
+            "place_id": best.place_id,
+            "formatted_address": best.address,
+            "lat": best.lat,
+            "lng": best.lng,
+            "types": list(best.types),
+            "stay": "1 hr",
+        }
+
     url = "https://places.googleapis.com/v1/places:searchNearby"
     field_mask = "places.id,places.displayName,places.formattedAddress,places.location,places.types"
 
@@ -656,12 +1265,13 @@ def places_alternatives(req: AlternativesRequest):
         "locationRestriction": {
             "circle": {
                 "center": {"latitude": mid_lat, "longitude": mid_lng},
-                "radius": 30000.0,
+                "radius": ALTERNATIVES_RADIUS_M,
             }
         },
     }
 
     data = _places_new_post(url, body, field_mask=field_mask)
+    index.record_search(mid_lat, mid_lng, ALTERNATIVES_RADIUS_M, included, 5, parse_places(data))
     places = data.get("places") or []
     if not places:
         raise HTTPException(status_code=404, detail="No alternatives found")
@@ -684,158 +1294,382 @@ def places_alternatives(req: AlternativesRequest):
 # -------------------------------------------------
 # /places/things-to-do → route-aware "Things to do"
 # -------------------------------------------------
-@app.post("/places/things-to-do")
-def places_things_to_do(req: ThingsToDoRequest):
-    """Route-aware 'Things to do' recommendations.
+THINGS_TO_DO_MOOD_TYPES: Dict[str, List[str]] = {
+    "hiking": ["park", "campground", "tourist_attraction"],
+    "scenic": ["tourist_attraction", "park", "point_of_interest"],
+    "food": ["restaurant", "cafe", "bakery"],
+    "photo": ["tourist_attraction", "park", "museum"],
+    "culture": ["museum", "art_gallery", "tourist_attraction"],
+    "adventure": ["amusement_park", "tourist_attraction", "park"],
+    "relax": ["spa", "park", "tourist_attraction"],
+}
+
+
+def _mood_types(mood: str) -> List[str]:
+    return list(dict.fromkeys(THINGS_TO_DO_MOOD_TYPES.get(mood, ["tourist_attraction", "park"])))[:3]
+
+
+def _corridor_windows(path: List[Dict[str, float]], dur_s: int | None, radius_scale: float = 1.0) -> List[CorridorWindow]:
+    """The en_route / near_destination stretches of the route to search, in meters along it."""
+    total_len = path_length_m(path)
+
+    # Below 75 min the 45-min and 30-min marks cross, so short trips use fixed fractions.
+    if dur_s and dur_s > 4500 and total_len > 0:
+        m_per_s = total_len / float(dur_s)
+        dest_low_m = total_len - 1800.0 * m_per_s   # -30 min
+        dest_high_m = total_len - 1200.0 * m_per_s  # -20 min
+        en_low_m = 2700.0 * m_per_s                 # +45 min
+        en_high_m = dest_low_m
+    else:
+        en_low_m = total_len * 0.40
+        en_high_m = total_len * 0.50
+        dest_low_m = total_len * 0.85
+        dest_high_m = total_len * 0.92
 
-    Option A (Places-only for now):
-      - en_route: around ~45–60 minutes from the start (avoids Dallas dominating early)
-      - near_destination: around last ~20–30 minutes before destination (Austin-focused)
+    def r(m: float) -> float:
+        return max(THINGS_TO_DO_MIN_RADIUS_M, m * radius_scale)
 
-    SerpAPI/web-search is intentionally disabled for now.
+    return [
+        # Near destination: smaller radius so Austin-side dominates
+        CorridorWindow("near_destination", dest_low_m, dest_high_m, r(NEAR_DEST_RADIUS_M), max_radius_m=r(MILES_20_M)),
+        # En-route: keep your strict Dallas-avoid rule
+        CorridorWindow("en_route", en_low_m, en_high_m, r(MILES_20_M), max_radius_m=r(MILES_30_M)),
+    ]
+
+
+def _first_page_calls(path: List[Dict[str, float]], dur_s: int | None, asked: Optional[int]) -> int:
+    """searchNearby budget for a first page: `asked` if given, else sized to the route."""
+    if asked:
+        return max(1, min(int(asked), THINGS_TO_DO_MAX_CALLS))
+    windows = _corridor_windows(path, dur_s)
+    return max(len(windows), min(corridor_circles_needed(windows), THINGS_TO_DO_FIRST_PAGE_CALLS))
+
+
+def _page_circles(path: List[Dict[str, float]], dur_s: int | None, page: int, first_calls: int) -> List[SearchCircle]:
+    """Circles for one results page.
+
+    Page 1 covers each window with the fewest circles. Each later page halves the radius
+    and spends THINGS_TO_DO_PAGE_CALLS circles: searchNearby returns at most 20 places per
+    circle, so smaller circles surface places that ranked below the big circles' top results.
     """
+    if page <= 1:
+        return plan_corridor_circles(path, _corridor_windows(path, dur_s), max_calls=first_calls)
+    windows = _corridor_windows(path, dur_s, radius_scale=0.5 ** (page - 1))
+    return plan_corridor_circles(path, windows, max_calls=THINGS_TO_DO_PAGE_CALLS)
 
-    if not GOOGLE_API_KEY:
-        raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
 
-    mood = (req.mood or "scenic").strip().lower()
-    limit = int(req.limit or 12)
-    limit = max(1, min(limit, 30))
+def _search_nearby(lat: float, lng: float, radius_m: float, included_types: List[str], max_count: int) -> Tuple[List[Place], bool]:
+    """One searchNearby circle, answered from the local place index when its area is fresh.
 
-    mood_types: Dict[str, List[str]] = {
-        "hiking": ["park", "campground", "tourist_attraction"],
-        "scenic": ["tourist_attraction", "park", "point_of_interest"],
-        "food": ["restaurant", "cafe", "bakery"],
-        "photo": ["tourist_attraction", "park", "museum"],
-        "culture": ["museum", "art_gallery", "tourist_attraction"],
-        "adventure": ["amusement_park", "tourist_attraction", "park"],
-        "relax": ["spa", "park", "tourist_attraction"],
+    Returns (places, answered locally).
+    """
+    index = place_index()
+    local = index.query(lat, lng, radius_m, included_types, max_count)
+    if local is not None:
+        return local, True
+    url = "https://places.googleapis.com/v1/places:searchNearby"
+    field_mask = (
+        "places.id,places.displayName,places.formattedAddress,places.location,"
+        "places.types,places.rating,places.userRatingCount"
+    )
+    body = {
+        "includedTypes": included_types,
+        "maxResultCount": max_count,
+        "locationRestriction": {
+            "circle": {
+                "center": {"latitude": lat, "longitude": lng},
+                "radius": float(radius_m),
+            }
+        },
     }
-    included_types = mood_types.get(mood, ["tourist_attraction", "park"])
-    included_types = list(dict.fromkeys(included_types))[:3]
+    places = parse_places(_places_new_post(url, body, field_mask=field_mask))
+    index.record_search(lat, lng, radius_m, included_types, max_count, places)
+    return places, False
+
+
+def _search_circles(
+    circles: List[SearchCircle],
+    included_types: List[str],
+    max_count: int,
+    found: Dict[str, Dict[str, Place]],
+) -> Tuple[int, int]:
+    """searchNearby for each planned circle (through the circle cache), bucketing places by window
+    into `found`. Returns (upstream calls, circles served from cache or the local place index)."""
+    circle_results: List[List[Place]] = []
+    calls = 0
+    cached = 0
+
+    for c in circles:
+        if c.shared_with is None:
+            key = (round(c.lat, 4), round(c.lng, 4), round(c.radius_m), tuple(included_types), max_count)
+            places = _NEARBY_CACHE.get(key)
+            if places is None:
+                places, local = _search_nearby(c.lat, c.lng, c.radius_m, included_types, max_count)
+                _NEARBY_CACHE.set(key, places)
+                if local:
+                    cached += 1
+                else:
+                    calls += 1
+            else:
+                cached += 1
+        else:
+            # Covered by an earlier circle: reuse its results, restricted to this circle
+            places = [
+                p for p in circle_results[c.shared_with]
+                if p.lat is not None and p.lng is not None
+                and haversine_m(c.lat, c.lng, p.lat, p.lng) <= c.radius_m
+            ]
+        circle_results.append(places)
+        bucket = found.setdefault(c.window, {})
+        for p in places:
+            bucket[p.place_id] = p
 
-    # 1) get route polyline (A → C)
-    route = routes(RoutesRequest(start=req.start, destination=req.destination, waypoints=[]))
-    poly = route.get("polyline")
-    if not poly:
-        raise HTTPException(status_code=502, detail="Routes API did not return a polyline")
+    return calls, cached
 
-    path = _decode_polyline(poly)
-    if len(path) < 2:
-        raise HTTPException(status_code=502, detail="Routes API polyline could not be decoded")
 
-    dur_s = route.get("duration_seconds")
+def _rank_buckets(found: Dict[str, Dict[str, Place]], limit: int, seen: set[str]) -> Dict[str, List[Place]]:
+    """Top `limit` places per bucket, skipping `seen` (which is updated).
 
-    # compute total length
-    total_len = 0.0
-    for i in range(1, len(path)):
-        a = path[i - 1]
-        b = path[i]
-        total_len += _haversine_m(a["lat"], a["lng"], b["lat"], b["lng"])
+    Deduplicate across buckets (prefer near_destination). Dedupe before truncating so
+    en_route still fills up when shared circles put the same places in both buckets.
+    """
+    out: Dict[str, List[Place]] = {}
+    for bucket in ("near_destination", "en_route"):
+        picked: List[Place] = []
+        for p in rank_places(found.get(bucket, {})):
+            if len(picked) >= limit:
+                break
+            if p.place_id not in seen:
+                seen.add(p.place_id)
+                picked.append(p)
+        out[bucket] = picked
+    return out
 
-    # --- Bucket A: en_route (~45–60 min from start)
-    if dur_s and dur_s > 0 and total_len > 0:
-        low_m = total_len * min(1.0, 2700.0 / float(dur_s))   # 45 min
-        high_m = total_len * min(1.0, 3600.0 / float(dur_s))  # 60 min
-    else:
-        low_m = total_len * 0.40
-        high_m = total_len * 0.50
 
-    anchor_low = _point_at_distance(path, low_m) or path[0]
-    anchor_high = _point_at_distance(path, high_m) or path[0]
+# Places API (New) accepts at most this many includedTypes per searchNearby request.
+PLACES_MAX_INCLUDED_TYPES = 50
 
-    # --- Bucket B: near_destination (last ~20–30 min before destination)
-    if dur_s and dur_s > 0 and total_len > 0:
-        dest_low_m = total_len * max(0.0, min(1.0, (float(dur_s) - 1800.0) / float(dur_s)))  # -30 min
-        dest_high_m = total_len * max(0.0, min(1.0, (float(dur_s) - 1200.0) / float(dur_s))) # -20 min
-    else:
-        dest_low_m = total_len * 0.85
-        dest_high_m = total_len * 0.92
 
-    anchor_dest_low = _point_at_distance(path, dest_low_m) or path[-1]
-    anchor_dest_high = _point_at_distance(path, dest_high_m) or path[-1]
+def _things_to_do_multi(req: ThingsToDoRequest, limit: int) -> Dict[str, Any]:
+    """Several moods over one route: each circle is searched with the union of the moods'
+    types (as few requests as the includedTypes limit allows), then candidates are split
+    per mood by their types and ranked locally.
 
-    url = "https://places.googleapis.com/v1/places:searchNearby"
-    field_mask = (
-        "places.id,places.displayName,places.formattedAddress,places.location,"
-        "places.types,places.rating,places.userRatingCount"
-    )
+    The merged answer holds at most 20 places per circle, so a dense mood (restaurants)
+    can crowd out the others. A mood left with fewer than half a page in a window whose
+    merged answer was full gets that window's circles searched again with its own types.
+    """
+    moods = list(dict.fromkeys(m.strip().lower() for m in req.moods or [] if m and m.strip()))
+    if not moods:
+        raise HTTPException(status_code=400, detail="moods must list at least one mood")
+    if req.cursor:
+        raise HTTPException(status_code=400, detail="cursor is not supported together with moods")
+
+    types_by_mood = {m: _mood_types(m) for m in moods}
+    merged = list(dict.fromkeys(t for types in types_by_mood.values() for t in types))
+    groups = [merged[i : i + PLACES_MAX_INCLUDED_TYPES] for i in range(0, len(merged), PLACES_MAX_INCLUDED_TYPES)]
 
-    found_en_route: Dict[str, Dict[str, Any]] = {}
-    found_near_dest: Dict[str, Dict[str, Any]] = {}
-
-    def add_places(found: Dict[str, Dict[str, Any]], lat: float, lng: float, radius_m: float, max_count: int = 12):
-        body = {
-            "includedTypes": included_types,
-            "maxResultCount": max_count,
-            "locationRestriction": {
-                "circle": {
-                    "center": {"latitude": lat, "longitude": lng},
-                    "radius": float(radius_m),
-                }
-            },
+    route = routes(RoutesRequest(start=req.start, destination=req.destination, waypoints=[]))
+    path = decode_polyline(route.get("polyline") or "")
+    if len(path) < 2:
+        raise HTTPException(status_code=502, detail="Routes API did not return a usable polyline")
+    report_stage("route")
+    first_calls = _first_page_calls(path, route.get("duration_seconds"), req.max_upstream_calls)
+
+    # The merged query shares 20 results per circle between all moods, so ask for the maximum.
+    circles = _page_circles(path, route.get("duration_seconds"), 1, first_calls)
+    found: Dict[str, Dict[str, Place]] = {"en_route": {}, "near_destination": {}}
+    calls = cached = 0
+    for group in groups:
+        c_calls, c_cached = _search_circles(circles, group, 20, found)
+        calls += c_calls
+        cached += c_cached
+
+    out: Dict[str, Any] = {}
+    followups: List[str] = []
+    followup_circles = 0
+    for mood, types in types_by_mood.items():
+        wanted = set(types)
+        mood_found = {
+            bucket: {pid: p for pid, p in places.items() if wanted.intersection(p.types)}
+            for bucket, places in found.items()
         }
-        data = _places_new_post(url, body, field_mask=field_mask)
-        for p in (data.get("places") or []):
-            pid = p.get("id")
-            if pid:
-                found[pid] = p
-
-    # En-route: keep your strict Dallas-avoid rule
-    add_places(found_en_route, anchor_low["lat"], anchor_low["lng"], MILES_20_M, max_count=15)
-    add_places(found_en_route, anchor_high["lat"], anchor_high["lng"], MILES_20_M, max_count=15)
-
-    # Near destination: smaller radius so Austin-side dominates
-    near_dest_radius = 24000.0  # ~15 miles
-    add_places(found_near_dest, anchor_dest_low["lat"], anchor_dest_low["lng"], near_dest_radius, max_count=15)
-    add_places(found_near_dest, anchor_dest_high["lat"], anchor_dest_high["lng"], near_dest_radius, max_count=15)
-
-    def score(p: Dict[str, Any]) -> float:
-        rating = float(p.get("rating") or 0.0)
-        votes = float(p.get("userRatingCount") or 0.0)
-        return rating * math.log(votes + 1.0)
-
-    def normalize(p: Dict[str, Any]) -> Dict[str, Any]:
-        loc = p.get("location") or {}
-        name = (p.get("displayName") or {}).get("text")
-        return {
-            "place_id": p.get("id"),
-            "title": name,
-            "formatted_address": p.get("formattedAddress"),
-            "lat": loc.get("latitude"),
-            "lng": loc.get("longitude"),
-            "types": p.get("types") or [],
-            "rating": p.get("rating"),
-            "votes": p.get("userRatingCount"),
+        crowded = [
+            bucket for bucket, places in found.items()
+            if len(places) >= 20 and len(mood_found[bucket]) < max(1, limit // 2)
+        ]
+        if crowded and len(moods) > 1:
+            own = [c for c in circles if c.window in crowded and c.shared_with is None]
+            c_calls, c_cached = _search_circles(own, types, 20, mood_found)
+            calls += c_calls
+            cached += c_cached
+            followup_circles += len(own)
+            followups.append(mood)
+            metrics.inc("things_to_do_mood_followups_total", mood=mood)
+        ranked = _rank_buckets(mood_found, limit, set())
+        out[mood] = {
+            "en_route": [p.to_dict() for p in ranked["en_route"]],
+            "near_destination": [p.to_dict() for p in ranked["near_destination"]],
+            "count": {"en_route": len(ranked["en_route"]), "near_destination": len(ranked["near_destination"])},
         }
 
-    ranked_en_route = sorted(found_en_route.values(), key=score, reverse=True)
-    ranked_near_dest = sorted(found_near_dest.values(), key=score, reverse=True)
+    report_stage("search", upstream_calls=calls, cached_circles=cached, mood_followups=len(followups))
 
-    en_route_out = [normalize(p) for p in ranked_en_route[:limit]]
-    near_dest_out = [normalize(p) for p in ranked_near_dest[:limit]]
+    # Separate per-mood requests would each route once and search every issued circle.
+    issued = sum(1 for c in circles if c.shared_with is None)
+    saved = len(moods) * (1 + issued) - (1 + len(groups) * issued + followup_circles)
+    metrics.inc("things_to_do_multi_mood_total")
+    metrics.inc("things_to_do_calls_saved_total", max(0, saved))
+    return {
+        "moods": out,
+        "search": {
+            "circles": len(circles),
+            "type_groups": len(groups),
+            "mood_followups": followups,
+            "upstream_calls": calls,
+            "cached_circles": cached,
+            "upstream_calls_saved": max(0, saved),
+        },
+        "used_web_search": False,
+    }
 
-    # Deduplicate across buckets (prefer near_destination)
-    seen: set[str] = set()
-    dedup_near: List[Dict[str, Any]] = []
-    for p in near_dest_out:
-        pid = p.get("place_id")
-        if pid and pid not in seen:
-            seen.add(pid)
-            dedup_near.append(p)
 
-    dedup_en: List[Dict[str, Any]] = []
-    for p in en_route_out:
-        pid = p.get("place_id")
-        if pid and pid not in seen:
-            seen.add(pid)
-            dedup_en.append(p)
+@app.post("/places/things-to-do")
+def places_things_to_do(req: ThingsToDoRequest):
+    """Route-aware 'Things to do' recommendations.
+
+    Option A (Places-only for now):
+      - en_route: from ~45 minutes after the start (avoids Dallas dominating early)
+        up to where near_destination begins
+      - near_destination: around last ~20–30 minutes before destination (Austin-focused)
+
+    The first page covers each window with the fewest searchNearby circles (see
+    `plan_corridor_circles`), capped by `max_upstream_calls`. Pass `next_cursor` back as
+    `cursor` for more: the cursor carries the route geometry and the place IDs already
+    returned, so later pages skip the route call, re-read earlier circles from cache and
+    only search new, smaller circles.
+
+    SerpAPI/web-search is intentionally disabled for now.
+    """
+
+    if not GOOGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
+
+    limit = int(req.limit or 12)
+    limit = max(1, min(limit, 30))
+
+    if req.moods:
+        return _things_to_do_multi(req, limit)
+    try:
+        return _things_to_do_page(req, limit)
+    except CircuitOpen:
+        # Routes or searchNearby is failing: the legacy text search needs neither. Later
+        # pages depend on the original route and circles, so they just fail fast.
+        if req.cursor or not settings.breaker_legacy_fallback:
+            raise
+        return _legacy_things_to_do(req, limit)
+
+
+def _things_to_do_page(req: ThingsToDoRequest, limit: int) -> Dict[str, Any]:
+    if req.cursor:
+        try:
+            state = decode_cursor(req.cursor, CURSOR_SECRET)
+            mood = str(state["mood"])
+            poly = str(state["poly"])
+            dur_s = state.get("dur")
+            page = int(state["page"])
+            first_calls = int(state["calls"])
+            max_count = int(state["n"])
+            seen = set(state.get("seen") or [])
+            # Signed, but these decide how many upstream calls the page makes.
+            if not (
+                2 <= page <= THINGS_TO_DO_MAX_PAGES
+                and 1 <= first_calls <= THINGS_TO_DO_MAX_CALLS
+                and 10 <= max_count <= 20
+                and (dur_s is None or isinstance(dur_s, (int, float)))
+            ):
+                raise ValueError("cursor out of range")
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    else:
+        mood = (req.mood or "scenic").strip().lower()
+        # Enough per circle to rank a full page, no more (searchNearby caps at 20).
+        max_count = max(10, min(limit + 5, 20))
+        page = 1
+        seen = set()
+
+        # 1) get route polyline (A → C)
+        route = routes(RoutesRequest(start=req.start, destination=req.destination, waypoints=[]))
+        poly = route.get("polyline")
+        if not poly:
+            raise HTTPException(status_code=502, detail="Routes API did not return a polyline")
+        dur_s = route.get("duration_seconds")
+        report_stage("route")
+
+    path = decode_polyline(poly)
+    if len(path) < 2:
+        raise HTTPException(status_code=502, detail="Routes API polyline could not be decoded")
+    if page == 1:
+        first_calls = _first_page_calls(path, dur_s, req.max_upstream_calls)
+
+    # 2) + 3) searchNearby for this page's circles; earlier pages' circles come back from
+    # cache so their lower-ranked leftovers can fill this page.
+    included_types = _mood_types(mood)
+    found: Dict[str, Dict[str, Place]] = {"en_route": {}, "near_destination": {}}
+    calls = cached = n_circles = 0
+    for p in range(1, page + 1):
+        circles = _page_circles(path, dur_s, p, first_calls)
+        c_calls, c_cached = _search_circles(circles, included_types, max_count, found)
+        calls += c_calls
+        cached += c_cached
+        if p == page:
+            n_circles = len(circles)
+    report_stage("search", upstream_calls=calls, cached_circles=cached)
+
+    ranked = _rank_buckets(found, limit, seen)
+    dedup_near = [p.to_dict() for p in ranked["near_destination"]]
+    dedup_en = [p.to_dict() for p in ranked["en_route"]]
+
+    next_cursor = None
+    if page < THINGS_TO_DO_MAX_PAGES and (dedup_near or dedup_en):
+        next_cursor = encode_cursor(
+            {"mood": mood, "poly": poly, "dur": dur_s, "page": page + 1, "calls": first_calls, "n": max_count, "seen": sorted(seen)},
+            CURSOR_SECRET,
+        )
 
     return {
         "mood": mood,
         "en_route": dedup_en,
         "near_destination": dedup_near,
         "count": {"en_route": len(dedup_en), "near_destination": len(dedup_near)},
+        "search": {"circles": n_circles, "upstream_calls": calls, "cached_circles": cached},
+        "page": page,
+        "next_cursor": next_cursor,
+        "used_web_search": False,
+    }
+
+
+def _legacy_things_to_do(req: ThingsToDoRequest, limit: int) -> Dict[str, Any]:
+    """/places/things-to-do answered by routes/trip.py's text search (no route, no searchNearby)."""
+    from .routes.trip import MILES_30_M, legacy_things_to_do
+
+    mood = (req.mood or "scenic").strip().lower()
+    dest = {"lat": req.destination.lat, "lng": req.destination.lng}
+    data = legacy_things_to_do(
+        {"start": {"lat": req.start.lat, "lng": req.start.lng}, "destination": dest, "mood": mood, "limit": limit}
+    )
+    buckets: Dict[str, List[Dict[str, Any]]] = {"en_route": [], "near_destination": []}
+    for r in data.get("results") or []:
+        near = r.get("lat") is not None and haversine_m(r["lat"], r["lng"], dest["lat"], dest["lng"]) <= MILES_30_M
+        buckets["near_destination" if near else "en_route"].append(r)
+    metrics.inc("upstream_fallback_total", endpoint="/places/things-to-do", via="legacy")
+    return {
+        "mood": mood,
+        **buckets,
+        "count": {k: len(v) for k, v in buckets.items()},
+        "search": {"fallback": "legacy"},
+        "page": 1,
+        "next_cursor": None,
         "used_web_search": False,
     }
 
@@ -843,152 +1677,345 @@ def places_things_to_do(req: ThingsToDoRequest):
 # -------------------------------------------------
 # /plan-trip → simple itinerary object for Stage 4
 # -------------------------------------------------
+def _route_stops(stops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    points = [LatLng(lat=s["lat"], lng=s["lng"], place_id=s.get("place_id")) for s in stops]
+    return _compute_route(points[0], points[-1], points[1:-1])
+
+
+OVERNIGHT_TYPES = ["lodging"]
+OVERNIGHT_RADIUS_M = 15000.0
+OVERNIGHT_CANDIDATES = 5
+
+
+def _overnight_candidates(lat: float, lng: float) -> List[Dict[str, Any]]:
+    """Best-rated lodging around a split point (shares the searchNearby circle cache)."""
+    key = (round(lat, 4), round(lng, 4), round(OVERNIGHT_RADIUS_M), tuple(OVERNIGHT_TYPES), 20)
+    places = _NEARBY_CACHE.get(key)
+    if places is None:
+        places, _ = _search_nearby(lat, lng, OVERNIGHT_RADIUS_M, OVERNIGHT_TYPES, 20)
+        _NEARBY_CACHE.set(key, places)
+    return [p.to_dict() for p in rank_places({p.place_id: p for p in places})[:OVERNIGHT_CANDIDATES]]
+
+
+# Staged itinerary pipeline (services/itinerary_services.py); resolve/route results are
+# memoized per stage, so changing days, pace or interests only re-assembles.
+ITINERARY = ItineraryEngine(resolve=_resolve_stop_title, route=_route_stops, nearby=_overnight_candidates)
+
+
+# Whole /plan-trip responses by canonical request hash: (JSON body, ETag).
+# Shorter with include_route, since route durations are traffic-aware.
+_PLAN_TRIP_MEMO: TTLCache[Tuple[bytes, str]] = TTLCache(maxsize=2000, ttl_s=1800)
+PLAN_TRIP_MEMO_ROUTE_TTL_S = 300
+
+
+def _canonical(v: Any) -> Any:
+    if isinstance(v, str):
+        return " ".join(v.split()).lower()
+    if isinstance(v, float):
+        return round(v, 5)  # ≈ 1 m
+    if isinstance(v, list):
+        return [_canonical(x) for x in v]
+    if isinstance(v, dict):
+        return {k: _canonical(x) for k, x in v.items()}
+    return v
+
+
+def _plan_trip_key(req: PlanTripRequest) -> str:
+    """Content hash of the request with whitespace, case and coordinate precision normalized."""
+    data = _canonical(req.model_dump())
+    if data.get("interests"):
+        data["interests"] = sorted(data["interests"])
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
 @app.post("/plan-trip")
-def plan_trip(req: PlanTripRequest = Body(...)):
-    """Minimal MVP itinerary builder for Stage 4."""
-
-    start_city = (req.start_city or "Start").strip() or "Start"
-    dest_city = (req.destination or "Destination").strip() or "Destination"
-
-    n_days = int(req.days or 1)
-    if n_days < 1:
-        n_days = 1
-    if n_days > 30:
-        n_days = 30
-
-    # Safety cap: too many mid-stops makes itineraries messy and can break downstream routing.
-    # Frontend can allow fewer; backend enforces a hard max.
-    MAX_MID_STOPS = 8
-    if req.mid_stops and len(req.mid_stops) > MAX_MID_STOPS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Maximum {MAX_MID_STOPS} mid-stops allowed. You sent {len(req.mid_stops)}.",
-        )
+def plan_trip(req: PlanTripRequest = Body(...), if_none_match: Optional[str] = Header(None)):
+    """Minimal MVP itinerary builder for Stage 4.
 
-    # Build Start stop (include lat/lng so Stage 4 map can plot it)
-    start_stop: Dict[str, Any] = {"title": start_city}
-    if req.start_lat is not None and req.start_lng is not None:
-        start_stop["lat"] = req.start_lat
-        start_stop["lng"] = req.start_lng
-    else:
-        resolved_start = _resolve_stop_title(start_city)
-        if resolved_start:
-            start_stop["lat"] = resolved_start.get("lat")
-            start_stop["lng"] = resolved_start.get("lng")
-            if resolved_start.get("place_id"):
-                start_stop["place_id"] = resolved_start.get("place_id")
-            if resolved_start.get("formatted_address"):
-                start_stop["formatted_address"] = resolved_start.get("formatted_address")
-
-    stops_day1: List[Dict[str, Any]] = [start_stop]
-
-    # Prefer the new mid_stops array if the frontend sends it
-    if req.mid_stops:
-        for ms in req.mid_stops:
-            title = (ms.title or "").strip()
-            if not title:
-                continue
+    Memoized by canonical request: a repeat (reload, back button, shared link) is served
+    from memory, and `If-None-Match` with the returned ETag gets an empty 304. Titles are
+    compared case-insensitively, so a repeat may echo the first request's capitalization.
+    """
+    memo, outcome = _plan_trip_memoized(req)
+    response = conditional_json(memo[0], memo[1], if_none_match, "private, no-cache")
+    metrics.inc("plan_trip_memo_total", outcome="not_modified" if response.status_code == 304 else outcome)
+    return response
 
-            stop_obj: Dict[str, Any] = {"title": title, "stay": "1 hr"}
 
-            # If frontend provided coordinates, trust them.
-            if ms.lat is not None and ms.lng is not None:
-                stop_obj["lat"] = ms.lat
-                stop_obj["lng"] = ms.lng
-            else:
-                # Otherwise, resolve the title using Places, biased near destination to prevent wrong far-away matches.
-                resolved = _resolve_stop_title(title, bias_lat=req.destination_lat, bias_lng=req.destination_lng)
-                if resolved:
-                    stop_obj["lat"] = resolved.get("lat")
-                    stop_obj["lng"] = resolved.get("lng")
-                    if resolved.get("place_id"):
-                        stop_obj["place_id"] = resolved.get("place_id")
-                    if resolved.get("formatted_address"):
-                        stop_obj["formatted_address"] = resolved.get("formatted_address")
-
-            stops_day1.append(stop_obj)
-
-    # Backwards-compatible: fall back to the old single B-stop fields
-    elif req.stop_b_title and req.stop_b_title.strip():
-        sb_title = req.stop_b_title.strip()
-        sb: Dict[str, Any] = {"title": sb_title, "stay": "1 hr"}
-
-        if req.stop_b_lat is not None and req.stop_b_lng is not None:
-            sb["lat"] = req.stop_b_lat
-            sb["lng"] = req.stop_b_lng
-        else:
-            resolved = _resolve_stop_title(sb_title, bias_lat=req.destination_lat, bias_lng=req.destination_lng)
-            if resolved:
-                sb["lat"] = resolved.get("lat")
-                sb["lng"] = resolved.get("lng")
-                if resolved.get("place_id"):
-                    sb["place_id"] = resolved.get("place_id")
-                if resolved.get("formatted_address"):
-                    sb["formatted_address"] = resolved.get("formatted_address")
-
-        stops_day1.append(sb)
-
-    # Always end Day 1 at the destination (include lat/lng so Stage 4 map can plot it)
-    dest_stop: Dict[str, Any] = {"title": dest_city}
-    if req.destination_lat is not None and req.destination_lng is not None:
-        dest_stop["lat"] = req.destination_lat
-        dest_stop["lng"] = req.destination_lng
-    else:
-        resolved_dest = _resolve_stop_title(dest_city)
-        if resolved_dest:
-            dest_stop["lat"] = resolved_dest.get("lat")
-            dest_stop["lng"] = resolved_dest.get("lng")
-            if resolved_dest.get("place_id"):
-                dest_stop["place_id"] = resolved_dest.get("place_id")
-            if resolved_dest.get("formatted_address"):
-                dest_stop["formatted_address"] = resolved_dest.get("formatted_address")
-
-    stops_day1.append(dest_stop)
-
-    days = []
-    for d in range(n_days):
-        if d == 0:
-            days.append({"day": 1, "stops": stops_day1})
-        else:
-            days.append({"day": d + 1, "stops": [{"title": dest_city}]})
-
-    summary = f"Trip from {start_city} to {dest_city} for {n_days} day{'s' if n_days != 1 else ''}."
-
-    # Prefer mid_stops in the summary if present
-    if req.mid_stops:
-        names = [(ms.title or "").strip() for ms in req.mid_stops if (ms.title or "").strip()]
-        if names:
-            mid_phrase = ", ".join(names)
-            if len(names) == 1:
-                summary = (
-                    f"Trip from {start_city} to {dest_city} with a stop at {mid_phrase} "
-                    f"for {n_days} day{'s' if n_days != 1 else ''}."
-                )
-            else:
-                summary = (
-                    f"Trip from {start_city} to {dest_city} with stops at {mid_phrase} "
-                    f"for {n_days} day{'s' if n_days != 1 else ''}."
-                )
+def _plan_trip_memoized(req: PlanTripRequest) -> Tuple[Tuple[bytes, str], str]:
+    """((JSON body, ETag), "hit" | "miss") for a /plan-trip request."""
+    key = _plan_trip_key(req)
+    memo = _PLAN_TRIP_MEMO.get(key)
+    if memo is not None:
+        return memo, "hit"
+    body = json_bytes(ITINERARY.plan(req))
+    memo = (body, etag_for(body))
+    _PLAN_TRIP_MEMO.set(key, memo, ttl_s=PLAN_TRIP_MEMO_ROUTE_TTL_S if req.include_route or req.split_days else None)
+    return memo, "miss"
 
-    # Fallback: old single B-stop behavior
-    elif req.stop_b_title and req.stop_b_title.strip():
-        summary = (
-            f"Trip from {start_city} to {dest_city} with a stop at {req.stop_b_title.strip()} "
-            f"for {n_days} day{'s' if n_days != 1 else ''}."
-        )
-        
-    return {
-        "summary": summary,
-        "start_city": start_city,
-        "destination": dest_city,
-        "days": days,
-        "start": {"title": start_city, "lat": start_stop.get("lat"), "lng": start_stop.get("lng"), "place_id": start_stop.get("place_id")},
-        "destination_obj": {"title": dest_city, "lat": dest_stop.get("lat"), "lng": dest_stop.get("lng"), "place_id": dest_stop.get("place_id")},
+
+def _probe_plan_trip(params: Dict[str, List[str]], body: bytes) -> bool:
+    return _plan_trip_key(PlanTripRequest(**json.loads(body))) in _PLAN_TRIP_MEMO
+
+
+admission.register_cache_probe("/plan-trip", _probe_plan_trip)
+
+
+# -------------------------------------------------
+# /plan-trip/batch → many itineraries, each stop string resolved once
+# -------------------------------------------------
+PLAN_BATCH_MAX_TRIPS = 500
+# Itineraries built at once; keeps fan-out workers free for interactive requests.
+PLAN_BATCH_CONCURRENCY = 8
+
+
+class PlanTripBatchRequest(BaseModel):
+    trips: List[PlanTripRequest]
+
+
+def _plan_trip_stop_queries(req: PlanTripRequest) -> List[Tuple[str, float | None, float | None]]:
+    """The (title, bias_lat, bias_lng) lookups planning `req` can make."""
+    try:
+        return normalize_trip(req).lookups()
+    except HTTPException:
+        return []
+
+
+def _plan_batch_lines(trips: List[PlanTripRequest]) -> Iterator[str]:
+    t0 = time.perf_counter()
+    unique: Dict[tuple, Tuple[str, float | None, float | None]] = {}
+    lookups = 0
+    for trip in trips:
+        for q in _plan_trip_stop_queries(trip):
+            lookups += 1
+            unique.setdefault(_stop_query_key(*q), q)
+
+    def resolve_one(q: Tuple[str, float | None, float | None]) -> Dict[str, Any] | None:
+        try:
+            return _resolve_stop_title(q[0], bias_lat=q[1], bias_lng=q[2])
+        except HTTPException:
+            return None
+
+    keys = list(unique)
+    resolved = dict(zip(keys, upstream.map_concurrent(resolve_one, [unique[k] for k in keys])))
+
+    def resolve(title: str, bias_lat: float | None = None, bias_lng: float | None = None) -> Dict[str, Any] | None:
+        return resolved.get(_stop_query_key(title, bias_lat, bias_lng))
+
+    def build(trip: PlanTripRequest) -> Dict[str, Any]:
+        try:
+            return {"ok": True, "plan": ITINERARY.plan(trip, resolve)}
+        except HTTPException as e:
+            return {"ok": False, "status": e.status_code, "error": e.detail}
+
+    failed = 0
+    for i, result in upstream.iter_concurrent(build, trips, max_in_flight=PLAN_BATCH_CONCURRENCY):
+        failed += 0 if result["ok"] else 1
+        yield json.dumps({"index": i, **result}) + "\n"
+
+    saved = lookups - len(unique)
+    metrics.inc("plan_batch_trips_total", len(trips))
+    if saved:
+        metrics.inc("plan_batch_lookups_saved_total", saved)
+    summary = {
+        "trips": len(trips),
+        "failed": failed,
+        "stop_lookups": lookups,
+        "unique_lookups": len(unique),
+        "unresolved": sum(1 for v in resolved.values() if v is None),
+        "upstream_calls_saved": saved,
+        "elapsed_s": round(time.perf_counter() - t0, 3),
     }
+    yield json.dumps({"summary": summary}) + "\n"
+
+
+@app.post("/plan-trip/batch")
+def plan_trip_batch(req: PlanTripBatchRequest):
+    """Plan many trips at once, streamed as NDJSON in completion order.
+
+    Every distinct stop string in the batch is resolved once (concurrently) before
+    the itineraries are built. Each line is {"index", "ok", "plan"} or
+    {"index", "ok": false, "status", "error"}; the last line is {"summary": ...}
+    with how many upstream lookups deduplication saved.
+    """
+    if not GOOGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
+    if len(req.trips) > PLAN_BATCH_MAX_TRIPS:
+        raise HTTPException(status_code=400, detail=f"Maximum {PLAN_BATCH_MAX_TRIPS} trips per batch. You sent {len(req.trips)}.")
+    return StreamingResponse(_plan_batch_lines(req.trips), media_type="application/x-ndjson")
 
 
 # -------------------------------------------------
-# Include legacy router (trip.py)
+# /jobs → long-running plans in the background (see services/jobs.py)
 # -------------------------------------------------
-from .routes.trip import router as trip_router
-app.include_router(trip_router)
+JOBS = JobQueue(workers=settings.jobs_workers, max_queued=settings.jobs_max_queued, ttl_s=settings.jobs_ttl_s)
+JOB_EVENTS_POLL_S = 0.2
+JOB_EVENTS_KEEPALIVE_S = 15.0
+
+
+def _job_accepted(job: Job) -> JSONResponse:
+    url = f"/jobs/{quote(job.id)}"
+    return JSONResponse(
+        status_code=202,
+        content={**job.to_dict(), "status_url": url, "events_url": f"{url}/events"},
+        headers={"Location": url},
+    )
+
+
+def _get_job(job_id: str) -> Job:
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+@app.post("/jobs/plan-trip", status_code=202)
+def submit_plan_trip_job(req: PlanTripRequest = Body(...)):
+    """/plan-trip as a background job: answers 202 with a job id right away."""
+    if not GOOGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
+
+    def run() -> Any:
+        memo, outcome = _plan_trip_memoized(req)
+        metrics.inc("plan_trip_memo_total", outcome=outcome)
+        return json.loads(memo[0])
+
+    return _job_accepted(JOBS.submit("plan-trip", run))
+
+
+@app.post("/jobs/things-to-do", status_code=202)
+def submit_things_to_do_job(req: ThingsToDoRequest):
+    """/places/things-to-do as a background job: answers 202 with a job id right away."""
+    if not GOOGLE_API_KEY:
+        raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
+    return _job_accepted(JOBS.submit("things-to-do", lambda: places_things_to_do(req)))
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status, completed stages and (once done) the result or error of a job."""
+    return _get_job(job_id).to_dict()
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a job: a queued job never starts; a running one skips its remaining upstream calls."""
+    job = JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job.to_dict(include_result=False)
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events: `status` and `stage` as they happen, then one `result` with the job."""
+    job = _get_job(job_id)
+
+    async def stream():
+        sent = 0
+        last_write = time.monotonic()
+        while True:
+            finished = job.finished
+            events = job.events[sent:]
+            for e in events:
+                yield f"event: {e['event']}\ndata: {json.dumps(e)}\n\n"
+            sent += len(events)
+            if finished:
+                yield f"event: result\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            if events:
+                last_write = time.monotonic()
+            elif time.monotonic() - last_write >= JOB_EVENTS_KEEPALIVE_S:
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+            await asyncio.sleep(JOB_EVENTS_POLL_S)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# -------------------------------------------------
+# Cache warm-up for popular corridors (see services/warmup.py)
+# -------------------------------------------------
+def _load_warmup_corridors(source: str) -> List[Corridor]:
+    try:
+        if source == "traffic":
+            return corridors_from_traffic(load_inbound(settings.cassette_dir))
+        return load_corridors(source)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not load warm-up corridors from %s: %s", source, e)
+        return []
+
+
+def _warm_endpoint(step: Step, e: Endpoint) -> LatLng | None:
+    if not isinstance(e, str):
+        return LatLng(lat=e[0], lng=e[1])
+    resolved = step("geocode", lambda: _resolve_stop_title(e))
+    if not resolved:
+        return None
+    return LatLng(lat=resolved["lat"], lng=resolved["lng"], place_id=resolved.get("place_id"))
+
+
+def _warm_corridor(corridor: Corridor, step: Step) -> None:
+    """Geocode, route and things-to-do for one corridor, through the same code paths as the API."""
+    start = _warm_endpoint(step, corridor.start)
+    dest = _warm_endpoint(step, corridor.destination)
+    if start is None or dest is None:
+        return
+    step("route", lambda: _compute_route(start, dest, []))
+    for mood in corridor.moods:
+        step("things_to_do", lambda: places_things_to_do(
+            ThingsToDoRequest(start=start, destination=dest, mood=mood, max_upstream_calls=upstream.calls_left())
+        ))
+
+
+# -------------------------------------------------
+# Legacy router (trip.py), imported on first /legacy/* request
+# -------------------------------------------------
+class _LazyASGIApp:
+    """ASGI app that builds the wrapped app on first request (keeps it off the cold-start path)."""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._app = None
+
+    async def __call__(self, scope, receive, send):
+        if self._app is None:
+            self._app = self._loader()
+        await self._app(scope, receive, send)
+
+
+def _load_legacy_app() -> FastAPI:
+    from .routes.trip import router as trip_router
+
+    legacy_app = FastAPI(title="Deesha Backend (legacy)", docs_url=None, redoc_url=None, openapi_url=None)
+    legacy_app.router.route_class = route_class(RUNTIME)
+    # Mounted under /legacy already, so drop the router's own prefix.
+    for route in trip_router.routes:
+        legacy_app.add_api_route(
+            route.path[len(trip_router.prefix):], route.endpoint, methods=list(route.methods), tags=route.tags
+        )
+    # A mounted app does not inherit the parent's handlers (UpstreamCancelled → 499, …).
+    for exc_class, handler in app.exception_handlers.items():
+        legacy_app.add_exception_handler(exc_class, handler)
+    return legacy_app
+
+
+def _openapi_with_legacy() -> Dict[str, Any]:
+    """The app's schema plus the /legacy routes (a mount is not in the schema on its own).
+
+    routes/trip.py is imported on the first /openapi.json or /docs request, not at startup.
+    """
+    if app.openapi_schema is None:
+        from fastapi.openapi.utils import get_openapi
+        from .routes.trip import router as trip_router
+
+        app.openapi_schema = get_openapi(
+            title=app.title, version=app.version, routes=[*app.routes, *trip_router.routes]
+        )
+    return app.openapi_schema
+
+
+if settings.legacy_routes:
+    app.mount("/legacy", _LazyASGIApp(_load_legacy_app))
+    app.openapi = _openapi_with_legacy
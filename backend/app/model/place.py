@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import math
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Place:
+    """Compact, parsed-once view of a Places API (New) place.
+
+    Upstream responses are converted as soon as they are read so ranking and dedupe
+    work on plain attributes instead of nested JSON. `score` is precomputed because
+    every candidate is ranked at least once.
+    """
+
+    __slots__ = ("place_id", "name", "address", "lat", "lng", "types", "rating", "votes", "score")
+
+    def __init__(
+        self,
+        place_id: str,
+        name: Optional[str],
+        address: Optional[str],
+        lat: Optional[float],
+        lng: Optional[float],
+        types: Tuple[str, ...],
+        rating: Optional[float],
+        votes: Optional[int],
+    ):
+        self.place_id = place_id
+        self.name = name
+        self.address = address
+        self.lat = lat
+        self.lng = lng
+        self.types = types
+        self.rating = rating
+        self.votes = votes
+        self.score = float(rating or 0.0) * math.log(float(votes or 0.0) + 1.0)
+
+    @classmethod
+    def from_api(cls, p: Dict[str, Any]) -> Place | None:
+        """Build from a Places API (New) place object; returns None when it has no id."""
+        pid = p.get("id")
+        if not pid:
+            return None
+        loc = p.get("location") or {}
+        return cls(
+            place_id=pid,
+            name=(p.get("displayName") or {}).get("text"),
+            address=p.get("formattedAddress"),
+            lat=loc.get("latitude"),
+            lng=loc.get("longitude"),
+            types=tuple(sys.intern(t) for t in (p.get("types") or [])),
+            rating=p.get("rating"),
+            votes=p.get("userRatingCount"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Response shape used by /places/things-to-do."""
+        return {
+            "place_id": self.place_id,
+            "title": self.name,
+            "formatted_address": self.address,
+            "lat": self.lat,
+            "lng": self.lng,
+            "types": list(self.types),
+            "rating": self.rating,
+            "votes": self.votes,
+        }
+
+    def __repr__(self) -> str:
+        return f"Place({self.place_id!r}, {self.name!r})"
+
+
+def parse_places(data: Dict[str, Any]) -> List[Place]:
+    """Parse the `places` array of a searchNearby/searchText response."""
+    out: List[Place] = []
+    for p in (data.get("places") or []):
+        place = Place.from_api(p or {})
+        if place is not None:
+            out.append(place)
+    return out
+
+
+def rank_places(places: Dict[str, Place]) -> List[Place]:
+    """Highest popularity score (rating × log(votes + 1)) first."""
+    return sorted(places.values(), key=lambda p: p.score, reverse=True)
@@ -1,5 +1,3 @@
-print("✅ LOADED FILE:", __file__)
-
 # NOTE:
 # This module now only holds **legacy** endpoints under the `/legacy` prefix.
 # The real, production endpoints for:
@@ -8,13 +6,16 @@ print("✅ LOADED FILE:", __file__)
 # live in `app/main.py` and use the newer Places API flow.
 # You generally do NOT need to modify this file for the normal app behaviour.
 
-import os
 import math
 from typing import Dict, Any
 
-import requests
 from fastapi import APIRouter, HTTPException
 
+from ..config import get_settings
+from ..model.place import Place, parse_places, rank_places
+from ..services import upstream
+from ..services.place_index import place_index
+
 # 🔒 Legacy-only router (everything here is under /legacy)
 router = APIRouter(prefix="/legacy", tags=["trip-legacy"])
 
@@ -39,7 +40,7 @@ def legacy_places_resolve(payload: Dict[str, Any]):
     - This endpoint is kept only for fallback/testing.
     """
 
-    google_api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+    google_api_key = get_settings().google_maps_api_key
     if not google_api_key:
         raise HTTPException(
             status_code=500,
@@ -51,17 +52,15 @@ def legacy_places_resolve(payload: Dict[str, Any]):
         raise HTTPException(status_code=400, detail="Missing text")
 
     # 1️⃣ Autocomplete (OLD API)
-    try:
-        auto_res = requests.get(
-            "https://maps.googleapis.com/maps/api/place/autocomplete/json",
-            params={
-                "input": text,
-                "key": google_api_key,
-            },
-            timeout=15,
-        ).json()
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Google request failed: {e}")
+    auto_res = upstream.request_json(
+        "GET",
+        "https://maps.googleapis.com/maps/api/place/autocomplete/json",
+        params={
+            "input": text,
+            "key": google_api_key,
+        },
+        timeout=15,
+    )
 
     predictions = auto_res.get("predictions") or []
     if not predictions:
@@ -72,18 +71,16 @@ def legacy_places_resolve(payload: Dict[str, Any]):
         raise HTTPException(status_code=500, detail="No place_id returned by Google")
 
     # 2️⃣ Place Details (OLD API)
-    try:
-        details_res = requests.get(
-            "https://maps.googleapis.com/maps/api/place/details/json",
-            params={
-                "place_id": place_id,
-                "fields": "name,geometry",
-                "key": google_api_key,
-            },
-            timeout=15,
-        ).json()
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Google request failed: {e}")
+    details_res = upstream.request_json(
+        "GET",
+        "https://maps.googleapis.com/maps/api/place/details/json",
+        params={
+            "place_id": place_id,
+            "fields": "name,geometry",
+            "key": google_api_key,
+        },
+        timeout=15,
+    )
 
     result = details_res.get("result") or {}
     location = (result.get("geometry") or {}).get("location") or {}
@@ -153,7 +150,7 @@ def legacy_things_to_do(payload: Dict[str, Any]):
     - This endpoint is kept for debugging/fallback.
     """
 
-    api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+    api_key = get_settings().google_maps_api_key
     if not api_key:
         raise HTTPException(status_code=500, detail="Missing GOOGLE_MAPS_API_KEY")
 
@@ -178,40 +175,38 @@ def legacy_things_to_do(payload: Dict[str, Any]):
 
     queries = MOOD_QUERIES.get(mood, ["tourist attractions"])
 
-    results: Dict[str, Dict[str, Any]] = {}
+    results: Dict[str, Place] = {}
 
     def text_search(lat: float, lng: float, radius_m: float):
         for q in queries:
-            try:
-                res = requests.post(
-                    "https://places.googleapis.com/v1/places:searchText",
-                    headers={
-                        "Content-Type": "application/json",
-                        "X-Goog-Api-Key": api_key,
-                        "X-Goog-FieldMask": (
-                            "places.id,places.displayName,places.location,"
-                            "places.rating,places.userRatingCount,places.types"
-                        ),
+            res = upstream.request_json(
+                "POST",
+                "https://places.googleapis.com/v1/places:searchText",
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Goog-Api-Key": api_key,
+                    "X-Goog-FieldMask": (
+                        "places.id,places.displayName,places.location,"
+                        "places.rating,places.userRatingCount,places.types"
+                    ),
+                },
+                json={
+                    "textQuery": f"{q} near this location",
+                    "locationBias": {
+                        "circle": {
+                            "center": {"latitude": lat, "longitude": lng},
+                            "radius": float(radius_m),
+                        }
                     },
-                    json={
-                        "textQuery": f"{q} near this location",
-                        "locationBias": {
-                            "circle": {
-                                "center": {"latitude": lat, "longitude": lng},
-                                "radius": float(radius_m),
-                            }
-                        },
-                        "maxResultCount": 20,
-                    },
-                    timeout=20,
-                ).json()
-            except requests.RequestException as e:
-                raise HTTPException(status_code=502, detail=f"Google request failed: {e}")
+                    "maxResultCount": 20,
+                },
+                timeout=20,
+            )
 
-            for p in res.get("places", []):
-                pid = p.get("id")
-                if pid:
-                    results[pid] = p
+            found = parse_places(res)
+            place_index().ingest(found)
+            for p in found:
+                results[p.place_id] = p
 
     # 1) Along route (midpoint)
     mid = midpoint(start, destination)
@@ -221,25 +216,19 @@ def legacy_things_to_do(payload: Dict[str, Any]):
     text_search(destination["lat"], destination["lng"], MILES_30_M)
 
     # Rank by popularity
-    def popularity_score(p: Dict[str, Any]) -> float:
-        rating = float(p.get("rating") or 0.0)
-        votes = float(p.get("userRatingCount") or 0.0)
-        return rating * math.log(votes + 1.0)
-
-    ranked = sorted(results.values(), key=popularity_score, reverse=True)
+    ranked = rank_places(results)
 
     out = []
     for p in ranked[:limit]:
-        loc = p.get("location") or {}
         out.append(
             {
-                "place_id": p.get("id"),
-                "title": (p.get("displayName") or {}).get("text"),
-                "lat": loc.get("latitude"),
-                "lng": loc.get("longitude"),
-                "rating": p.get("rating"),
-                "votes": p.get("userRatingCount"),
-                "types": p.get("types", []),
+                "place_id": p.place_id,
+                "title": p.name,
+                "lat": p.lat,
+                "lng": p.lng,
+                "rating": p.rating,
+                "votes": p.votes,
+                "types": list(p.types),
             }
         )
 
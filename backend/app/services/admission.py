@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from . import upstream
+from ..utils import metrics
+
+# -------------------------------------------------
+# Admission control + load shedding
+# -------------------------------------------------
+# Every handler is a sync `def` on the shared threadpool. When Google slows down,
+# upstream-heavy requests hold threads for up to their 12–20 s timeouts and
+# everything else (even /health) queues behind them. This middleware gives the
+# two kinds of traffic separate concurrency limits:
+#
+#   upstream  — endpoints that call Google; limited, with a bounded wait queue
+#   cheap     — everything else (/health, /metrics, cache hits)
+#
+# Keep `upstream_concurrency` below the threadpool size (DEESHA_THREADPOOL_SIZE, 40 by
+# default) so cheap requests always find a free thread.
+#
+# An upstream request is shed with 503 + Retry-After when the wait queue is full,
+# when it waited longer than `queue_timeout_s`, or when recent upstream latency is
+# above `shed_latency_s` and `degraded_concurrency` requests are already running
+# (the trickle lets the latency estimate recover). Whenever an upstream request would
+# have to wait or be shed, a registered cache probe gets a look first: requests it
+# says can be answered from cache skip the upstream pool entirely.
+
+# probe(query_params, body) -> True if the request can be served from cache
+CacheProbe = Callable[[Dict[str, List[str]], bytes], bool]
+
+
+class _Pool:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self.waiting = 0
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    @property
+    def sem(self) -> asyncio.Semaphore:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        return self._sem
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        upstream_paths: Iterable[str],
+        upstream_prefixes: Iterable[str] = (),
+        upstream_concurrency: int = 24,
+        upstream_queue_depth: int = 32,
+        cheap_concurrency: int = 64,
+        queue_timeout_s: float = 2.0,
+        shed_latency_s: float = 4.0,
+        degraded_concurrency: int = 2,
+    ):
+        self.upstream_paths = frozenset(upstream_paths)
+        self.upstream_prefixes = tuple(upstream_prefixes)
+        self.pools = {
+            "upstream": _Pool("upstream", upstream_concurrency),
+            "cheap": _Pool("cheap", cheap_concurrency),
+        }
+        self.upstream_queue_depth = max(0, upstream_queue_depth)
+        self.queue_timeout_s = queue_timeout_s
+        self.shed_latency_s = shed_latency_s
+        self.degraded_concurrency = max(1, degraded_concurrency)
+        self._probes: Dict[str, CacheProbe] = {}
+        metrics.register_collector(self._collect)
+
+    def register_cache_probe(self, path: str, probe: CacheProbe) -> None:
+        self._probes[path] = probe
+
+    def classify(self, path: str) -> str:
+        if path in self.upstream_paths or path.startswith(self.upstream_prefixes):
+            return "upstream"
+        return "cheap"
+
+    def degraded(self) -> bool:
+        latency = upstream.recent_latency()
+        return latency is not None and latency > self.shed_latency_s
+
+    def retry_after_s(self) -> int:
+        latency = upstream.recent_latency() or 1.0
+        return max(1, min(30, math.ceil(latency)))
+
+    def cache_servable(self, path: str, query: bytes, body: bytes) -> bool:
+        probe = self._probes.get(path)
+        if probe is None:
+            return False
+        try:
+            return bool(probe(parse_qs(query.decode("latin-1")), body))
+        except Exception:
+            return False
+
+    def _collect(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        for pool in self.pools.values():
+            yield "admission_active", {"class": pool.name}, pool.active
+            yield "admission_waiting", {"class": pool.name}, pool.waiting
+            yield "admission_limit", {"class": pool.name}, pool.limit
+        yield "admission_degraded", {}, 1.0 if self.degraded() else 0.0
+        latency = upstream.recent_latency()
+        if latency is not None:
+            yield "upstream_latency_ewma_seconds", {}, latency
+
+
+async def _read_body(receive) -> Tuple[Optional[List[dict]], bytes]:
+    """Drain the request body. Returns (messages, body) or (None, b"") on disconnect."""
+    messages: List[dict] = []
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None, b""
+        messages.append(message)
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return messages, b"".join(chunks)
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        ctl = self.controller
+        path = scope["path"]
+        cls = ctl.classify(path)
+
+        if cls == "upstream":
+            pool = ctl.pools["upstream"]
+            # `waiting` is bumped before awaiting the semaphore, so active + waiting is exact here.
+            in_flight = pool.active + pool.waiting
+            queue_full = in_flight >= pool.limit + ctl.upstream_queue_depth
+            degraded = ctl.degraded() and in_flight >= ctl.degraded_concurrency
+            if in_flight >= pool.limit or degraded:
+                # It would wait for the upstream pool (and may time out there): serve it
+                # from cache if it can be.
+                messages, body = await _read_body(receive)
+                if messages is None:
+                    return
+                receive = _replay(messages, receive)
+                if ctl.cache_servable(path, scope.get("query_string", b""), body):
+                    metrics.inc("admission_requests_total", **{"class": "upstream", "outcome": "cache_bypass"})
+                    cls = "cheap"
+                elif queue_full or degraded:
+                    reason = "queue_full" if queue_full else "degraded"
+                    await self._shed(send, reason)
+                    return
+
+        pool = ctl.pools[cls]
+        t0 = time.perf_counter()
+        pool.waiting += 1
+        try:
+            await asyncio.wait_for(pool.sem.acquire(), timeout=ctl.queue_timeout_s if cls == "upstream" else None)
+        except asyncio.TimeoutError:
+            await self._shed(send, "queue_timeout")
+            return
+        finally:
+            pool.waiting -= 1
+        metrics.observe("admission_wait_seconds", time.perf_counter() - t0, **{"class": cls})
+        metrics.inc("admission_requests_total", **{"class": cls, "outcome": "admitted"})
+
+        pool.active += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.active -= 1
+            pool.sem.release()
+
+    async def _shed(self, send, reason: str) -> None:
+        metrics.inc("admission_requests_total", **{"class": "upstream", "outcome": "shed", "reason": reason})
+        retry_after = self.controller.retry_after_s()
+        body = b'{"detail":"Server is busy, please retry shortly"}'
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def _replay(messages: List[dict], receive):
+    pending = list(messages)
+
+    async def replay_receive():
+        if pending:
+            return pending.pop(0)
+        return await receive()
+
+    return replay_receive
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Iterable
+
+from . import upstream
+from ..utils import metrics
+
+# -------------------------------------------------
+# Cancel upstream work when the client goes away
+# -------------------------------------------------
+# Handlers are sync `def`s running on the threadpool and never see the connection.
+# This middleware binds a CancelToken to each request (contextvars follow the handler
+# into the threadpool and into upstream.map_concurrent workers), reads the request
+# body up front, then listens for `http.disconnect` while the handler runs. On
+# disconnect the token is cancelled, so every upstream call that has not been sent
+# yet raises UpstreamCancelled instead of spending quota.
+
+
+class DisconnectCancelMiddleware:
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        # Buffer the body so the watcher can own `receive` while the handler runs.
+        body_messages = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                metrics.inc("requests_cancelled_total", path=scope["path"], stage="before_handler")
+                return
+            body_messages.append(message)
+            if not message.get("more_body", False):
+                break
+
+        token = upstream.CancelToken()
+        response_done = asyncio.Event()
+
+        async def replay_receive():
+            if body_messages:
+                return body_messages.pop(0)
+            # Handler asked for more (e.g. Request.is_disconnected); wait for the real outcome.
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not response_done.is_set():
+                        token.cancel("client_disconnected")
+                        metrics.inc("requests_cancelled_total", path=scope["path"], stage="in_handler")
+                    return
+
+        async def tracking_send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_done.set()
+            await send(message)
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            with upstream.cancellable(token):
+                await self.app(scope, replay_receive, tracking_send)
+        finally:
+            response_done.set()
+            watcher.cancel()
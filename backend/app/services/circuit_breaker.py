@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+
+from ..config import get_settings
+from ..utils import metrics
+
+# -------------------------------------------------
+# Circuit breakers per upstream method
+# -------------------------------------------------
+# When Places API (New) degrades, every request waits out its 12 s timeout before a
+# 502. One breaker per upstream method (e.g. "places:searchNearby") counts consecutive
+# failures: network errors, non-JSON bodies, HTTP 429/5xx, and calls slower than
+# `slow_call_s` (the answer is still used, but the call counts against the method).
+#
+#   closed     calls go through
+#   open       after `failure_threshold` consecutive failures; calls fail at once with
+#              CircuitOpen (503 + Retry-After) for `open_s`
+#   half_open  after `open_s` one probe call goes through; success closes the breaker,
+#              failure opens it again
+#
+# Cached answers never reach the breaker, so cache hits keep working while it is open,
+# and handlers can catch CircuitOpen to fall back (main.py uses the legacy endpoints
+# in routes/trip.py). Replayed calls (DEESHA_UPSTREAM_MODE=replay) bypass the breakers.
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(HTTPException):
+    """Raised instead of calling an upstream method whose breaker is open."""
+
+    def __init__(self, method: str, retry_after_s: float):
+        super().__init__(
+            status_code=503,
+            detail=f"Upstream {method} is temporarily unavailable",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after_s)))},
+        )
+        self.method = method
+
+
+class CircuitBreaker:
+    def __init__(self, method: str, failure_threshold: int = 5, slow_call_s: float = 8.0, open_s: float = 30.0):
+        self.method = method
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_call_s = slow_call_s
+        self.open_s = open_s
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpen, or let the call through (as the probe when half-open)."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.open_s:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            retry_after = self.opened_at + self.open_s - now if self.state == OPEN else 1.0
+        metrics.inc("circuit_breaker_rejected_total", method=self.method)
+        raise CircuitOpen(self.method, retry_after)
+
+    def record(self, ok: bool, elapsed_s: float = 0.0) -> None:
+        """Report the outcome of a call let through by before_call()."""
+        if ok and elapsed_s > self.slow_call_s:
+            ok = False
+            metrics.inc("circuit_breaker_slow_calls_total", method=self.method)
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._transition(CLOSED if ok else OPEN)
+            elif ok:
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.state == CLOSED and self.failures >= self.failure_threshold:
+                    self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        # Caller holds the lock.
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        elif state == CLOSED:
+            self.failures = 0
+        metrics.inc("circuit_breaker_transitions_total", method=self.method, to=state)
+
+    def to_dict(self) -> Dict[str, object]:
+        with self._lock:
+            out: Dict[str, object] = {"state": self.state, "consecutive_failures": self.failures}
+            if self.state == OPEN:
+                out["retry_after_s"] = round(max(0.0, self.opened_at + self.open_s - time.monotonic()), 1)
+            return out
+
+
+_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker(method: str) -> CircuitBreaker:
+    """The breaker for an upstream method name (see upstream.upstream_method), created on first use."""
+    b = _breakers.get(method)
+    if b is None:
+        settings = get_settings()
+        with _lock:
+            b = _breakers.setdefault(
+                method,
+                CircuitBreaker(
+                    method,
+                    failure_threshold=settings.breaker_failures,
+                    slow_call_s=settings.breaker_slow_call_s,
+                    open_s=settings.breaker_open_s,
+                ),
+            )
+    return b
+
+
+def is_open(method: str) -> bool:
+    b = _breakers.get(method)
+    return b is not None and b.state != CLOSED
+
+
+def snapshot() -> Dict[str, Dict[str, object]]:
+    with _lock:
+        items = sorted(_breakers.items())
+    return {name: b.to_dict() for name, b in items}
+
+
+def _collect() -> Iterable[Tuple[str, Dict[str, str], float]]:
+    with _lock:
+        items = list(_breakers.items())
+    for name, b in items:
+        yield "circuit_breaker_state", {"method": name}, _STATE_VALUE[b.state]
+        yield "circuit_breaker_consecutive_failures", {"method": name}, b.failures
+
+
+metrics.register_collector(_collect)
+
+
+def reset(method: Optional[str] = None) -> None:
+    """Forget breaker state (all methods, or one)."""
+    with _lock:
+        if method is None:
+            _breakers.clear()
+        else:
+            _breakers.pop(method, None)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import logging
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+from starlette.responses import Response
+
+from ..utils import metrics
+from ..utils.http_cache import etag_for, etag_matches
+
+logger = logging.getLogger("deesha")
+
+# -------------------------------------------------
+# Built frontend (scripts/build_frontend.py), served same-origin
+# -------------------------------------------------
+# The build writes <dir>/index.html and <dir>/static/<name>.<hash>.<ext>, each with
+# optional .gz / .br siblings. Everything is read into memory once (the bundle is a few
+# hundred KB), so a request is a dict lookup: no filesystem paths are built from the URL.
+#
+# /static/* names change whenever their content does, so they are cached for a year
+# as immutable; index.html is revalidated on every load (ETag → 304).
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+INDEX_CACHE_CONTROL = "no-cache"
+# Preferred first
+ENCODINGS: Tuple[Tuple[str, str], ...] = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _accepted(accept_encoding: str) -> set:
+    out = set()
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if token:
+            out.add(token.strip().lower())
+    return out
+
+
+class _File:
+    __slots__ = ("media_type", "etag", "variants")
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            data = f.read()
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.media_type.startswith("text/") or self.media_type in ("application/javascript", "text/javascript"):
+            self.media_type += "; charset=utf-8"
+        self.etag = etag_for(data)
+        self.variants: Dict[str, bytes] = {"identity": data}
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                with open(path + suffix, "rb") as f:
+                    self.variants[encoding] = f.read()
+
+    def pick(self, accept_encoding: str) -> Tuple[str, bytes]:
+        accepted = _accepted(accept_encoding)
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+    def response(self, accept_encoding: str, if_none_match: Optional[str], cache_control: str) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control}
+        if len(self.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers=headers)
+        encoding, body = self.pick(accept_encoding)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        metrics.inc("frontend_responses_total", encoding=encoding)
+        return Response(content=body, media_type=self.media_type, headers=headers)
+
+
+class FrontendBundle:
+    """The build output of scripts/build_frontend.py; empty when the build has not been run."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index: Optional[_File] = None
+        self.assets: Dict[str, _File] = {}
+        index_path = os.path.join(directory, "index.html")
+        if not os.path.isfile(index_path):
+            return
+        self.index = _File(index_path)
+        static_dir = os.path.join(directory, "static")
+        if os.path.isdir(static_dir):
+            for name in os.listdir(static_dir):
+                path = os.path.join(static_dir, name)
+                if os.path.isfile(path) and not name.endswith((".gz", ".br")):
+                    self.assets[name] = _File(path)
+        logger.info("Serving frontend from %s (%d static assets)", directory, len(self.assets))
+
+    @property
+    def built(self) -> bool:
+        return self.index is not None
+
+    def index_response(self, accept_encoding: str, if_none_match: Optional[str]) -> Response:
+        if self.index is None:
+            return Response(
+                status_code=404,
+                content="Frontend not built: run `python scripts/build_frontend.py` in backend/\n",
+                media_type="text/plain",
+            )
+        return self.index.response(accept_encoding, if_none_match, INDEX_CACHE_CONTROL)
+
+    async def __call__(self, scope, receive, send) -> None:
+        """ASGI app for the /static mount."""
+        if scope["type"] != "http":
+            return
+        headers: Dict[str, str] = {}
+        for k, v in scope.get("headers") or []:
+            headers[k.decode("latin-1").lower()] = v.decode("latin-1")
+        # Mounted apps see the full path; the mount point is in root_path.
+        path, root = scope["path"], scope.get("root_path", "")
+        asset = self.assets.get(path[len(root):].lstrip("/") if path.startswith(root) else path.lstrip("/"))
+        if scope["method"] not in ("GET", "HEAD"):
+            response = Response(status_code=405, headers={"Allow": "GET, HEAD"})
+        elif asset is None:
+            response = Response(status_code=404, content="Not Found", media_type="text/plain")
+        else:
+            response = asset.response(headers.get("accept-encoding", ""), headers.get("if-none-match"), IMMUTABLE)
+        await response(scope, receive, send)
@@ -1,27 +1,413 @@
 from __future__ import annotations
 
-from typing import List
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from app.models.schemas import TripRequest, TripResponse, DayPlan, Stop
-from app.utils.logic import normalize_text, pick_mid_stop
+from fastapi import HTTPException
+
+from . import upstream
+from .jobs import report_stage
+from ..model.schemas import DayPlan, Stop, TripRequest, TripResponse
+from ..utils import metrics
+from ..utils.cache import TTLCache
+from ..utils.geo import RouteIndex, encode_polyline
+from ..utils.logic import normalize_text, pick_mid_stop
+
+# -------------------------------------------------
+# Itinerary engine: normalize → resolve → route → assemble
+# -------------------------------------------------
+# POST /plan-trip and /plan-trip/batch go through these stages.
+# Resolve and route are memoized on their own inputs (the stop lookups, the stop
+# coordinates), so a request that only changes `days`, `pace` or `interests` reuses
+# both and just re-assembles. The per-lookup caches underneath (_RESOLVE_CACHE,
+# _ROUTE_CACHE in main.py) still serve partial overlaps between different trips.
+#
+# Titles are never part of a stage result: a memo hit for "austin, tx" still echoes
+# the caller's "Austin, TX".
+#
+# With `split_days`, a split stage runs between route and assemble: the whole trip is
+# routed once, indexed by cumulative seconds/meters along the polyline (utils/geo.py
+# RouteIndex), and cut into equal driving days of at most `max_drive_s` each. A cut
+# within SNAP_TO_STOP_S of a mid-stop moves onto that stop. Overnight candidates for
+# every cut are searched concurrently; no day is routed again on its own.
+
+# Safety cap: too many mid-stops makes itineraries messy and can break downstream routing.
+# Frontend can allow fewer; backend enforces a hard max.
+MAX_MID_STOPS = 8
+MAX_DAYS = 30
+MID_STOP_STAY = "1 hr"
+# Daily driving limit by pace (the frontend's adventure level) unless max_drive_hours is set
+MAX_DRIVE_S_BY_PACE = {"chill": 5 * 3600, "balanced": 7 * 3600, "extreme": 9 * 3600}
+DEFAULT_MAX_DRIVE_S = 7 * 3600
+MAX_DRIVE_HOURS = (1.0, 16.0)
+SNAP_TO_STOP_S = 45 * 60
+OVERNIGHT_STAY = "overnight"
+
+# resolve(title, bias_lat=None, bias_lng=None) -> {"lat","lng","place_id",...} or None
+StopResolver = Callable[..., Optional[Dict[str, Any]]]
+# route(stops) -> /routes-shaped dict for stops that all have lat/lng; raises HTTPException
+RouteFn = Callable[[List[Dict[str, Any]]], Dict[str, Any]]
+# nearby(lat, lng) -> overnight candidates (/places/things-to-do place dicts), best first
+NearbyFn = Callable[[float, float], List[Dict[str, Any]]]
+
+_RESOLVED_FIELDS = ("place_id", "formatted_address")
+
+
+@dataclass(frozen=True)
+class StopSpec:
+    title: str
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    bias_lat: Optional[float] = None
+    bias_lng: Optional[float] = None
+    stay: Optional[str] = None
+
+    @property
+    def located(self) -> bool:
+        return self.lat is not None and self.lng is not None
+
+    def lookup_key(self) -> tuple:
+        if self.located:
+            return ("@", round(self.lat, 6), round(self.lng, 6))
+        bias = (round(self.bias_lat, 4), round(self.bias_lng, 4)) if self.bias_lat is not None and self.bias_lng is not None else None
+        return (" ".join(self.title.split()).lower(), bias)
+
+
+@dataclass(frozen=True)
+class TripSpec:
+    """A request after the normalize stage; every later stage reads only this."""
+
+    start_city: str
+    dest_city: str
+    n_days: int
+    pace: str
+    interests: Tuple[str, ...]
+    stops: Tuple[StopSpec, ...]  # start, mid-stops, destination
+    include_route: bool = False
+    split_days: bool = False
+    max_drive_s: float = DEFAULT_MAX_DRIVE_S
+
+    @property
+    def mids(self) -> Tuple[StopSpec, ...]:
+        return self.stops[1:-1]
+
+    def lookups(self) -> List[Tuple[str, Optional[float], Optional[float]]]:
+        """The (title, bias_lat, bias_lng) lookups the resolve stage makes on a memo miss."""
+        return [(s.title, s.bias_lat, s.bias_lng) for s in self.stops if not s.located]
+
+
+def normalize(req: Any) -> TripSpec:
+    """Stage 1: a PlanTripRequest or TripRequest → TripSpec (fields a model lacks count as unset)."""
+    start_city = (getattr(req, "start_city", None) or "Start").strip() or "Start"
+    dest_city = (getattr(req, "destination", None) or "Destination").strip() or "Destination"
+    n_days = min(max(int(getattr(req, "days", None) or 1), 1), MAX_DAYS)
+
+    mid_stops = getattr(req, "mid_stops", None)
+    if mid_stops and len(mid_stops) > MAX_MID_STOPS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {MAX_MID_STOPS} mid-stops allowed. You sent {len(mid_stops)}.",
+        )
+
+    dest_lat, dest_lng = getattr(req, "destination_lat", None), getattr(req, "destination_lng", None)
+    mids: List[StopSpec] = []
+    # Prefer the new mid_stops array; fall back to the old single B-stop fields.
+    # Mid-stop lookups are biased near the destination to avoid far-away namesakes.
+    if mid_stops:
+        for ms in mid_stops:
+            title = (ms.title or "").strip()
+            if title:
+                mids.append(StopSpec(title, ms.lat, ms.lng, dest_lat, dest_lng, MID_STOP_STAY))
+    elif (getattr(req, "stop_b_title", None) or "").strip():
+        mids.append(StopSpec(req.stop_b_title.strip(), req.stop_b_lat, req.stop_b_lng, dest_lat, dest_lng, MID_STOP_STAY))
+
+    start = StopSpec(start_city, getattr(req, "start_lat", None), getattr(req, "start_lng", None))
+    dest = StopSpec(dest_city, dest_lat, dest_lng)
+    pace = (getattr(req, "pace", None) or "balanced").strip().lower()
+    max_drive_hours = getattr(req, "max_drive_hours", None)
+    if max_drive_hours:
+        max_drive_s = min(max(float(max_drive_hours), MAX_DRIVE_HOURS[0]), MAX_DRIVE_HOURS[1]) * 3600
+    else:
+        max_drive_s = MAX_DRIVE_S_BY_PACE.get(pace, DEFAULT_MAX_DRIVE_S)
+    return TripSpec(
+        start_city=start_city,
+        dest_city=dest_city,
+        n_days=n_days,
+        pace=pace,
+        interests=tuple(sorted({i.strip().lower() for i in getattr(req, "interests", None) or [] if i and i.strip()})),
+        stops=(start, *mids, dest),
+        include_route=bool(getattr(req, "include_route", False)),
+        split_days=bool(getattr(req, "split_days", False)),
+        max_drive_s=max_drive_s,
+    )
+
+
+class ItineraryEngine:
+    """Runs the stages with injected lookups; without `resolve` / `route` those stages are skipped."""
+
+    def __init__(
+        self,
+        resolve: Optional[StopResolver] = None,
+        route: Optional[RouteFn] = None,
+        nearby: Optional[NearbyFn] = None,
+        resolve_ttl_s: float = 6 * 3600,
+        route_ttl_s: float = 300,
+    ):
+        self._resolve = resolve
+        self._route = route
+        self._nearby = nearby
+        # lookup keys of every stop → resolved fields per stop (None for stops with coordinates)
+        self._resolve_memo: TTLCache[Tuple[Optional[Dict[str, Any]], ...]] = TTLCache(maxsize=2000, ttl_s=resolve_ttl_s)
+        # rounded coordinates (+ place_id) of the routed stops → route (traffic-aware, so short-lived)
+        self._route_memo: TTLCache[Dict[str, Any]] = TTLCache(maxsize=2000, ttl_s=route_ttl_s)
+
+    # --- stage 2: resolve stops ---
+
+    def resolve_stops(self, spec: TripSpec, resolve: Optional[StopResolver] = None) -> List[Dict[str, Any]]:
+        """Stop dicts (title, stay, lat, lng, place_id, formatted_address) for spec.stops."""
+        resolve = resolve or self._resolve
+        key = tuple(s.lookup_key() for s in spec.stops)
+        found = self._resolve_memo.get(key)
+        if found is not None:
+            metrics.inc("itinerary_stage_total", stage="resolve", outcome="hit")
+        else:
+            metrics.inc("itinerary_stage_total", stage="resolve", outcome="miss")
+            pending = [i for i, s in enumerate(spec.stops) if not s.located]
+
+            def lookup(i: int) -> Optional[Dict[str, Any]]:
+                s = spec.stops[i]
+                if resolve is None:
+                    return None
+                if s.bias_lat is None and s.bias_lng is None:
+                    return resolve(s.title)
+                return resolve(s.title, bias_lat=s.bias_lat, bias_lng=s.bias_lng)
+
+            results: List[Optional[Dict[str, Any]]] = [None] * len(spec.stops)
+            for i, r in zip(pending, upstream.map_concurrent(lookup, pending)):
+                results[i] = r
+            found = tuple(results)
+            # Unresolved stops may resolve next time, and fallback answers (marked with a
+            # "source", e.g. while a circuit breaker is open) are less precise: keep neither.
+            if all(found[i] and not found[i].get("source") for i in pending):
+                self._resolve_memo.set(key, found)
+
+        stops: List[Dict[str, Any]] = []
+        for s, r in zip(spec.stops, found):
+            stop: Dict[str, Any] = {"title": s.title}
+            if s.stay:
+                stop["stay"] = s.stay
+            if s.located:
+                stop["lat"], stop["lng"] = s.lat, s.lng
+            elif r:
+                stop["lat"], stop["lng"] = r.get("lat"), r.get("lng")
+                for f in _RESOLVED_FIELDS:
+                    if r.get(f):
+                        stop[f] = r.get(f)
+            stops.append(stop)
+        return stops
+
+    # --- stage 3: route ---
+
+    def route_stops(self, stops: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """{"route": ...} for the stops that have coordinates, or {"route": None, "route_error": ...}."""
+        located = [s for s in stops if s.get("lat") is not None and s.get("lng") is not None]
+        if len(located) < 2:
+            return {"route": None, "route_error": "Not enough resolved stops to route"}
+        if self._route is None:
+            return {"route": None, "route_error": "Routing is not available"}
+        key = tuple((round(s["lat"], 6), round(s["lng"], 6), s.get("place_id")) for s in located)
+        route = self._route_memo.get(key)
+        if route is not None:
+            metrics.inc("itinerary_stage_total", stage="route", outcome="hit")
+        else:
+            metrics.inc("itinerary_stage_total", stage="route", outcome="miss")
+            try:
+                route = self._route(located)
+            except HTTPException as e:
+                # The itinerary is still useful without a route; the client can retry /routes.
+                return {"route": None, "route_error": e.detail}
+            self._route_memo.set(key, route)
+        out: Dict[str, Any] = {"route": route}
+        if len(located) < len(stops):
+            out["route_skipped_stops"] = [s.get("title") for s in stops if s.get("lat") is None or s.get("lng") is None]
+        return out
+
+    # --- stage 3b: split into driving days ---
+
+    def split_days(self, spec: TripSpec, stops: List[Dict[str, Any]], routed: Dict[str, Any]) -> Dict[str, Any]:
+        """{"days": [...]} with one entry per driving day, or {"split_error": ...}."""
+        route = routed.get("route")
+        if route is None:
+            metrics.inc("itinerary_stage_total", stage="split", outcome="error")
+            return {"split_error": routed.get("route_error") or "No route to split"}
+        index = RouteIndex.from_route(route)
+        if index is None or index.total_s <= 0:
+            metrics.inc("itinerary_stage_total", stage="split", outcome="error")
+            return {"split_error": "Route has no usable polyline or duration"}
+
+        # Seconds along the route at each stop; unrouted stops ride with the stop before them.
+        located = [i for i, s in enumerate(stops) if s.get("lat") is not None and s.get("lng") is not None]
+        stop_s = index.stop_seconds()
+        at_s: List[float] = []
+        t = 0.0
+        routed_times = dict(zip(located, stop_s)) if len(stop_s) == len(located) else {}
+        for i in range(len(stops)):
+            t = routed_times.get(i, t)
+            at_s.append(t)
+        at_s[-1] = index.total_s
+
+        total = index.total_s
+        n = min(spec.n_days, max(1, math.ceil(total / spec.max_drive_s)))
+        cuts: List[Tuple[float, Optional[int]]] = []  # (seconds along, mid-stop index it snapped to)
+        for j in range(1, n):
+            target = total * j / n
+            prev = cuts[-1][0] if cuts else 0.0
+            near = [i for i in range(1, len(stops) - 1) if i in routed_times and prev < at_s[i] < total and abs(at_s[i] - target) <= SNAP_TO_STOP_S]
+            snap = min(near, key=lambda i: abs(at_s[i] - target), default=None)
+            cuts.append((at_s[snap], snap) if snap is not None else (target, None))
+
+        points = [index.at_seconds(c) for c, _ in cuts]
+        candidates = upstream.map_concurrent(lambda p: self._overnight_candidates(p["lat"], p["lng"]), points)
+
+        days: List[Dict[str, Any]] = []
+        bounds = [0.0, *(c for c, _ in cuts), total]
+        day_start: Dict[str, Any] = stops[0]
+        next_stop = 1
+        for j in range(n):
+            from_s, to_s = bounds[j], bounds[j + 1]
+            day_stops = [day_start]
+            while next_stop < len(stops) - 1 and at_s[next_stop] <= to_s:
+                day_stops.append(stops[next_stop])
+                next_stop += 1
+            a, b = index.at_seconds(from_s), index.at_seconds(to_s)
+            day: Dict[str, Any] = {
+                "stops": day_stops,
+                "drive": {
+                    "distance_meters": int(round(b["along_m"] - a["along_m"])),
+                    "duration_seconds": int(round(to_s - from_s)),
+                    "polyline": encode_polyline(index.slice_seconds(from_s, to_s)),
+                    "over_limit": to_s - from_s > spec.max_drive_s,
+                },
+            }
+            if j == n - 1:
+                day_stops.append(stops[-1])
+            else:
+                snapped, found = cuts[j][1], candidates[j]
+                p = points[j]
+                overnight: Dict[str, Any] = {
+                    "lat": round(p["lat"], 6),
+                    "lng": round(p["lng"], 6),
+                    "along_m": int(round(p["along_m"])),
+                    "along_s": int(round(p["along_s"])),
+                    "candidates": found or [],
+                }
+                if found is None:
+                    overnight["error"] = "Overnight search unavailable"
+                if snapped is not None:
+                    overnight["at_stop"] = stops[snapped]["title"]
+                    day_stops[-1] = day_start = {**stops[snapped], "stay": OVERNIGHT_STAY}
+                else:
+                    top = (found or [None])[0]
+                    day_start = {"title": f"Overnight stop {j + 1}", "stay": OVERNIGHT_STAY, "lat": overnight["lat"], "lng": overnight["lng"]}
+                    if top:
+                        day_start.update({"title": top.get("title") or day_start["title"], "lat": top.get("lat"), "lng": top.get("lng")})
+                        for f in _RESOLVED_FIELDS:
+                            if top.get(f):
+                                day_start[f] = top[f]
+                    day_stops.append(day_start)
+                day["overnight"] = overnight
+            days.append(day)
+
+        metrics.inc("itinerary_stage_total", stage="split", outcome="split" if n > 1 else "single")
+        return {"days": days}
+
+    def _overnight_candidates(self, lat: float, lng: float) -> Optional[List[Dict[str, Any]]]:
+        """Candidates around one cut; [] without a nearby lookup, None when the lookup failed."""
+        if self._nearby is None:
+            return []
+        try:
+            return self._nearby(lat, lng)
+        except HTTPException:
+            return None
+
+    # --- stage 4: assemble ---
+
+    @staticmethod
+    def assemble(
+        spec: TripSpec,
+        stops: List[Dict[str, Any]],
+        route: Optional[Dict[str, Any]],
+        split: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        if split and split.get("days"):
+            days: List[Dict[str, Any]] = [{"day": i, **d} for i, d in enumerate(split["days"], start=1)]
+        else:
+            days = [{"day": 1, "stops": stops}]
+            if split:
+                days[0]["split_error"] = split.get("split_error")
+        for d in range(len(days) + 1, spec.n_days + 1):
+            days.append({"day": d, "stops": [{"title": spec.dest_city}]})
+        if route is not None:
+            days[0].update(route)
+
+        plural = "s" if spec.n_days != 1 else ""
+        names = [s.title for s in spec.mids]
+        if len(names) == 1:
+            summary = f"Trip from {spec.start_city} to {spec.dest_city} with a stop at {names[0]} for {spec.n_days} day{plural}."
+        elif names:
+            summary = (
+                f"Trip from {spec.start_city} to {spec.dest_city} with stops at {', '.join(names)} "
+                f"for {spec.n_days} day{plural}."
+            )
+        else:
+            summary = f"Trip from {spec.start_city} to {spec.dest_city} for {spec.n_days} day{plural}."
+        drive_days = sum(1 for d in days if "drive" in d)
+        if drive_days > 1:
+            summary += f" The drive is split over {drive_days} days."
+
+        start, dest = stops[0], stops[-1]
+        return {
+            "summary": summary,
+            "start_city": spec.start_city,
+            "destination": spec.dest_city,
+            "days": days,
+            "start": {"title": spec.start_city, "lat": start.get("lat"), "lng": start.get("lng"), "place_id": start.get("place_id")},
+            "destination_obj": {"title": spec.dest_city, "lat": dest.get("lat"), "lng": dest.get("lng"), "place_id": dest.get("place_id")},
+        }
+
+    def plan(self, req: Any, resolve: Optional[StopResolver] = None) -> Dict[str, Any]:
+        """All stages; `resolve` overrides the engine's resolver (e.g. a batch's pre-resolved stops)."""
+        spec = normalize(req)
+        report_stage("normalize")
+        stops = self.resolve_stops(spec, resolve)
+        report_stage("resolve", unresolved=sum(1 for s in stops if s.get("lat") is None))
+        route = self.route_stops(stops) if spec.include_route or spec.split_days else None
+        if route is not None:
+            report_stage("route", ok=route.get("route") is not None)
+        split = self.split_days(spec, stops, route) if spec.split_days and route is not None else None
+        if split is not None:
+            report_stage("split", days=len(split.get("days") or []))
+        plan = self.assemble(spec, stops, route if spec.include_route else None, split)
+        report_stage("assemble")
+        return plan
 
 
 def build_itinerary(req: TripRequest) -> TripResponse:
+    """Day-by-day template (no Google lookups): the same three suggestions every day."""
     start_city = normalize_text(req.start_city)
     destination = normalize_text(req.destination)
     state = normalize_text(req.destination_state or "")
 
     days = req.days if req.days and req.days > 0 else 3
-    interests: List[str] = req.interests or []
-
-    mid_stop = pick_mid_stop(interests)
+    mid_stop = pick_mid_stop(req.interests or [])
 
     plans: List[DayPlan] = []
     for d in range(1, days + 1):
         stops = [
             Stop(title="Start easy + coffee", category="warmup"),
-            Stop(mid_stop, category="highlight"),
-            Stop("Dinner + chill", category="food"),
+            Stop(title=mid_stop, category="highlight"),
+            Stop(title="Dinner + chill", category="food"),
         ]
         plans.append(DayPlan(day=d, title=f"Day {d} in {destination or 'your trip'}", stops=stops))
 
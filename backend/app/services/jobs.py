@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from . import upstream
+from .priority import current_priority, priority
+from ..utils import metrics
+
+logger = logging.getLogger("deesha")
+
+# -------------------------------------------------
+# Background jobs for long-running plans
+# -------------------------------------------------
+# POST /jobs/plan-trip (or /jobs/things-to-do) answers 202 with a job id at once; a
+# small worker pool runs the same handler code the synchronous endpoint runs, so the
+# request neither holds a connection nor a threadpool thread while Google answers.
+#
+#   queued → running → done | failed | cancelled
+#
+# Handlers report stage completions with report_stage() (a no-op outside a job); the
+# current job travels in a contextvar, so stages finished on upstream.map_concurrent
+# workers count too. Clients poll GET /jobs/{id} or follow GET /jobs/{id}/events
+# (server-sent events). DELETE /jobs/{id} cancels through the job's CancelToken.
+#
+# Finished jobs are kept `ttl_s` and then forgotten; unfinished jobs never expire.
+# Jobs live in this process only: with several uvicorn workers, poll the worker that
+# accepted the job (or run one worker).
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+_current_job: contextvars.ContextVar[Optional["Job"]] = contextvars.ContextVar("deesha_job", default=None)
+
+
+class JobQueueFull(HTTPException):
+    def __init__(self, retry_after_s: int = 5):
+        super().__init__(status_code=503, detail="Too many queued jobs", headers={"Retry-After": str(retry_after_s)})
+
+
+class Job:
+    def __init__(self, kind: str, fn: Callable[[], Any], priority_class: str):
+        self.id = secrets.token_urlsafe(12)
+        self.kind = kind
+        self.fn = fn
+        self.priority = priority_class
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self.result: Any = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.token = upstream.CancelToken()
+        self._lock = threading.Lock()
+
+    def _append(self, event: str, **detail: Any) -> None:
+        # Caller holds the lock.
+        self.events.append({"event": event, "at_s": round(time.time() - self.created_at, 3), **detail})
+
+    def _event(self, event: str, **detail: Any) -> None:
+        with self._lock:
+            self._append(event, **detail)
+
+    def _set_status(self, status: str) -> None:
+        # Caller holds the lock; the status and its event change together.
+        self.status = status
+        if status == RUNNING:
+            self.started_at = time.time()
+        elif status in FINISHED:
+            self.finished_at = time.time()
+        self._append("status", status=status)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "created_at": self.created_at,
+                "stages": [e for e in self.events if e["event"] == "stage"],
+            }
+            if self.started_at is not None:
+                out["queued_s"] = round(self.started_at - self.created_at, 3)
+            if self.started_at is not None and self.finished_at is not None:
+                out["run_s"] = round(self.finished_at - self.started_at, 3)
+            if self.error is not None:
+                out["error"] = self.error
+            if include_result and self.status == DONE:
+                out["result"] = self.result
+            return out
+
+
+def report_stage(stage: str, **detail: Any) -> None:
+    """Record that `stage` finished for the job running in this context (if any)."""
+    job = _current_job.get()
+    if job is not None:
+        job._event("stage", stage=stage, **detail)
+
+
+class JobQueue:
+    def __init__(self, workers: int = 4, max_queued: int = 100, ttl_s: float = 900.0):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.ttl_s = ttl_s
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        metrics.register_collector(self._collect)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="deesha-job")
+            return self._pool
+
+    def submit(self, kind: str, fn: Callable[[], Any]) -> Job:
+        """Queue `fn` (no arguments, returns a JSON-able result); raises JobQueueFull."""
+        self._sweep()
+        job = Job(kind, fn, current_priority())
+        with self._lock:
+            if sum(1 for j in self._jobs.values() if j.status == QUEUED) >= self.max_queued:
+                metrics.inc("jobs_rejected_total", kind=kind)
+                raise JobQueueFull()
+            self._jobs[job.id] = job
+            job._append("status", status=QUEUED)
+        metrics.inc("jobs_submitted_total", kind=kind)
+        # Workers start from an empty context: the job must not inherit the submitting
+        # request's cancel token (it is cancelled when that request's client leaves).
+        self._get_pool().submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._sweep()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.token.cancel("job_cancelled")
+        with job._lock:
+            was_queued = job.status == QUEUED
+            if was_queued:
+                job._set_status(CANCELLED)
+        if was_queued:
+            metrics.inc("jobs_finished_total", kind=job.kind, status=CANCELLED)
+        return job
+
+    def _run(self, job: Job) -> None:
+        with job._lock:
+            if job.status != QUEUED:
+                return
+            job._set_status(RUNNING)
+        metrics.observe("job_queue_wait_seconds", job.started_at - job.created_at, kind=job.kind)
+
+        status, result, error = DONE, None, None
+        reset = _current_job.set(job)
+        try:
+            with priority(job.priority), upstream.cancellable(job.token):
+                result = job.fn()
+        except upstream.UpstreamCancelled:
+            status, error = CANCELLED, {"status_code": 499, "detail": "Job cancelled"}
+        except HTTPException as e:
+            status, error = FAILED, {"status_code": e.status_code, "detail": e.detail}
+        except Exception:
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            status, error = FAILED, {"status_code": 500, "detail": "Internal error"}
+        finally:
+            _current_job.reset(reset)
+
+        # A cancel that lands after fn() returned is too late: the job keeps its result.
+        with job._lock:
+            job.result, job.error = result, error
+            job._set_status(status)
+            elapsed = job.finished_at - job.started_at
+        metrics.observe("job_run_seconds", elapsed, kind=job.kind)
+        metrics.observe("job_latency_seconds", job.finished_at - job.created_at, kind=job.kind)
+        metrics.inc("jobs_finished_total", kind=job.kind, status=job.status)
+
+    def _sweep(self) -> None:
+        cutoff = time.time() - self.ttl_s
+        with self._lock:
+            expired = [jid for jid, j in self._jobs.items() if j.finished_at is not None and j.finished_at < cutoff]
+            for jid in expired:
+                del self._jobs[jid]
+
+    def _collect(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        yield "jobs_queue_depth", {}, sum(1 for j in jobs if j.status == QUEUED)
+        yield "jobs_running", {}, sum(1 for j in jobs if j.status == RUNNING)
+        yield "jobs_retained", {}, len(jobs)
+        yield "jobs_workers", {}, self.workers
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import math
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from ..config import get_settings
+from ..model.place import Place, rank_places
+from ..utils import metrics
+from ..utils.geo import geohash_circle_cells, geohash_encode, haversine_m
+
+logger = logging.getLogger("deesha")
+
+# -------------------------------------------------
+# Local index of places seen in upstream responses
+# -------------------------------------------------
+# Every place a searchNearby / searchText answer returns is kept here, bucketed by
+# geohash cell (precision 5, ≈ 4.9 × 4.9 km at the equator, narrower further north).
+# Freshness is tracked per searched area: each searchNearby circle is recorded with its
+# includedTypes, when it ran and whether the answer was complete (fewer results than
+# maxResultCount) or only the top results. Circles are filed under every cell they
+# touch, so the circles that can contain a point are the ones in that point's cell.
+#
+# query() answers a circle locally when fresh circles with every requested type cover
+# it: one circle containing it (an identical or nested repeat), or else the union of
+# circles covering its centre and rings of sample points out to its edge (an
+# approximation: a gap smaller than the sample spacing can slip through). Every
+# covering circle must also be complete. A capped circle only answers an identical
+# repeat: the index holds just its top results, so a smaller circle inside it (a later
+# things-to-do page) would get back places the caller has already seen instead of the
+# lower-ranked ones Google would return. Otherwise it returns None and the caller asks
+# Google. searchText results (locationBias, not a restriction) add
+# places but never freshness.
+#
+# The index is saved to `path` as JSON every `autosave_s` and at shutdown, and loaded on
+# first use. Places not seen for MAX_AGE_S (Google's 30-day caching limit) are dropped.
+# In replay mode (DEESHA_UPSTREAM_MODE=replay) it is neither loaded, saved nor queried,
+# so replays make exactly the recorded calls.
+
+PRECISION = 5
+MAX_AGE_S = 30 * 86400
+FILE_VERSION = 2
+MAX_CIRCLES = 50_000
+# Sample rings (fractions of the radius) and points per ring for union coverage
+_RINGS = (0.5, 1.0)
+_RING_POINTS = 12
+
+# (lat, lng, radius m, included types, fetched at, complete)
+SearchedCircle = Tuple[float, float, float, FrozenSet[str], float, bool]
+
+
+def _identical(c: SearchedCircle, lat: float, lng: float, radius_m: float) -> bool:
+    return abs(c[2] - radius_m) <= 1.0 and haversine_m(c[0], c[1], lat, lng) <= 1.0
+
+
+class PlaceIndex:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        fresh_s: float = 3 * 86400,
+        max_places: int = 200_000,
+        answer_locally: bool = True,
+    ):
+        self.path = path
+        self.fresh_s = fresh_s
+        self.max_places = max(1000, max_places)
+        self.answer_locally = answer_locally
+        self._places: Dict[str, Place] = {}
+        self._seen_at: Dict[str, float] = {}
+        self._cell_of: Dict[str, str] = {}
+        self._cells: Dict[str, Set[str]] = {}
+        self._circles: Dict[int, SearchedCircle] = {}
+        self._next_circle = 0
+        # cell → ids of the searched circles touching it
+        self._circle_cells: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._autosave: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        metrics.register_collector(self._collect)
+
+    # --- updates ---
+
+    def ingest(self, places: Iterable[Place], now: Optional[float] = None) -> None:
+        """Add or refresh places; fields a response left out keep their known values."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for p in places:
+                if p.lat is None or p.lng is None:
+                    continue
+                old = self._places.get(p.place_id)
+                if old is not None:
+                    p = Place(
+                        p.place_id,
+                        p.name or old.name,
+                        p.address or old.address,
+                        p.lat,
+                        p.lng,
+                        p.types or old.types,
+                        p.rating if p.rating is not None else old.rating,
+                        p.votes if p.votes is not None else old.votes,
+                    )
+                self._put(p, now)
+            if len(self._places) > self.max_places:
+                self._evict(len(self._places) - int(self.max_places * 0.9))
+            self._dirty = True
+
+    def record_search(
+        self,
+        lat: float,
+        lng: float,
+        radius_m: float,
+        included_types: Sequence[str],
+        max_count: int,
+        places: Sequence[Place],
+    ) -> None:
+        """Ingest a searchNearby answer and record its circle as a fresh area."""
+        now = time.time()
+        self.ingest(places, now)
+        complete = len(places) < max_count
+        with self._lock:
+            self._add_circle((lat, lng, float(radius_m), frozenset(included_types), now, complete))
+            if len(self._circles) > MAX_CIRCLES:
+                self._prune_circles(now, keep=int(MAX_CIRCLES * 0.9))
+            self._dirty = True
+        metrics.inc("place_index_searches_recorded_total", complete=str(complete).lower())
+
+    def _put(self, p: Place, now: float) -> None:
+        # Caller holds the lock.
+        cell = geohash_encode(p.lat, p.lng, PRECISION)
+        old_cell = self._cell_of.get(p.place_id)
+        if old_cell is not None and old_cell != cell:
+            self._cells.get(old_cell, set()).discard(p.place_id)
+        self._places[p.place_id] = p
+        self._seen_at[p.place_id] = now
+        self._cell_of[p.place_id] = cell
+        self._cells.setdefault(cell, set()).add(p.place_id)
+
+    def _add_circle(self, circle: SearchedCircle) -> None:
+        # Caller holds the lock.
+        cid = self._next_circle
+        self._next_circle += 1
+        self._circles[cid] = circle
+        for cell, _ in geohash_circle_cells(circle[0], circle[1], circle[2], PRECISION):
+            self._circle_cells.setdefault(cell, set()).add(cid)
+
+    def _prune_circles(self, now: float, keep: Optional[int] = None) -> None:
+        # Caller holds the lock; drops stale circles, then the oldest beyond `keep`.
+        ids = sorted(self._circles, key=lambda c: self._circles[c][4])
+        drop = {c for c in ids if now - self._circles[c][4] > self.fresh_s}
+        if keep is not None:
+            live = [c for c in ids if c not in drop]
+            drop.update(live[: max(0, len(live) - keep)])
+        for cid in drop:
+            lat, lng, radius, *_ = self._circles.pop(cid)
+            for cell, _ in geohash_circle_cells(lat, lng, radius, PRECISION):
+                ids_in_cell = self._circle_cells.get(cell)
+                if ids_in_cell is not None:
+                    ids_in_cell.discard(cid)
+                    if not ids_in_cell:
+                        del self._circle_cells[cell]
+
+    def _covering(self, lat: float, lng: float, radius_m: float, wanted: Set[str], now: float) -> Optional[List[SearchedCircle]]:
+        # Caller holds the lock. Fresh circles covering the query circle, or None.
+        def fresh_near(la: float, ln: float) -> List[SearchedCircle]:
+            ids = self._circle_cells.get(geohash_encode(la, ln, PRECISION), ())
+            return [c for c in (self._circles[i] for i in ids) if now - c[4] <= self.fresh_s]
+
+        def pick(circles: List[SearchedCircle], t: str) -> Optional[SearchedCircle]:
+            # A complete answer for type t beats a capped one, and an identical capped one
+            # beats a larger capped one.
+            return max(
+                (c for c in circles if t in c[3]),
+                key=lambda c: (c[5], _identical(c, lat, lng, radius_m), c[4]),
+                default=None,
+            )
+
+        # One circle containing the whole query (identical or nested repeat), per type
+        whole = [c for c in fresh_near(lat, lng) if haversine_m(c[0], c[1], lat, lng) + radius_m <= c[2] + 1.0]
+        picked = [pick(whole, t) for t in wanted]
+        if all(c is not None for c in picked):
+            return picked  # type: ignore[return-value]
+
+        # Otherwise every sample point must lie in a fresh circle for every type.
+        dlat = radius_m / 111320.0
+        dlng = radius_m / max(1.0, 111320.0 * math.cos(math.radians(lat)))
+        points = [(lat, lng)] + [
+            (lat + dlat * f * math.sin(a), lng + dlng * f * math.cos(a))
+            for f in _RINGS
+            for a in (2 * math.pi * k / _RING_POINTS for k in range(_RING_POINTS))
+        ]
+        used: Dict[int, SearchedCircle] = {}
+        for la, ln in points:
+            here = [c for c in fresh_near(la, ln) if haversine_m(c[0], c[1], la, ln) <= c[2]]
+            for t in wanted:
+                c = pick(here, t)
+                if c is None:
+                    return None
+                used[id(c)] = c
+        return list(used.values())
+
+    def _evict(self, n: int) -> None:
+        # Caller holds the lock; drops the `n` least recently seen places.
+        for pid in sorted(self._seen_at, key=self._seen_at.__getitem__)[:n]:
+            self._places.pop(pid, None)
+            self._seen_at.pop(pid, None)
+            cell = self._cell_of.pop(pid, None)
+            if cell is not None:
+                self._cells.get(cell, set()).discard(pid)
+
+    # --- queries ---
+
+    def query(
+        self,
+        lat: float,
+        lng: float,
+        radius_m: float,
+        included_types: Sequence[str],
+        max_count: int,
+    ) -> Optional[List[Place]]:
+        """Best `max_count` known places of `included_types` in the circle, or None when the area is not fresh."""
+        if not self.answer_locally:
+            return None
+        now = time.time()
+        wanted = set(included_types)
+        with self._lock:
+            covering = self._covering(lat, lng, radius_m, wanted, now) if wanted else None
+            if covering is None:
+                metrics.inc("place_index_queries_total", outcome="stale")
+                return None
+            if not all(c[5] or _identical(c, lat, lng, radius_m) for c in covering):
+                metrics.inc("place_index_queries_total", outcome="capped")
+                return None
+            complete = all(c[5] for c in covering)
+            cells = [cell for cell, _ in geohash_circle_cells(lat, lng, radius_m, PRECISION)]
+            found: Dict[str, Place] = {}
+            for cell in cells:
+                for pid in self._cells.get(cell, ()):
+                    p = self._places[pid]
+                    if wanted.intersection(p.types) and haversine_m(lat, lng, p.lat, p.lng) <= radius_m:
+                        found[pid] = p
+        if not complete and len(found) < max_count:
+            metrics.inc("place_index_queries_total", outcome="thin")
+            return None
+        metrics.inc("place_index_queries_total", outcome="hit")
+        return rank_places(found)[:max_count]
+
+    # --- persistence ---
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            logger.warning("Place index %s could not be read; starting empty", self.path)
+            return
+        if not isinstance(data, dict):
+            logger.warning("Place index %s is not an index file; starting empty", self.path)
+            return
+        if data.get("v") != FILE_VERSION:
+            return
+        now = time.time()
+        with self._lock:
+            for pid, name, address, lat, lng, types, rating, votes, seen_at in data.get("places") or []:
+                if now - seen_at <= MAX_AGE_S:
+                    self._put(Place(pid, name, address, lat, lng, tuple(types), rating, votes), seen_at)
+            for lat, lng, radius, types, at, complete in data.get("circles") or []:
+                if now - at <= self.fresh_s:
+                    self._add_circle((lat, lng, radius, frozenset(types), at, bool(complete)))
+        logger.info("Place index: loaded %d places, %d fresh areas", len(self._places), len(self._circles))
+
+    def save(self) -> None:
+        """Write the index atomically (tmp file + rename) if anything changed."""
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            if not self._dirty:
+                return
+            self._prune_circles(now)
+            data = {
+                "v": FILE_VERSION,
+                "places": [
+                    [p.place_id, p.name, p.address, p.lat, p.lng, list(p.types), p.rating, p.votes, self._seen_at[pid]]
+                    for pid, p in self._places.items()
+                    if now - self._seen_at[pid] <= MAX_AGE_S
+                ],
+                "circles": [[lat, lng, r, sorted(types), at, complete] for lat, lng, r, types, at, complete in self._circles.values()],
+            }
+            self._dirty = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError:
+            self._dirty = True
+            logger.exception("Place index could not be saved to %s", self.path)
+
+    def start_autosave(self, interval_s: float = 60.0) -> None:
+        if not self.path or self._autosave is not None:
+            return
+
+        def run() -> None:
+            while not self._stop.wait(interval_s):
+                self.save()
+
+        self._stop.clear()
+        self._autosave = threading.Thread(target=run, name="deesha-place-index", daemon=True)
+        self._autosave.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._autosave = None
+        self.save()
+
+    def _collect(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        yield "place_index_places", {}, len(self._places)
+        yield "place_index_cells", {}, len(self._cells)
+        yield "place_index_fresh_areas", {}, len(self._circles)
+
+
+_index: Optional[PlaceIndex] = None
+_index_lock = threading.Lock()
+
+
+def place_index() -> PlaceIndex:
+    """The process-wide index, loaded from disk on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                s = get_settings()
+                replaying = s.upstream_mode == "replay"
+                idx = PlaceIndex(
+                    path=None if replaying else s.place_index_path,
+                    fresh_s=s.place_index_fresh_s,
+                    answer_locally=s.place_index_enabled and not replaying,
+                )
+                idx.load()
+                _index = idx
+    return _index
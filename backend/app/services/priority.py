@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from ..config import get_settings
+from ..utils import metrics
+
+# -------------------------------------------------
+# Priority classes for upstream calls
+# -------------------------------------------------
+# Every upstream call (upstream.request_json) takes a slot in its priority class
+# first, and upstream.map_concurrent fans out on a thread pool of its own per class.
+# Each class has its own concurrency limit and its own fan-out workers, so typeahead
+# never waits behind a /plan-trip/batch run or the warm-up job however many calls
+# those have queued:
+#
+#   interactive  typeahead and place details, the user is waiting per keystroke
+#   standard     everything else a user asked for (/plan-trip, /places/things-to-do, …)
+#   background   bulk and speculative work: /plan-trip/batch, cache warm-up
+#
+# The class travels in a contextvar, so it follows the request into the threadpool
+# and into upstream.map_concurrent workers. PriorityMiddleware sets it per path; a
+# client can demote its own request with `X-Deesha-Priority: background` (never
+# promote). Background threads use `with priority("background"):`.
+#
+# A class's fan-out pool has as many workers as its limit (capped at
+# upstream.FANOUT_WORKERS), so its workers rarely wait for a slot.
+
+PRIORITIES: Tuple[str, ...] = ("interactive", "standard", "background")
+DEFAULT_PRIORITY = "standard"
+# Waiters re-check cancellation this often
+WAIT_POLL_S = 0.25
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("upstream_priority", default=DEFAULT_PRIORITY)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+@contextmanager
+def priority(name: str) -> Iterator[str]:
+    """Run upstream calls in this context (and fan-outs started from it) in class `name`."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority {name!r}")
+    reset = _priority.set(name)
+    try:
+        yield name
+    finally:
+        _priority.reset(reset)
+
+
+class _Class:
+    __slots__ = ("name", "limit", "active", "waiting")
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self.waiting = 0
+
+
+class UpstreamScheduler:
+    def __init__(self, limits: Dict[str, int]):
+        self._classes = {name: _Class(name, limits.get(name, 8)) for name in PRIORITIES}
+        self._cond = threading.Condition()
+        metrics.register_collector(self._collect)
+
+    @contextmanager
+    def slot(self, check_cancelled: Optional[Callable[[], None]] = None) -> Iterator[str]:
+        """Hold a slot of the current priority class for one upstream call.
+
+        `check_cancelled` is called while waiting and may raise to give up the wait.
+        """
+        c = self._classes[current_priority()]
+        t0 = time.perf_counter()
+        with self._cond:
+            c.waiting += 1
+            try:
+                while c.active >= c.limit:
+                    self._cond.wait(WAIT_POLL_S)
+                    if check_cancelled is not None:
+                        check_cancelled()
+            finally:
+                c.waiting -= 1
+            c.active += 1
+        metrics.observe("upstream_queue_wait_seconds", time.perf_counter() - t0, **{"class": c.name})
+        try:
+            yield c.name
+        finally:
+            with self._cond:
+                c.active -= 1
+                self._cond.notify_all()
+
+    def limit(self, name: str) -> int:
+        return self._classes[name].limit
+
+    def _collect(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        for c in self._classes.values():
+            yield "upstream_class_active", {"class": c.name}, c.active
+            yield "upstream_class_waiting", {"class": c.name}, c.waiting
+            yield "upstream_class_limit", {"class": c.name}, c.limit
+
+
+_scheduler: Optional[UpstreamScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def scheduler() -> UpstreamScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                s = get_settings()
+                _scheduler = UpstreamScheduler(
+                    {
+                        "interactive": s.upstream_limit_interactive,
+                        "standard": s.upstream_limit_standard,
+                        "background": s.upstream_limit_background,
+                    }
+                )
+    return _scheduler
+
+
+class PriorityMiddleware:
+    """Sets the priority class of each request from its path (or a demoting header)."""
+
+    def __init__(self, app, interactive_paths: Iterable[str] = (), background_paths: Iterable[str] = ()):
+        self.app = app
+        self.classes: Dict[str, str] = {p: "interactive" for p in interactive_paths}
+        self.classes.update({p: "background" for p in background_paths})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        name = self.classes.get(scope["path"], DEFAULT_PRIORITY)
+        for k, v in scope.get("headers") or []:
+            if k == b"x-deesha-priority":
+                asked = v.decode("latin-1").strip().lower()
+                if asked in PRIORITIES and PRIORITIES.index(asked) > PRIORITIES.index(name):
+                    name = asked
+                break
+        with priority(name):
+            await self.app(scope, receive, send)
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import inspect
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..utils import metrics
+
+# -------------------------------------------------
+# On-demand CPU sampling + allocation tracking
+# -------------------------------------------------
+# sample_stacks() reads every thread's stack from sys._current_frames() at a fixed
+# interval and counts identical stacks. The result is in "collapsed" form
+# (`root;caller;callee count` per line), which flamegraph.pl, speedscope and
+# inferno read directly. Nothing is installed into the interpreter, so the cost is
+# one stack walk per thread per interval, only while a profile runs.
+#
+# track_allocations() runs tracemalloc for a while and attributes each live
+# allocation to the endpoint whose handler frame is on its traceback. Allocations
+# made in upstream.map_concurrent workers have no handler frame and count as
+# "(other)". tracemalloc slows allocation-heavy code noticeably while it runs.
+#
+# Both are per process: with several uvicorn workers, a call profiles whichever
+# worker answered it (the response says which pid).
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # .../backend/app
+MAX_SECONDS = 60.0
+# Leaf frames of threads that are parked, not working (skipped unless include_idle)
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "Condition.wait"),
+    ("queue.py", "get"),
+    ("queue.py", "Queue.get"),
+    ("selectors.py", "select"),
+    ("selectors.py", "EpollSelector.select"),
+    ("selectors.py", "KqueueSelector.select"),
+    ("thread.py", "_worker"),
+}
+
+_busy = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another profile or allocation capture is already running in this process."""
+
+
+def _frame_label(filename: str, func: str) -> str:
+    if filename.startswith(APP_DIR):
+        filename = "app/" + os.path.relpath(filename, APP_DIR)
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{func}"
+
+
+def _thread_role(name: str) -> str:
+    # "upstream-fanout_3" / "AnyIO worker thread" / "MainThread" → stable root frame
+    return re.sub(r"[_-]?\d+$", "", name) or "thread"
+
+
+def _collapse(frame: Any) -> Tuple[List[str], Tuple[str, str]]:
+    stack: List[str] = []
+    leaf: Optional[Tuple[str, str]] = None
+    while frame is not None:
+        code = frame.f_code
+        func = getattr(code, "co_qualname", code.co_name)
+        if leaf is None:
+            leaf = (os.path.basename(code.co_filename), func)
+        stack.append(_frame_label(code.co_filename, func))
+        frame = frame.f_back
+    stack.reverse()
+    return stack, leaf or ("", "")
+
+
+def sample_stacks(seconds: float, interval_s: float = 0.01, include_idle: bool = False) -> Dict[str, Any]:
+    """Sample every thread's stack for `seconds`; returns collapsed stack counts and totals."""
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        seconds = max(0.1, min(seconds, MAX_SECONDS))
+        interval_s = max(0.001, interval_s)
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        samples = 0
+        t0 = time.perf_counter()
+        deadline = t0 + seconds
+        while True:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack, leaf = _collapse(frame)
+                if not include_idle and leaf in _IDLE_LEAVES:
+                    continue
+                counts[";".join([_thread_role(names.get(ident, "thread")), *stack])] += 1
+            samples += 1
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            time.sleep(min(interval_s, deadline - now))
+        elapsed = time.perf_counter() - t0
+    finally:
+        _busy.release()
+    metrics.inc("debug_profiles_total", kind="cpu")
+    return {"pid": os.getpid(), "seconds": round(elapsed, 3), "samples": samples, "stacks": counts}
+
+
+def collapsed_text(stacks: Counter) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+
+
+def top_functions(stacks: Counter, top: int = 20) -> List[Dict[str, Any]]:
+    """Self and total sample counts per frame, busiest (self) first."""
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    for stack, n in stacks.items():
+        frames = stack.split(";")[1:]  # drop the thread-role root
+        if not frames:
+            continue
+        self_counts[frames[-1]] += n
+        for f in set(frames):
+            total_counts[f] += n
+    return [{"frame": f, "self": n, "total": total_counts[f]} for f, n in self_counts.most_common(top)]
+
+
+# --- allocations ---
+
+EndpointCode = Tuple[str, str, int, int]  # (label, filename, first line, last line)
+
+
+def endpoint_code_ranges(endpoints: Iterable[Tuple[str, Any]]) -> List[EndpointCode]:
+    """(label, handler) pairs → source ranges used to spot handler frames in tracebacks."""
+    out: List[EndpointCode] = []
+    for label, fn in endpoints:
+        code = getattr(inspect.unwrap(fn), "__code__", None)
+        if code is None:
+            continue
+        lines = [ln for _, _, ln in code.co_lines() if ln is not None]
+        out.append((label, code.co_filename, code.co_firstlineno, max(lines, default=code.co_firstlineno)))
+    return out
+
+
+def _attribute(traceback: tracemalloc.Traceback, ranges: List[EndpointCode]) -> str:
+    for frame in reversed(traceback):  # frames are oldest first; the innermost handler wins
+        for label, filename, first, last in ranges:
+            if frame.filename == filename and first <= frame.lineno <= last:
+                return label
+    return "(other)"
+
+
+def track_allocations(seconds: float, ranges: List[EndpointCode], top: int = 10, nframes: int = 64) -> Dict[str, Any]:
+    """Trace allocations for `seconds`; live bytes per endpoint plus their top allocation sites.
+
+    Only memory allocated during the window and still alive at its end is counted, so
+    steady caches show up while short-lived request garbage mostly does not.
+    """
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy()
+    started_here = not tracemalloc.is_tracing()
+    try:
+        seconds = max(0.1, min(seconds, MAX_SECONDS))
+        if started_here:
+            tracemalloc.start(nframes)
+        else:
+            tracemalloc.clear_traces()
+        time.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _busy.release()
+
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    per_endpoint: Dict[str, Dict[str, Any]] = {}
+    sites: Dict[str, Counter] = {}
+    for trace in snapshot.traces:
+        label = _attribute(trace.traceback, ranges)
+        entry = per_endpoint.setdefault(label, {"bytes": 0, "blocks": 0})
+        entry["bytes"] += trace.size
+        entry["blocks"] += 1
+        where = trace.traceback[-1]  # the allocating line
+        sites.setdefault(label, Counter())[f"{_frame_label(where.filename, '')}{where.lineno}"] += trace.size
+
+    for label, entry in per_endpoint.items():
+        entry["top_sites"] = [{"site": s, "bytes": b} for s, b in sites[label].most_common(top)]
+    metrics.inc("debug_profiles_total", kind="allocations")
+    return {
+        "pid": os.getpid(),
+        "seconds": seconds,
+        "traced_peak_bytes": peak,
+        "endpoints": dict(sorted(per_endpoint.items(), key=lambda kv: -kv[1]["bytes"])),
+    }
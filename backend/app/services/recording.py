@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from ..config import get_settings
+from ..utils import metrics
+
+# -------------------------------------------------
+# Upstream record / replay
+# -------------------------------------------------
+# DEESHA_UPSTREAM_MODE=record  every upstream call (Places New, Routes, legacy Places)
+#                              is appended to <cassette_dir>/upstream-<pid>.jsonl.gz,
+#                              and every inbound API request to inbound-<pid>.jsonl.gz
+# DEESHA_UPSTREAM_MODE=replay  upstream calls are answered from the cassettes by request
+#                              fingerprint; nothing goes to Google. With
+#                              DEESHA_REPLAY_LATENCY=recorded (default) each answer waits
+#                              as long as the original call took; `zero` answers at once.
+#
+# scripts/replay_traffic.py feeds the recorded inbound requests back through the app
+# in replay mode and reports CPU time and latency, so two builds can be compared on
+# the same traffic.
+#
+# Fingerprints ignore credentials (X-Goog-Api-Key, `key=`) and session tokens, which
+# change between runs without changing the answer.
+
+MODES = ("live", "record", "replay")
+_IGNORED_PARAMS = {"key", "sessionToken", "sessiontoken"}
+_IGNORED_BODY_KEYS = {"sessionToken"}
+
+
+def fingerprint(
+    method: str,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    body: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> str:
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query) if k not in _IGNORED_PARAMS)
+    query += sorted((str(k), str(v)) for k, v in (params or {}).items() if k not in _IGNORED_PARAMS)
+    canonical_url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ""))
+    canonical_body = {k: v for k, v in (body or {}).items() if k not in _IGNORED_BODY_KEYS}
+    field_mask = (headers or {}).get("X-Goog-FieldMask", "")
+    raw = json.dumps([method.upper(), canonical_url, canonical_body, field_mask], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _append_gz(path: str, lock: threading.Lock, record: Dict[str, Any]) -> None:
+    line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+    with lock:
+        # Each append is its own gzip member; gzip readers concatenate them.
+        with gzip.open(path, "ab") as f:
+            f.write(line)
+
+
+def _read_gz_lines(pattern: str) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for path in sorted(glob.glob(pattern)):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    out.append(json.loads(line))
+    return out
+
+
+class CassetteStore:
+    def __init__(self, directory: str, mode: str, replay_latency: str = "recorded"):
+        self.directory = directory
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._served: Dict[str, int] = {}
+        pid = os.getpid()
+        self.upstream_path = os.path.join(directory, f"upstream-{pid}.jsonl.gz")
+        self.inbound_path = os.path.join(directory, f"inbound-{pid}.jsonl.gz")
+        if mode == "record":
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    # ---- record ----
+    def record(self, fp: str, name: str, status: Optional[int], latency_s: float, payload: Dict[str, Any]) -> None:
+        entry = {"fp": fp, "m": name, "s": status, "ms": round(latency_s * 1000.0, 1)}
+        entry.update(payload)
+        _append_gz(self.upstream_path, self._lock, entry)
+
+    def record_inbound(self, method: str, path: str, query: str, body: bytes) -> None:
+        _append_gz(
+            self.inbound_path,
+            self._lock,
+            {"t": time.time(), "method": method, "path": path, "query": query, "body": body.decode("utf-8", "replace")},
+        )
+
+    # ---- replay ----
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    entries: Dict[str, List[Dict[str, Any]]] = {}
+                    for e in _read_gz_lines(os.path.join(self.directory, "upstream-*.jsonl.gz")):
+                        entries.setdefault(e["fp"], []).append(e)
+                    self._entries = entries
+        return self._entries
+
+    def lookup(self, fp: str) -> Optional[Dict[str, Any]]:
+        """Next recorded response for `fp` (repeats of one call replay in recorded order)."""
+        recorded = self._load().get(fp)
+        if not recorded:
+            return None
+        with self._lock:
+            i = self._served.get(fp, 0)
+            self._served[fp] = i + 1
+        return recorded[min(i, len(recorded) - 1)]
+
+    def wait(self, entry: Dict[str, Any]) -> None:
+        if self.replay_latency == "recorded":
+            time.sleep(float(entry.get("ms") or 0.0) / 1000.0)
+
+
+_store: Optional[CassetteStore] = None
+_store_loaded = False
+_store_lock = threading.Lock()
+
+
+def active_store() -> Optional[CassetteStore]:
+    """The cassette store for record/replay mode, or None when calls go live unrecorded."""
+    global _store, _store_loaded
+    if not _store_loaded:
+        with _store_lock:
+            if not _store_loaded:
+                s = get_settings()
+                if s.upstream_mode in ("record", "replay"):
+                    _store = CassetteStore(s.cassette_dir, s.upstream_mode, s.replay_latency)
+                _store_loaded = True
+    return _store
+
+
+def load_inbound(directory: str) -> List[Dict[str, Any]]:
+    """Recorded inbound requests from every inbound-*.jsonl.gz in `directory`, oldest first."""
+    items = _read_gz_lines(os.path.join(directory, "inbound-*.jsonl.gz"))
+    return sorted(items, key=lambda r: r.get("t", 0.0))
+
+
+class InboundRecorderMiddleware:
+    """In record mode, log each API request (method, path, query, body) for later replay."""
+
+    def __init__(self, app, skip_prefixes=("/metrics", "/health", "/ready", "/debug", "/static")):
+        self.app = app
+        self.skip_prefixes = tuple(skip_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        store = active_store()
+        if scope["type"] != "http" or store is None or store.mode != "record" or scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        messages: List[dict] = []
+        if scope["method"] in ("POST", "PUT", "PATCH"):
+            while True:
+                message = await receive()
+                messages.append(message)
+                if message["type"] != "http.request" or not message.get("more_body", False):
+                    break
+        body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.request")
+        store.record_inbound(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"), body)
+        metrics.inc("recording_inbound_total")
+
+        async def replay_receive():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        await self.app(scope, replay_receive, send)
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from anyio import to_thread
+from fastapi.routing import APIRoute
+
+from ..utils import metrics
+
+logger = logging.getLogger("deesha")
+
+# -------------------------------------------------
+# Threadpool saturation + event-loop lag
+# -------------------------------------------------
+# Sync `def` handlers (and sync dependencies) run on anyio's default thread limiter and
+# block there on `requests` calls. When every token is borrowed, new requests wait for
+# a thread before their handler starts, and nothing else shows it. This module samples:
+#
+#   occupancy   — borrowed / total tokens of the limiter, and tasks waiting for one
+#                 (sampled every `interval_s`, so /debug/runtime can report peaks)
+#   queue wait  — time from the request reaching the app (RuntimeMonitorMiddleware,
+#                 innermost, i.e. after admission) to its sync handler starting on a
+#                 worker thread (routes built with `route_class(monitor)`)
+#   loop lag    — how late a `sleep(interval_s)` on the event loop wakes up; large
+#                 values mean something blocks the loop itself
+#
+# Pool size comes from DEESHA_THREADPOOL_SIZE (anyio's default is 40). Values are per
+# process, like every other metric.
+
+# perf_counter() when the current request reached the app; copied into worker threads
+_received_at: ContextVar[Optional[float]] = ContextVar("deesha_received_at", default=None)
+LAG_WARN_S = 0.5
+LAG_WARN_EVERY_S = 10.0
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    def r(v: Optional[float]) -> Optional[float]:
+        return None if v is None else round(v, 4)
+
+    return {
+        "count": len(values),
+        "p50": r(_percentile(values, 0.5)),
+        "p95": r(_percentile(values, 0.95)),
+        "max": r(max(values) if values else None),
+    }
+
+
+class RuntimeMonitor:
+    def __init__(self, threadpool_size: int = 40, interval_s: float = 0.25, window_s: float = 60.0):
+        self.threadpool_size = max(1, threadpool_size)
+        self.interval_s = interval_s
+        self.window_s = window_s
+        self._lock = threading.Lock()
+        # (t, loop_lag_s, in_use, waiting)
+        self._samples: Deque[Tuple[float, float, int, int]] = deque()
+        # (t, queue_wait_s)
+        self._waits: Deque[Tuple[float, float]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        # Captured in start(): the limiter is per event loop and /metrics runs on a worker thread.
+        self._limiter: Optional[Any] = None
+        self._last_warn = 0.0
+        metrics.register_collector(self._collect)
+
+    # --- lifecycle (call from the lifespan, inside the event loop) ---
+
+    def start(self) -> None:
+        limiter = to_thread.current_default_thread_limiter()
+        if limiter.total_tokens != self.threadpool_size:
+            logger.info("Threadpool size %d → %d", limiter.total_tokens, self.threadpool_size)
+            limiter.total_tokens = self.threadpool_size
+        self._limiter = limiter
+        self._task = asyncio.get_running_loop().create_task(self._sample_loop(), name="deesha-runtime-monitor")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- sampling ---
+
+    def pool_stats(self) -> Dict[str, int]:
+        if self._limiter is None:
+            return {}
+        stats = self._limiter.statistics()
+        return {"size": int(stats.total_tokens), "in_use": stats.borrowed_tokens, "waiting": stats.tasks_waiting}
+
+    async def _sample_loop(self) -> None:
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            lag = max(0.0, time.perf_counter() - t0 - self.interval_s)
+            self._record_sample(lag)
+
+    def _record_sample(self, lag: float) -> None:
+        now = time.time()
+        pool = self.pool_stats()
+        in_use, waiting = pool.get("in_use", 0), pool.get("waiting", 0)
+        metrics.observe("event_loop_lag_seconds", lag)
+        if pool and in_use >= pool["size"]:
+            metrics.inc("threadpool_saturated_samples_total")
+        with self._lock:
+            self._samples.append((now, lag, in_use, waiting))
+            self._trim(self._samples, now)
+        if lag >= LAG_WARN_S and now - self._last_warn >= LAG_WARN_EVERY_S:
+            self._last_warn = now
+            logger.warning("Event loop lagged %.0f ms (threadpool %d/%d busy, %d waiting)",
+                           lag * 1000, in_use, pool.get("size", 0), waiting)
+
+    def _trim(self, d: Deque, now: float) -> None:
+        while d and now - d[0][0] > self.window_s:
+            d.popleft()
+
+    # --- queue wait ---
+
+    def mark_handler_start(self) -> None:
+        """Called on the worker thread right before a sync handler runs."""
+        received = _received_at.get()
+        if received is None:
+            return
+        wait = max(0.0, time.perf_counter() - received)
+        metrics.observe("threadpool_queue_wait_seconds", wait)
+        now = time.time()
+        with self._lock:
+            self._waits.append((now, wait))
+            self._trim(self._waits, now)
+
+    # --- reporting ---
+
+    def _collect(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        pool = self.pool_stats()
+        if pool:
+            yield "threadpool_size", {}, pool["size"]
+            yield "threadpool_in_use", {}, pool["in_use"]
+            yield "threadpool_waiting", {}, pool["waiting"]
+        with self._lock:
+            samples = list(self._samples)
+        if samples:
+            yield "threadpool_in_use_peak", {}, max(s[2] for s in samples)
+            yield "event_loop_lag_max_seconds", {}, max(s[1] for s in samples)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self._samples)
+            waits = [w for _, w in self._waits]
+        pool = self.pool_stats()
+        size = pool.get("size") or self.threadpool_size
+        in_use = [s[2] for s in samples]
+        return {
+            "window_s": self.window_s,
+            "interval_s": self.interval_s,
+            "running": self._task is not None and not self._task.done(),
+            "threadpool": {
+                **pool,
+                "peak_in_use": max(in_use) if in_use else None,
+                "peak_waiting": max((s[3] for s in samples), default=None),
+                "saturated_share": round(sum(1 for n in in_use if n >= size) / len(in_use), 3) if in_use else None,
+            },
+            "queue_wait_s": _summary(waits),
+            "event_loop_lag_s": _summary([s[1] for s in samples]),
+        }
+
+
+def route_class(monitor: RuntimeMonitor) -> type:
+    """APIRoute subclass whose sync endpoints report their queue wait to `monitor`.
+
+    FastAPI reads the endpoint signature through `functools.wraps`, so parameters and
+    dependencies are unchanged; async endpoints are left alone.
+    """
+
+    def timed(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(endpoint)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            monitor.mark_handler_start()
+            return endpoint(*args, **kwargs)
+
+        return wrapper
+
+    class ThreadpoolTimedRoute(APIRoute):
+        def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+            if not inspect.iscoroutinefunction(endpoint):
+                endpoint = timed(endpoint)
+            super().__init__(path, endpoint, **kwargs)
+
+    return ThreadpoolTimedRoute
+
+
+class RuntimeMonitorMiddleware:
+    """Stamps when a request reaches the app; keep it innermost so admission waits are excluded."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _received_at.set(time.perf_counter())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _received_at.reset(token)
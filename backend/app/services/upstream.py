@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException
+
+from . import circuit_breaker, priority, recording
+from ..utils import metrics
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# -------------------------------------------------
+# Shared HTTP client for every Google call
+# -------------------------------------------------
+# `requests` is imported on first use, not at app import: it is the single most
+# expensive import on the cold-start path and /health never needs it. One pooled
+# Session is shared by all threads so upstream calls reuse TLS connections.
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+
+                _session = requests.Session()
+    return _session
+
+
+# -------------------------------------------------
+# Upstream method names (metrics labels)
+# -------------------------------------------------
+def upstream_method(method: str, url: str) -> str:
+    """Short, low-cardinality name for an upstream call, e.g. "places:searchNearby"."""
+    parts = urlsplit(url)
+    host, path = parts.netloc, parts.path
+    if host.startswith("routes."):
+        return "routes:" + path.rsplit(":", 1)[-1]
+    if host.startswith("places."):
+        if ":" in path.rsplit("/", 1)[-1]:
+            return "places:" + path.rsplit(":", 1)[-1]
+        return "places:details"
+    if host.startswith("maps.") and "/place/" in path:
+        # Legacy Places API, e.g. /maps/api/place/autocomplete/json
+        return "legacy:" + path.split("/place/", 1)[1].split("/", 1)[0]
+    return f"{method.lower()}:{host}"
+
+
+# -------------------------------------------------
+# Cooperative cancellation
+# -------------------------------------------------
+class UpstreamCancelled(Exception):
+    """Raised instead of sending an upstream call whose result nobody will use."""
+
+
+class CancelToken:
+    """Thread-safe flag checked before every upstream call made under it.
+
+    Cancelling cannot interrupt a call that is already on the wire; it stops every
+    call that has not been sent yet, including ones queued on the fan-out pool.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+_cancel_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("upstream_cancel_token", default=None)
+
+
+@contextmanager
+def cancellable(token: CancelToken) -> Iterator[CancelToken]:
+    """Make upstream calls in this context (and fan-outs started from it) honour `token`."""
+    reset = _cancel_token.set(token)
+    try:
+        yield token
+    finally:
+        _cancel_token.reset(reset)
+
+
+def raise_if_cancelled(name: str = "") -> None:
+    token = _cancel_token.get()
+    if token is not None and token.cancelled:
+        metrics.inc("upstream_calls_cancelled_total", method=name or "unknown", reason=token.reason or "cancelled")
+        raise UpstreamCancelled(token.reason or "cancelled")
+
+
+# -------------------------------------------------
+# Per-context call counting
+# -------------------------------------------------
+class CallBudgetSpent(Exception):
+    """A call was about to be sent under a CallCounter whose `limit` is already spent."""
+
+
+class CallCounter:
+    """Counts the upstream calls sent under it (see counting_calls).
+
+    With a `limit`, the call that would exceed it raises CallBudgetSpent instead of going out.
+    """
+
+    def __init__(self, limit: Optional[int] = None) -> None:
+        self._lock = threading.Lock()
+        self.limit = limit
+        self.calls = 0
+
+    def add(self) -> None:
+        with self._lock:
+            if self.limit is not None and self.calls >= self.limit:
+                raise CallBudgetSpent()
+            self.calls += 1
+
+    def remaining(self) -> Optional[int]:
+        with self._lock:
+            return None if self.limit is None else max(0, self.limit - self.calls)
+
+
+_call_counter: contextvars.ContextVar[Optional[CallCounter]] = contextvars.ContextVar("upstream_call_counter", default=None)
+
+
+@contextmanager
+def counting_calls(counter: CallCounter) -> Iterator[CallCounter]:
+    """Count upstream calls in this context (and fan-outs started from it) on `counter`."""
+    reset = _call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _call_counter.reset(reset)
+
+
+def calls_left() -> Optional[int]:
+    """Calls left under the current context's counter limit (None when unlimited)."""
+    counter = _call_counter.get()
+    return None if counter is None else counter.remaining()
+
+
+# -------------------------------------------------
+# Recent upstream latency (drives load shedding in services/admission.py)
+# -------------------------------------------------
+LATENCY_EWMA_ALPHA = 0.2
+_latency_lock = threading.Lock()
+_latency_ewma: float | None = None
+_latency_updated_at = 0.0
+
+
+def _record_latency(seconds: float) -> None:
+    global _latency_ewma, _latency_updated_at
+    with _latency_lock:
+        if _latency_ewma is None:
+            _latency_ewma = seconds
+        else:
+            _latency_ewma += LATENCY_EWMA_ALPHA * (seconds - _latency_ewma)
+        _latency_updated_at = time.monotonic()
+
+
+def recent_latency(max_age_s: float = 30.0) -> float | None:
+    """EWMA of upstream call latency in seconds, or None if no call finished in `max_age_s`."""
+    with _latency_lock:
+        if _latency_ewma is None or time.monotonic() - _latency_updated_at > max_age_s:
+            return None
+        return _latency_ewma
+
+
+def request_json(
+    method: str,
+    url: str,
+    *,
+    json: Optional[Dict[str, Any]] = None,
+    params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 12,
+    error_label: Optional[str] = None,
+) -> Any:
+    """Send one upstream request and return the parsed JSON body.
+
+    Network failures and non-JSON bodies raise 502. When `error_label` is given
+    (e.g. "Google Places"), HTTP >= 400 responses also raise 502 with that label;
+    otherwise the body is returned as-is (legacy endpoints inspect it themselves).
+    Raises UpstreamCancelled without sending when the current CancelToken is set, and
+    CircuitOpen (503) when the method's circuit breaker is open.
+    In record/replay mode (services/recording.py) the exchange is recorded to, or
+    answered from, the cassette files.
+    """
+    name = upstream_method(method, url)
+    raise_if_cancelled(name)
+
+    store = recording.active_store()
+    fp = recording.fingerprint(method, url, params, json, headers) if store is not None else ""
+
+    replaying = store is not None and store.replaying
+    breaker = None if replaying else circuit_breaker.breaker(name)
+
+    # Wait for a slot of this request's priority class (services/priority.py) first, so
+    # a breaker probe is never held up in the queue.
+    with priority.scheduler().slot(lambda: raise_if_cancelled(name)):
+        counter = _call_counter.get()
+        if counter is not None:
+            counter.add()  # raises CallBudgetSpent past the counter's limit, before the breaker
+        if breaker is not None:
+            breaker.before_call()  # raises CircuitOpen (503) while the method is failing
+
+        metrics.inc("upstream_calls_total", method=name)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            if replaying:
+                status, data = _replay(store, fp, name)
+            else:
+                status, data = _send_live(method, url, json, params, headers, timeout, name, store, fp)
+            ok = status < 500 and status != 429
+        finally:
+            elapsed = time.perf_counter() - t0
+            metrics.observe("upstream_latency_seconds", elapsed, method=name)
+            _record_latency(elapsed)
+            if breaker is not None:
+                breaker.record(ok, elapsed)
+
+    if status >= 400:
+        metrics.inc("upstream_errors_total", method=name, kind=f"http_{status}")
+    if error_label and status >= 400:
+        raise HTTPException(status_code=502, detail=f"{error_label} error: {data}")
+
+    return data
+
+
+def _send_live(
+    method: str,
+    url: str,
+    json: Optional[Dict[str, Any]],
+    params: Optional[Dict[str, Any]],
+    headers: Optional[Dict[str, str]],
+    timeout: float,
+    name: str,
+    store: Optional[recording.CassetteStore],
+    fp: str,
+) -> Tuple[int, Any]:
+    import requests
+
+    t0 = time.perf_counter()
+    try:
+        r = _get_session().request(method, url, json=json, params=params, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        metrics.inc("upstream_errors_total", method=name, kind="network")
+        if store is not None:
+            store.record(fp, name, None, time.perf_counter() - t0, {"error": str(e)})
+        raise HTTPException(status_code=502, detail=f"Google request failed: {e}")
+    elapsed = time.perf_counter() - t0
+
+    try:
+        data = r.json()
+    except ValueError:
+        metrics.inc("upstream_errors_total", method=name, kind="non_json")
+        if store is not None:
+            store.record(fp, name, r.status_code, elapsed, {"non_json": True})
+        raise HTTPException(status_code=502, detail="Google returned non-JSON response")
+
+    if store is not None:
+        store.record(fp, name, r.status_code, elapsed, {"json": data})
+    return r.status_code, data
+
+
+def _replay(store: recording.CassetteStore, fp: str, name: str) -> Tuple[int, Any]:
+    entry = store.lookup(fp)
+    if entry is None:
+        metrics.inc("upstream_replay_misses_total", method=name)
+        raise HTTPException(status_code=502, detail=f"No recorded upstream response for {name} (replay mode)")
+    store.wait(entry)
+    metrics.inc("upstream_replayed_total", method=name)
+
+    if "error" in entry:
+        metrics.inc("upstream_errors_total", method=name, kind="network")
+        raise HTTPException(status_code=502, detail=f"Google request failed: {entry['error']}")
+    if entry.get("non_json"):
+        metrics.inc("upstream_errors_total", method=name, kind="non_json")
+        raise HTTPException(status_code=502, detail="Google returned non-JSON response")
+    return int(entry.get("s") or 200), entry.get("json")
+
+
+# -------------------------------------------------
+# Fan-out helper for independent upstream calls
+# -------------------------------------------------
+FANOUT_WORKERS = 16
+
+# One pool per priority class (services/priority.py), each as large as the class's
+# upstream limit: a batch queueing hundreds of background calls never holds the
+# workers an interactive fan-out needs.
+_fanout_pools: Dict[str, ThreadPoolExecutor] = {}
+_fanout_local = threading.local()
+
+
+def _get_fanout_pool() -> ThreadPoolExecutor:
+    name = priority.current_priority()
+    pool = _fanout_pools.get(name)
+    if pool is None:
+        with _session_lock:
+            pool = _fanout_pools.get(name)
+            if pool is None:
+                workers = min(FANOUT_WORKERS, priority.scheduler().limit(name))
+                pool = _fanout_pools[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"upstream-fanout-{name}")
+    return pool
+
+
+def _run_in_fanout(ctx: contextvars.Context, fn: Callable[[T], R], item: T) -> R:
+    _fanout_local.active = True
+    try:
+        return ctx.run(fn, item)
+    finally:
+        _fanout_local.active = False
+
+
+def map_concurrent(fn: Callable[[T], R], items: Iterable[T]) -> List[R]:
+    """Run `fn` over `items` on the fan-out pool of the current priority class; results keep input order.
+
+    Each call runs in a copy of the caller's context (contextvars carry request-scoped
+    state into the worker threads). Called from inside a fan-out worker it runs
+    sequentially instead, so nested fan-out can never deadlock the pool. The first
+    exception raised by `fn` propagates to the caller.
+    """
+    items = list(items)
+    if len(items) <= 1 or getattr(_fanout_local, "active", False):
+        return [fn(item) for item in items]
+
+    pool = _get_fanout_pool()
+    futures = [pool.submit(_run_in_fanout, contextvars.copy_context(), fn, item) for item in items]
+    return [f.result() for f in futures]
+
+
+def iter_concurrent(fn: Callable[[T], R], items: Iterable[T], max_in_flight: int = FANOUT_WORKERS) -> Iterator[Tuple[int, R]]:
+    """Like map_concurrent, but yields (index, result) as each call finishes.
+
+    At most `max_in_flight` calls are queued on the pool at once, so one long batch
+    leaves workers free for other requests. Calls not yet started are cancelled if
+    the consumer stops early.
+    """
+    items = list(items)
+    if len(items) <= 1 or getattr(_fanout_local, "active", False):
+        for i, item in enumerate(items):
+            yield i, fn(item)
+        return
+
+    pool = _get_fanout_pool()
+    pending: Dict[Future, int] = {}
+    next_i = 0
+    try:
+        while next_i < len(items) or pending:
+            while next_i < len(items) and len(pending) < max(1, max_in_flight):
+                ctx = contextvars.copy_context()
+                pending[pool.submit(_run_in_fanout, ctx, fn, items[next_i])] = next_i
+                next_i += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                yield pending.pop(f), f.result()
+    finally:
+        for f in pending:
+            f.cancel()
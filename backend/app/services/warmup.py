@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from ..utils import metrics
+from . import upstream
+from .priority import priority
+
+logger = logging.getLogger("deesha")
+
+# -------------------------------------------------
+# Cache warm-up for popular corridors
+# -------------------------------------------------
+# After a deploy every cache is empty, so the first users on the busiest city pairs
+# pay for geocoding, routing and every searchNearby circle. The warm-up job walks a
+# list of corridors through the normal code paths (so the normal caches fill) before
+# the instance reports ready on GET /ready.
+#
+# Corridors come from a JSON file:
+#     [{"start": "Dallas, TX", "destination": "Austin, TX", "moods": ["scenic", "food"]},
+#      {"start": [32.78, -96.80], "destination": [30.27, -97.74]}]
+# or, with DEESHA_WARMUP_CORRIDORS=traffic, from the most frequent corridors in the
+# recorded inbound traffic (see services/recording.py).
+#
+# The job stops once it has spent `budget` upstream calls of its own (live traffic
+# served meanwhile does not count). The budget is checked on every call, so a step that
+# fans out cannot overshoot it; steps that take a call cap get the calls left
+# (upstream.calls_left()). Coverage is the share of
+# corridors whose every step succeeded; /ready passes once coverage reaches the target
+# (or once `max_wait_s` has passed, so an upstream outage cannot keep every new
+# instance out of rotation).
+
+Endpoint = Union[str, Tuple[float, float]]
+DEFAULT_MOODS: Tuple[str, ...] = ("scenic",)
+
+
+@dataclass(frozen=True)
+class Corridor:
+    start: Endpoint
+    destination: Endpoint
+    moods: Tuple[str, ...] = DEFAULT_MOODS
+
+    def label(self) -> str:
+        def fmt(e: Endpoint) -> str:
+            return e if isinstance(e, str) else f"{e[0]:.3f},{e[1]:.3f}"
+
+        return f"{fmt(self.start)} → {fmt(self.destination)}"
+
+
+def _endpoint(raw: Any) -> Optional[Endpoint]:
+    if isinstance(raw, str) and raw.strip():
+        return raw.strip()
+    if isinstance(raw, (list, tuple)) and len(raw) == 2:
+        return (float(raw[0]), float(raw[1]))
+    if isinstance(raw, dict) and raw.get("lat") is not None and raw.get("lng") is not None:
+        return (float(raw["lat"]), float(raw["lng"]))
+    return None
+
+
+def load_corridors(path: str) -> List[Corridor]:
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    out: List[Corridor] = []
+    for item in raw:
+        start, dest = _endpoint(item.get("start")), _endpoint(item.get("destination"))
+        if start is None or dest is None:
+            continue
+        moods = tuple(m.strip().lower() for m in (item.get("moods") or DEFAULT_MOODS) if m and m.strip())
+        out.append(Corridor(start, dest, moods or DEFAULT_MOODS))
+    return out
+
+
+def corridors_from_traffic(items: List[Dict[str, Any]], top: int = 20) -> List[Corridor]:
+    """Most frequent corridors in recorded inbound requests (/plan-trip, /places/things-to-do)."""
+
+    def key(e: Endpoint) -> Endpoint:
+        return e.lower() if isinstance(e, str) else (round(e[0], 3), round(e[1], 3))
+
+    counts: Counter = Counter()
+    endpoints: Dict[tuple, Tuple[Endpoint, Endpoint]] = {}
+    moods: Dict[tuple, Counter] = {}
+
+    def add(start: Optional[Endpoint], dest: Optional[Endpoint], mood: Optional[str]) -> None:
+        if start is None or dest is None:
+            return
+        k = (key(start), key(dest))
+        counts[k] += 1
+        endpoints.setdefault(k, (start, dest))
+        if mood:
+            moods.setdefault(k, Counter())[mood.strip().lower()] += 1
+
+    for item in items:
+        try:
+            body = json.loads(item.get("body") or "{}")
+        except ValueError:
+            continue
+        path = item.get("path")
+        if path == "/places/things-to-do":
+            add(_endpoint(body.get("start")), _endpoint(body.get("destination")), body.get("mood") or "scenic")
+        elif path in ("/plan-trip", "/plan-trip/batch"):
+            for trip in body.get("trips") or [body]:
+                start = _endpoint([trip["start_lat"], trip["start_lng"]]) if trip.get("start_lat") is not None else None
+                dest = _endpoint([trip["destination_lat"], trip["destination_lng"]]) if trip.get("destination_lat") is not None else None
+                add(start or _endpoint(trip.get("start_city")), dest or _endpoint(trip.get("destination")), None)
+
+    out: List[Corridor] = []
+    for k, _ in counts.most_common(max(0, top)):
+        start, dest = endpoints[k]
+        corridor_moods = tuple(m for m, _ in moods[k].most_common(3)) if k in moods else DEFAULT_MOODS
+        out.append(Corridor(start, dest, corridor_moods))
+    return out
+
+
+# Raised by step() before a step, and by upstream.request_json on the call past the budget.
+BudgetExhausted = upstream.CallBudgetSpent
+
+
+@dataclass
+class WarmupState:
+    target: float = 0.8
+    max_wait_s: float = 120.0
+    status: str = "idle"  # idle | running | done | failed
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    report: Dict[str, Any] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def coverage(self) -> float:
+        total = self.report.get("corridors", 0)
+        return self.report.get("corridors_warmed", 0) / total if total else 1.0
+
+    def ready(self) -> bool:
+        if self.status == "idle":
+            return True  # no warm-up configured
+        if self.coverage() >= self.target:
+            return True
+        return self.started_at is not None and time.time() - self.started_at >= self.max_wait_s
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "status": self.status,
+                "ready": self.ready(),
+                "coverage": round(self.coverage(), 3),
+                "target": self.target,
+                **self.report,
+            }
+
+
+# warm(corridor, step): runs each step through `step(kind, fn)`, which returns fn()'s
+# result, or None if the step failed, and raises BudgetExhausted once the budget is spent.
+Step = Callable[[str, Callable[[], Any]], Any]
+WarmFn = Callable[[Corridor, Step], None]
+
+
+def run_warmup(corridors: List[Corridor], warm: WarmFn, budget: int, state: WarmupState) -> Dict[str, Any]:
+    """Warm every corridor in order until `budget` upstream calls are spent; fills `state.report`."""
+    state.status = "running"
+    state.started_at = time.time()
+    counter = upstream.CallCounter(limit=budget)
+    steps: Dict[str, Dict[str, int]] = {}
+    report = state.report
+    report.update(
+        {"corridors": len(corridors), "corridors_warmed": 0, "corridors_partial": 0, "corridors_skipped": 0,
+         "steps": steps, "upstream_calls": 0, "budget": budget, "failed": []}
+    )
+
+    def used() -> int:
+        return counter.calls
+
+    for i, corridor in enumerate(corridors):
+        if used() >= budget:
+            with state._lock:
+                report["corridors_skipped"] = len(corridors) - i
+            break
+        ok = True
+
+        def step(kind: str, fn: Callable[[], Any]) -> Any:
+            nonlocal ok
+            if used() >= budget:
+                raise BudgetExhausted()
+            counts = steps.setdefault(kind, {"ok": 0, "failed": 0})
+            try:
+                result = fn()
+            except BudgetExhausted:
+                raise
+            except Exception as e:
+                result = None
+                detail = getattr(e, "detail", None) or repr(e)
+                report["failed"].append({"corridor": corridor.label(), "step": kind, "error": str(detail)[:200]})
+            with state._lock:
+                counts["ok" if result is not None else "failed"] += 1
+            ok = ok and result is not None
+            metrics.inc("warmup_steps_total", kind=kind, outcome="ok" if result is not None else "failed")
+            return result
+
+        try:
+            with upstream.counting_calls(counter):
+                warm(corridor, step)
+        except BudgetExhausted:
+            ok = False
+        with state._lock:
+            report["corridors_warmed" if ok else "corridors_partial"] += 1
+            report["upstream_calls"] = used()
+
+    with state._lock:
+        report["upstream_calls"] = used()
+        report["elapsed_s"] = round(time.time() - state.started_at, 2)
+        state.finished_at = time.time()
+        state.status = "done"
+    metrics.set_gauge("warmup_coverage", state.coverage())
+    return report
+
+
+def start_warmup_thread(corridors: List[Corridor], warm: WarmFn, budget: int, state: WarmupState) -> threading.Thread:
+    def run() -> None:
+        try:
+            with priority("background"):
+                report = run_warmup(corridors, warm, budget, state)
+            logger.info(
+                "Warm-up done: %d/%d corridors, %d upstream calls, coverage %.0f%%",
+                report["corridors_warmed"], report["corridors"], report["upstream_calls"], state.coverage() * 100,
+            )
+        except Exception:
+            state.status = "failed"
+            logger.exception("Warm-up failed")
+
+    t = threading.Thread(target=run, name="deesha-warmup", daemon=True)
+    t.start()
+    return t
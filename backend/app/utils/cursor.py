@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import zlib
+from typing import Any, Dict
+
+# -------------------------------------------------
+# Opaque pagination cursors
+# -------------------------------------------------
+# A cursor is the state needed to serve the next page (JSON → zlib → base64url), so
+# the server keeps nothing between pages. The state decides how many upstream calls
+# the next page makes, so cursors are signed (HMAC-SHA256 with a server secret) and a
+# cursor the server did not issue is rejected; callers still validate the fields.
+
+CURSOR_VERSION = 2
+_SIG_BYTES = 16
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode((text + "=" * (-len(text) % 4)).encode("ascii"))
+
+
+def _sign(body: str, secret: bytes) -> str:
+    return _b64(hmac.new(secret, body.encode("ascii"), hashlib.sha256).digest()[:_SIG_BYTES])
+
+
+def encode_cursor(state: Dict[str, Any], secret: bytes) -> str:
+    raw = json.dumps({"v": CURSOR_VERSION, **state}, separators=(",", ":")).encode("utf-8")
+    body = _b64(zlib.compress(raw, 9))
+    return f"{body}.{_sign(body, secret)}"
+
+
+def decode_cursor(cursor: str, secret: bytes) -> Dict[str, Any]:
+    """Inverse of encode_cursor. Raises ValueError for anything that is not a valid cursor."""
+    try:
+        body, sig = cursor.split(".", 1)
+        if not hmac.compare_digest(sig, _sign(body, secret)):
+            raise ValueError("bad signature")
+        state = json.loads(zlib.decompress(_unb64(body)))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(state, dict) or state.get("v") != CURSOR_VERSION:
+        raise ValueError("Invalid cursor")
+    return state
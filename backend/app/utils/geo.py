@@ -0,0 +1,446 @@
+from __future__ import annotations
+
+import bisect
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_M = 6371000.0
+
+# Places API (New) rejects searchNearby circles larger than this.
+MAX_SEARCH_RADIUS_M = 50000.0
+
+
+# -------------------------------------------------
+# Polyline + distance helpers
+# -------------------------------------------------
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distance in meters between two lat/lng points."""
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def decode_polyline(encoded: str) -> List[Dict[str, float]]:
+    """Decode Google encoded polyline to a list of {lat,lng}."""
+    if not encoded:
+        return []
+    idx = 0
+    lat = 0
+    lng = 0
+    coords: List[Dict[str, float]] = []
+
+    while idx < len(encoded):
+        shift = 0
+        result = 0
+        while True:
+            b = ord(encoded[idx]) - 63
+            idx += 1
+            result |= (b & 0x1F) << shift
+            shift += 5
+            if b < 0x20:
+                break
+        dlat = ~(result >> 1) if (result & 1) else (result >> 1)
+        lat += dlat
+
+        shift = 0
+        result = 0
+        while True:
+            b = ord(encoded[idx]) - 63
+            idx += 1
+            result |= (b & 0x1F) << shift
+            shift += 5
+            if b < 0x20:
+                break
+        dlng = ~(result >> 1) if (result & 1) else (result >> 1)
+        lng += dlng
+
+        coords.append({"lat": lat / 1e5, "lng": lng / 1e5})
+
+    return coords
+
+
+def encode_polyline(path: Sequence[Dict[str, float]]) -> str:
+    """Encode a list of {lat,lng} as a Google encoded polyline (inverse of decode_polyline)."""
+    out: List[str] = []
+    prev_lat = 0
+    prev_lng = 0
+    for p in path:
+        lat = int(round(p["lat"] * 1e5))
+        lng = int(round(p["lng"] * 1e5))
+        for delta in (lat - prev_lat, lng - prev_lng):
+            v = ~(delta << 1) if delta < 0 else (delta << 1)
+            while v >= 0x20:
+                out.append(chr((0x20 | (v & 0x1F)) + 63))
+                v >>= 5
+            out.append(chr(v + 63))
+        prev_lat, prev_lng = lat, lng
+    return "".join(out)
+
+
+def join_polylines(encoded: Sequence[str]) -> str:
+    """Concatenate encoded leg polylines into one, dropping the repeated point at each join."""
+    path: List[Dict[str, float]] = []
+    for enc in encoded:
+        pts = decode_polyline(enc)
+        if path and pts and pts[0] == path[-1]:
+            pts = pts[1:]
+        path.extend(pts)
+    return encode_polyline(path)
+
+
+def sample_route_points(path: List[Dict[str, float]], step_m: float = 20000.0, max_points: int = 8) -> List[Dict[str, float]]:
+    """Sample points along a polyline every ~step_m meters, capped at max_points."""
+    if not path:
+        return []
+
+    sampled = [path[0]]
+    acc = 0.0
+
+    for i in range(1, len(path)):
+        a = path[i - 1]
+        b = path[i]
+        acc += haversine_m(a["lat"], a["lng"], b["lat"], b["lng"])
+        if acc >= step_m:
+            sampled.append(b)
+            acc = 0.0
+            if len(sampled) >= max_points:
+                break
+
+    if len(sampled) < max_points and (path[-1] != sampled[-1]):
+        sampled.append(path[-1])
+
+    return sampled[:max_points]
+
+
+def point_at_distance(path: List[Dict[str, float]], target_m: float) -> Dict[str, float] | None:
+    """Return the lat/lng point along `path` at approximately `target_m` meters from the start."""
+    if not path:
+        return None
+    if target_m <= 0:
+        return path[0]
+
+    traveled = 0.0
+    for i in range(1, len(path)):
+        a = path[i - 1]
+        b = path[i]
+        seg = haversine_m(a["lat"], a["lng"], b["lat"], b["lng"])
+
+        if traveled + seg >= target_m:
+            remain = target_m - traveled
+            t = 0.0 if seg == 0 else max(0.0, min(1.0, remain / seg))
+            return {
+                "lat": a["lat"] + (b["lat"] - a["lat"]) * t,
+                "lng": a["lng"] + (b["lng"] - a["lng"]) * t,
+            }
+
+        traveled += seg
+
+    return path[-1]
+
+
+def path_length_m(path: List[Dict[str, float]]) -> float:
+    total = 0.0
+    for i in range(1, len(path)):
+        a = path[i - 1]
+        b = path[i]
+        total += haversine_m(a["lat"], a["lng"], b["lat"], b["lng"])
+    return total
+
+
+# -------------------------------------------------
+# Corridor coverage planning (searchNearby circles along a route)
+# -------------------------------------------------
+@dataclass(frozen=True)
+class CorridorWindow:
+    """A stretch of the route, in meters along the path, that should be searched."""
+
+    name: str
+    start_m: float
+    end_m: float
+    radius_m: float  # preferred search radius (corridor half-width)
+    max_radius_m: float = MAX_SEARCH_RADIUS_M
+
+
+@dataclass
+class SearchCircle:
+    window: str
+    lat: float
+    lng: float
+    radius_m: float
+    along_m: float
+    # Index (into the planned list) of an issued circle that already covers this one.
+    # Such circles cost no upstream call; they reuse that circle's results.
+    shared_with: Optional[int] = None
+
+
+def circle_overlap_fraction(a: SearchCircle, b: SearchCircle) -> float:
+    """Fraction of the smaller circle's area that lies inside the other circle."""
+    d = haversine_m(a.lat, a.lng, b.lat, b.lng)
+    r1, r2 = a.radius_m, b.radius_m
+    small = min(r1, r2)
+    if small <= 0:
+        return 1.0 if d <= max(r1, r2) else 0.0
+    if d >= r1 + r2:
+        return 0.0
+    if d <= abs(r1 - r2):
+        return 1.0
+
+    # Lens area of two intersecting circles
+    part1 = r1 * r1 * math.acos(max(-1.0, min(1.0, (d * d + r1 * r1 - r2 * r2) / (2 * d * r1))))
+    part2 = r2 * r2 * math.acos(max(-1.0, min(1.0, (d * d + r2 * r2 - r1 * r1) / (2 * d * r2))))
+    part3 = 0.5 * math.sqrt(max(0.0, (-d + r1 + r2) * (d + r1 - r2) * (d - r1 + r2) * (d + r1 + r2)))
+    lens = part1 + part2 - part3
+    return max(0.0, min(1.0, lens / (math.pi * small * small)))
+
+
+def _circles_needed(window: CorridorWindow) -> int:
+    """Minimum number of circles whose diameters cover the window's length."""
+    length = max(0.0, window.end_m - window.start_m)
+    max_r = max(window.radius_m, window.max_radius_m)
+    return max(1, math.ceil(length / (2.0 * max_r)))
+
+
+def corridor_circles_needed(windows: Sequence[CorridorWindow]) -> int:
+    """Circles plan_corridor_circles issues (before overlap dropping) with no budget cap."""
+    return sum(_circles_needed(w) for w in windows)
+
+
+def plan_corridor_circles(
+    path: List[Dict[str, float]],
+    windows: Sequence[CorridorWindow],
+    max_calls: int,
+    overlap_threshold: float = 0.8,
+) -> List[SearchCircle]:
+    """Choose the fewest searchNearby circles that cover each corridor window.
+
+    - Each window gets ceil(length / max diameter) circles, evenly spaced, with the
+      radius grown just enough (up to the window's max) to cover its share of the window.
+    - `max_calls` is a hard cap on issued circles. Every window gets one circle before any
+      window gets a second (windows earlier in the list win ties). A window that gets fewer
+      circles than it needs spreads them evenly at max radius and accepts gaps.
+    - A circle mostly covered by a larger issued circle is not issued: inside the same
+      window it is dropped, across windows it is marked `shared_with` that circle (shared
+      circles are returned after all issued ones).
+    """
+    if not path or not windows or max_calls < 1:
+        return []
+
+    needed = [_circles_needed(w) for w in windows]
+    alloc = [0] * len(windows)
+    budget = max_calls
+    while budget > 0 and any(alloc[i] < needed[i] for i in range(len(windows))):
+        for i in range(len(windows)):
+            if budget <= 0:
+                break
+            if alloc[i] < needed[i]:
+                alloc[i] += 1
+                budget -= 1
+
+    planned: List[SearchCircle] = []
+    for w, k, n in zip(windows, alloc, needed):
+        if k <= 0:
+            continue
+        length = max(0.0, w.end_m - w.start_m)
+        spacing = length / k
+        if k < n:
+            radius = w.max_radius_m
+        else:
+            radius = min(w.max_radius_m, max(w.radius_m, spacing / 2.0))
+
+        for j in range(k):
+            along = w.start_m + spacing * (j + 0.5)
+            pt = point_at_distance(path, along) or path[-1]
+            planned.append(SearchCircle(window=w.name, lat=pt["lat"], lng=pt["lng"], radius_m=radius, along_m=along))
+
+    # Larger circles are considered first so smaller ones can ride along on them.
+    issued: List[SearchCircle] = []
+    shared: List[tuple[SearchCircle, SearchCircle]] = []
+    for c in sorted(planned, key=lambda x: -x.radius_m):
+        for prev in issued:
+            if circle_overlap_fraction(c, prev) >= overlap_threshold:
+                if prev.window != c.window:
+                    shared.append((c, prev))
+                break
+        else:
+            issued.append(c)
+
+    # Issued circles keep plan order; shared circles follow and point back at them.
+    out = [c for c in planned if any(c is i for i in issued)]
+    for c, prev in shared:
+        c.shared_with = next(idx for idx, o in enumerate(out) if o is prev)
+        out.append(c)
+
+    return out
+
+
+# -------------------------------------------------
+# Cumulative route index (multi-day splitting)
+# -------------------------------------------------
+@dataclass
+class RouteIndex:
+    """A decoded route with cumulative meters and seconds at every polyline point.
+
+    Built once per route; positions along it are then found by bisection instead of
+    re-walking the polyline. Time within each leg is spread in proportion to distance,
+    so a slow leg stays slow, and each leg's meters are scaled to its road distance.
+    """
+
+    path: List[Dict[str, float]]
+    cum_m: List[float]
+    cum_s: List[float]
+    # Path index of each routed stop (start, every leg end)
+    stop_idx: List[int]
+
+    @classmethod
+    def from_route(cls, route: Dict[str, Any]) -> Optional["RouteIndex"]:
+        """Index a /routes-shaped dict; None without a usable polyline."""
+        legs = route.get("legs") or []
+        if legs and all(lg.get("polyline") for lg in legs):
+            parts = [(decode_polyline(lg["polyline"]), lg.get("distance_meters"), lg.get("duration_seconds")) for lg in legs]
+        else:
+            parts = [(decode_polyline(route.get("polyline") or ""), route.get("distance_meters"), route.get("duration_seconds"))]
+
+        path: List[Dict[str, float]] = []
+        cum_m: List[float] = []
+        cum_s: List[float] = []
+        stop_idx: List[int] = []
+        for pts, dist_m, dur_s in parts:
+            if not pts:
+                continue
+            if path and pts[0] == path[-1]:
+                pts = pts[1:]
+            if not path:
+                path, cum_m, cum_s = [pts[0]], [0.0], [0.0]
+                stop_idx.append(0)
+                pts = pts[1:]
+            seg = [0.0]
+            prev = path[-1]
+            for p in pts:
+                seg.append(seg[-1] + haversine_m(prev["lat"], prev["lng"], p["lat"], p["lng"]))
+                prev = p
+            geo_len = seg[-1]
+            m_scale = (dist_m / geo_len) if dist_m and geo_len > 0 else 1.0
+            s_per_m = (dur_s / geo_len) if dur_s and geo_len > 0 else 0.0
+            m0, s0 = cum_m[-1], cum_s[-1]
+            for p, d in zip(pts, seg[1:]):
+                path.append(p)
+                cum_m.append(m0 + d * m_scale)
+                cum_s.append(s0 + d * s_per_m)
+            stop_idx.append(len(path) - 1)
+        if len(path) < 2:
+            return None
+        return cls(path, cum_m, cum_s, stop_idx)
+
+    @property
+    def total_m(self) -> float:
+        return self.cum_m[-1]
+
+    @property
+    def total_s(self) -> float:
+        return self.cum_s[-1]
+
+    def stop_seconds(self) -> List[float]:
+        return [self.cum_s[i] for i in self.stop_idx]
+
+    def _locate(self, cum: List[float], value: float) -> Tuple[int, float]:
+        # (segment start index, fraction along the segment) for `value` on the `cum` axis
+        value = max(cum[0], min(value, cum[-1]))
+        i = max(1, bisect.bisect_left(cum, value))
+        i = min(i, len(cum) - 1)
+        span = cum[i] - cum[i - 1]
+        return i - 1, (0.0 if span <= 0 else (value - cum[i - 1]) / span)
+
+    def at_seconds(self, t_s: float) -> Dict[str, float]:
+        """The point reached after `t_s` seconds of driving, with its meters/seconds along the route."""
+        i, f = self._locate(self.cum_s, t_s)
+        a, b = self.path[i], self.path[i + 1]
+        return {
+            "lat": a["lat"] + (b["lat"] - a["lat"]) * f,
+            "lng": a["lng"] + (b["lng"] - a["lng"]) * f,
+            "along_m": self.cum_m[i] + (self.cum_m[i + 1] - self.cum_m[i]) * f,
+            "along_s": self.cum_s[i] + (self.cum_s[i + 1] - self.cum_s[i]) * f,
+        }
+
+    def slice_seconds(self, from_s: float, to_s: float) -> List[Dict[str, float]]:
+        """Polyline points driven between `from_s` and `to_s` (interpolated ends included)."""
+        a, b = self.at_seconds(from_s), self.at_seconds(to_s)
+        i0, _ = self._locate(self.cum_s, from_s)
+        i1, _ = self._locate(self.cum_s, to_s)
+        inner = [p for j, p in enumerate(self.path[i0 + 1 : i1 + 1], start=i0 + 1) if from_s < self.cum_s[j] < to_s]
+        return [{"lat": a["lat"], "lng": a["lng"]}, *inner, {"lat": b["lat"], "lng": b["lng"]}]
+
+
+# -------------------------------------------------
+# Geohash cells (local place index)
+# -------------------------------------------------
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lng: float, precision: int = 5) -> str:
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    out: List[str] = []
+    bits = 0
+    ch = 0
+    even = True  # even bits split longitude
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_GEOHASH_BASE32[ch])
+            bits = ch = 0
+    return "".join(out)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(height, width) of a cell in degrees."""
+    n = 5 * precision
+    return 180.0 / (1 << (n // 2)), 360.0 / (1 << ((n + 1) // 2))
+
+
+def geohash_circle_cells(lat: float, lng: float, radius_m: float, precision: int = 5) -> List[Tuple[str, bool]]:
+    """Cells a circle touches, each with whether the circle contains it completely."""
+    h, w = geohash_cell_size(precision)
+    dlat = radius_m / 111320.0
+    dlng = radius_m / max(1.0, 111320.0 * math.cos(math.radians(lat)))
+    i0, i1 = math.floor((max(-90.0, lat - dlat) + 90.0) / h), math.floor((min(90.0, lat + dlat) + 90.0) / h)
+    j0, j1 = math.floor((lng - dlng + 180.0) / w), math.floor((lng + dlng + 180.0) / w)
+    out: List[Tuple[str, bool]] = []
+    for i in range(i0, i1 + 1):
+        s_lat = i * h - 90.0
+        n_lat = min(90.0, s_lat + h)
+        for j in range(j0, j1 + 1):
+            w_lng = j * w - 180.0
+            e_lng = w_lng + w
+            # Nearest point of the cell to the center decides whether it is touched.
+            near_lat = min(max(lat, s_lat), n_lat)
+            near_lng = min(max(lng, w_lng), e_lng)
+            if haversine_m(lat, lng, near_lat, near_lng) > radius_m:
+                continue
+            inside = all(
+                haversine_m(lat, lng, a, b) <= radius_m
+                for a in (s_lat, n_lat)
+                for b in (w_lng, e_lng)
+            )
+            c_lng = (w_lng + w / 2 + 180.0) % 360.0 - 180.0
+            out.append((geohash_encode(s_lat + h / 2, c_lng, precision), inside))
+    return out
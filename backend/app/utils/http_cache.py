@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Optional
+
+from starlette.responses import Response
+
+# -------------------------------------------------
+# ETag / conditional GET helpers
+# -------------------------------------------------
+
+
+def json_bytes(data: Any) -> bytes:
+    """Compact JSON body, serialized once so it can be hashed and cached as-is."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value matches `etag` (weak comparison, `*` allowed)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def conditional_json(body: bytes, etag: str, if_none_match: Optional[str], cache_control: str) -> Response:
+    """200 with `body`, or an empty 304 when the client already holds this ETag."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# -------------------------------------------------
+# In-process metrics (counters, gauges, summaries)
+# -------------------------------------------------
+# Exposed by GET /metrics in Prometheus text format (or JSON). Values are per
+# process; with several uvicorn workers each worker reports its own.
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[LabelKey, float]] = {}
+_gauges: Dict[str, Dict[LabelKey, float]] = {}
+# name -> labels -> [count, sum, max]
+_summaries: Dict[str, Dict[LabelKey, List[float]]] = {}
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels: object) -> None:
+    """Increase a counter."""
+    k = _key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[k] = series.get(k, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels: object) -> None:
+    k = _key(labels)
+    with _lock:
+        _gauges.setdefault(name, {})[k] = float(value)
+
+
+def add_gauge(name: str, delta: float, **labels: object) -> None:
+    k = _key(labels)
+    with _lock:
+        series = _gauges.setdefault(name, {})
+        series[k] = series.get(k, 0.0) + delta
+
+
+def observe(name: str, value: float, **labels: object) -> None:
+    """Record one observation (count / sum / max) of e.g. a latency in seconds."""
+    k = _key(labels)
+    with _lock:
+        s = _summaries.setdefault(name, {}).get(k)
+        if s is None:
+            _summaries[name][k] = [1.0, value, value]
+        else:
+            s[0] += 1
+            s[1] += value
+            if value > s[2]:
+                s[2] = value
+
+
+def get_counter(name: str, **labels: object) -> float:
+    with _lock:
+        return _counters.get(name, {}).get(_key(labels), 0.0)
+
+
+def register_collector(fn: Callable[[], Iterable[Sample]]) -> None:
+    """Register a callback that yields (name, labels, value) gauge samples at scrape time."""
+    with _lock:
+        _collectors.append(fn)
+
+
+def _collected() -> Dict[str, Dict[LabelKey, float]]:
+    out: Dict[str, Dict[LabelKey, float]] = {}
+    for fn in list(_collectors):
+        for name, labels, value in fn():
+            out.setdefault(name, {})[_key(labels)] = float(value)
+    return out
+
+
+def snapshot() -> dict:
+    """JSON-friendly view of every metric."""
+
+    def series(d: Dict[LabelKey, float]) -> List[dict]:
+        return [{"labels": dict(k), "value": v} for k, v in sorted(d.items())]
+
+    with _lock:
+        counters = {n: series(s) for n, s in _counters.items()}
+        gauges = {n: series(s) for n, s in _gauges.items()}
+        summaries = {
+            n: [{"labels": dict(k), "count": v[0], "sum": v[1], "max": v[2]} for k, v in sorted(s.items())]
+            for n, s in _summaries.items()
+        }
+    for n, s in _collected().items():
+        gauges[n] = series(s)
+    return {"counters": counters, "gauges": gauges, "summaries": summaries}
+
+
+def _fmt_labels(k: LabelKey) -> str:
+    if not k:
+        return ""
+    inner = ",".join('{}="{}"'.format(name, v.replace("\\", "\\\\").replace('"', '\\"')) for name, v in k)
+    return "{" + inner + "}"
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    with _lock:
+        counters = {n: dict(s) for n, s in _counters.items()}
+        gauges = {n: dict(s) for n, s in _gauges.items()}
+        summaries = {n: {k: list(v) for k, v in s.items()} for n, s in _summaries.items()}
+    gauges.update(_collected())
+
+    for name in sorted(counters):
+        lines.append(f"# TYPE {name} counter")
+        for k, v in sorted(counters[name].items()):
+            lines.append(f"{name}{_fmt_labels(k)} {v:g}")
+    for name in sorted(gauges):
+        lines.append(f"# TYPE {name} gauge")
+        for k, v in sorted(gauges[name].items()):
+            lines.append(f"{name}{_fmt_labels(k)} {v:g}")
+    for name in sorted(summaries):
+        lines.append(f"# TYPE {name} summary")
+        for k, (count, total, _mx) in sorted(summaries[name].items()):
+            lines.append(f"{name}_count{_fmt_labels(k)} {count:g}")
+            lines.append(f"{name}_sum{_fmt_labels(k)} {total:g}")
+        # A summary family only allows _count/_sum (and quantiles): the max is its own gauge.
+        lines.append(f"# TYPE {name}_max gauge")
+        for k, (_count, _total, mx) in sorted(summaries[name].items()):
+            lines.append(f"{name}_max{_fmt_labels(k)} {mx:g}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """Clear recorded values (collectors stay registered)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _summaries.clear()
@@ -0,0 +1,167 @@
+"""Cold-start benchmark for the backend app.
+
+Each run starts a fresh interpreter and measures:
+  - import_ms:         `import app.main`
+  - startup_ms:        ASGI lifespan startup
+  - first_request_ms:  first GET /health through the ASGI app (no server, no network)
+
+Medians are compared against budgets and the run fails (exit 1) when one is exceeded.
+Use --history to append each result as a JSON line so regressions show up over time.
+
+Usage (from backend/):
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 10 --history bench_startup.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+DEFAULT_IMPORT_BUDGET_MS = float(os.getenv("DEESHA_IMPORT_BUDGET_MS", "450"))
+DEFAULT_FIRST_REQUEST_BUDGET_MS = float(os.getenv("DEESHA_FIRST_REQUEST_BUDGET_MS", "50"))
+
+# Runs inside the child interpreter; prints one JSON object.
+_CHILD = r"""
+import asyncio, json, sys, time
+
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+
+asgi = app.main.app
+
+
+async def lifespan_startup():
+    sent = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "lifespan.startup"}
+        await done.wait()
+        return {"type": "lifespan.shutdown"}
+
+    async def send(message):
+        if message["type"] in ("lifespan.startup.complete", "lifespan.startup.failed"):
+            done.set()
+
+    task = asyncio.ensure_future(asgi({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, receive, send))
+    await asyncio.wait_for(done.wait(), 10)
+    return task
+
+
+async def get(path):
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80), "state": {},
+    }
+    await asgi(scope, receive, send)
+    return status.get("code")
+
+
+async def main():
+    t2 = time.perf_counter()
+    task = await lifespan_startup()
+    t3 = time.perf_counter()
+    code = await get("/health")
+    t4 = time.perf_counter()
+    task.cancel()
+    print(json.dumps({
+        "import_ms": (t1 - t0) * 1000,
+        "startup_ms": (t3 - t2) * 1000,
+        "first_request_ms": (t4 - t3) * 1000,
+        "status": code,
+        "requests_imported": "requests" in sys.modules,
+    }))
+
+asyncio.run(main())
+"""
+
+
+def _run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault("PYTHONDONTWRITEBYTECODE", "0")
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=7)
+    ap.add_argument("--import-budget-ms", type=float, default=DEFAULT_IMPORT_BUDGET_MS)
+    ap.add_argument("--first-request-budget-ms", type=float, default=DEFAULT_FIRST_REQUEST_BUDGET_MS)
+    ap.add_argument("--history", help="append the summary as a JSON line to this file")
+    args = ap.parse_args()
+
+    _run_once()  # warm the bytecode cache; not counted
+    runs = [_run_once() for _ in range(max(1, args.runs))]
+
+    summary = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rev": _git_rev(),
+        "runs": len(runs),
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "import_ms_max": round(max(r["import_ms"] for r in runs), 1),
+        "startup_ms": round(statistics.median(r["startup_ms"] for r in runs), 1),
+        "first_request_ms": round(statistics.median(r["first_request_ms"] for r in runs), 1),
+        "requests_imported_at_first_request": any(r["requests_imported"] for r in runs),
+        "budget": {"import_ms": args.import_budget_ms, "first_request_ms": args.first_request_budget_ms},
+    }
+
+    failures = []
+    if summary["import_ms"] > args.import_budget_ms:
+        failures.append(f"import {summary['import_ms']} ms > {args.import_budget_ms} ms")
+    if summary["first_request_ms"] > args.first_request_budget_ms:
+        failures.append(f"first request {summary['first_request_ms']} ms > {args.first_request_budget_ms} ms")
+    if any(r["status"] != 200 for r in runs):
+        failures.append("GET /health did not return 200")
+    summary["ok"] = not failures
+
+    print(json.dumps(summary, indent=2))
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary) + "\n")
+
+    for msg in failures:
+        print(f"BUDGET EXCEEDED: {msg}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Build the frontend for serving from FastAPI (same origin, no CORS preflights).
+
+    python scripts/build_frontend.py            # writes backend/static_build/
+
+- The inline <style> and main <script> of index.html move to app.<hash>.css / app.<hash>.js
+  (a `<script data-inline>` stays inline, e.g. a callback that must exist before async
+  scripts load),
+  and files under assets/ are copied as <name>.<hash>.<ext>; index.html is rewritten to
+  point at /static/<fingerprinted name>. Fingerprinted files never change, so they are
+  served with `Cache-Control: immutable`; only the small index.html is revalidated.
+- The built index.html sets `window.DEESHA_API_BASE = ""`, so API calls are same-origin.
+- Every text file gets a .gz next to it, and a .br when the `brotli` package is installed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from typing import Dict
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+REPO_DIR = os.path.abspath(os.path.join(BACKEND_DIR, ".."))
+
+COMPRESSIBLE = (".html", ".js", ".css", ".json", ".svg", ".txt")
+# Below this, compressed variants are not worth a separate file.
+MIN_COMPRESS_BYTES = 512
+
+
+def _fingerprint(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def _write(out_dir: str, name: str, data: bytes, brotli_mod) -> None:
+    path = os.path.join(out_dir, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    if not name.endswith(COMPRESSIBLE) or len(data) < MIN_COMPRESS_BYTES:
+        return
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli_mod is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli_mod.compress(data, quality=11))
+
+
+def build(src_html: str, assets_dir: str, out_dir: str) -> Dict[str, str]:
+    try:
+        import brotli as brotli_mod  # optional
+    except ImportError:
+        brotli_mod = None
+        print("brotli not installed: writing gzip variants only", file=sys.stderr)
+
+    with open(src_html, encoding="utf-8") as f:
+        html = f.read()
+
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(os.path.join(out_dir, "static"))
+    static_dir = os.path.join(out_dir, "static")
+    manifest: Dict[str, str] = {}
+
+    # 1) assets/* → /static/<name>.<hash>.<ext>
+    for name in sorted(os.listdir(assets_dir)):
+        path = os.path.join(assets_dir, name)
+        if name.startswith(".") or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        built = _fingerprint(name, data)
+        _write(static_dir, built, data, brotli_mod)
+        manifest[f"assets/{name}"] = f"/static/{built}"
+        html = html.replace(f'"assets/{name}"', f'"/static/{built}"')
+
+    # 2) inline <style> and <script> blocks → fingerprinted files (same position, same order)
+    def extract(pattern: str, ext: str, tag) -> None:
+        nonlocal html
+        for i, m in enumerate(list(re.finditer(pattern, html, flags=re.S))):
+            data = m.group(1).encode("utf-8")
+            built = _fingerprint(f"app{'' if i == 0 else i}{ext}", data)
+            _write(static_dir, built, data, brotli_mod)
+            manifest[f"inline{ext}[{i}]"] = f"/static/{built}"
+            html = html.replace(m.group(0), tag(f"/static/{built}"), 1)
+
+    extract(r"<style>(.*?)</style>", ".css", lambda url: f'<link rel="stylesheet" href="{url}">')
+    extract(r"<script>(.*?)</script>", ".js", lambda url: f'<script src="{url}"></script>')
+
+    # 3) same-origin API calls
+    html = html.replace("</title>", '</title>\n<script>window.DEESHA_API_BASE = "";</script>', 1)
+
+    _write(out_dir, "index.html", html.encode("utf-8"), brotli_mod)
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--src", default=os.path.join(REPO_DIR, "index.html"))
+    ap.add_argument("--assets", default=os.path.join(REPO_DIR, "assets"))
+    ap.add_argument("--out", default=os.path.join(BACKEND_DIR, "static_build"))
+    args = ap.parse_args()
+
+    manifest = build(args.src, args.assets, args.out)
+    for src, built in manifest.items():
+        print(f"{src:<24} → {built}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""Replay recorded traffic against this build with upstream calls served from cassettes.
+
+1. Record a slice of real traffic (writes backend/cassettes/ by default):
+       DEESHA_UPSTREAM_MODE=record uvicorn app.main:app --port 8000
+2. Replay it offline, with no network and no API key needed:
+       python scripts/replay_traffic.py --out before.json
+3. Check out another build, replay again and compare:
+       python scripts/replay_traffic.py --out after.json --compare before.json
+
+Requests are sent one at a time through the ASGI app in-process. Each one is timed
+(wall clock and process CPU, which includes threadpool workers). `--latency zero`
+drops the recorded upstream latency, so only our own CPU time shows up.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[idx]
+
+
+async def _call(asgi, item: Dict[str, Any]) -> int:
+    body = (item.get("body") or "").encode("utf-8")
+    sent = False
+    status: Dict[str, int] = {}
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    headers = [(b"host", b"replay"), (b"content-length", str(len(body)).encode())]
+    if body:
+        headers.append((b"content-type", b"application/json"))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": item.get("method", "GET"),
+        "scheme": "http",
+        "path": item["path"],
+        "raw_path": item["path"].encode(),
+        "root_path": "",
+        "query_string": (item.get("query") or "").encode("latin-1"),
+        "headers": headers,
+        "client": ("127.0.0.1", 1),
+        "server": ("replay", 80),
+        "state": {},
+    }
+    await asgi(scope, receive, send)
+    return status.get("code", 0)
+
+
+async def _replay(items: List[Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    from app import main
+    from app.utils import metrics
+
+    per_path: Dict[str, Dict[str, List[float]]] = {}
+    statuses: Dict[str, int] = {}
+    wall_all: List[float] = []
+    cpu_total = 0.0
+
+    async with main.lifespan(main.app):
+        for _ in range(repeat):
+            for item in items:
+                w0, c0 = time.perf_counter(), time.process_time()
+                code = await _call(main.app, item)
+                wall, cpu = time.perf_counter() - w0, time.process_time() - c0
+                wall_all.append(wall)
+                cpu_total += cpu
+                p = per_path.setdefault(item["path"], {"wall": [], "cpu": []})
+                p["wall"].append(wall)
+                p["cpu"].append(cpu)
+                statuses[str(code)] = statuses.get(str(code), 0) + 1
+
+    misses = sum(s["value"] for s in metrics.snapshot()["counters"].get("upstream_replay_misses_total", []))
+    return {
+        "requests": len(wall_all),
+        "statuses": statuses,
+        "replay_misses": misses,
+        "wall_ms": {
+            "p50": round(_pct(wall_all, 0.5) * 1000, 2),
+            "p95": round(_pct(wall_all, 0.95) * 1000, 2),
+            "total": round(sum(wall_all) * 1000, 1),
+        },
+        "cpu_ms_total": round(cpu_total * 1000, 1),
+        "per_path": {
+            path: {
+                "count": len(v["wall"]),
+                "wall_p50_ms": round(_pct(v["wall"], 0.5) * 1000, 2),
+                "wall_p95_ms": round(_pct(v["wall"], 0.95) * 1000, 2),
+                "cpu_mean_ms": round(statistics.fmean(v["cpu"]) * 1000, 3),
+            }
+            for path, v in sorted(per_path.items())
+        },
+    }
+
+
+def _compare(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    def delta(a: float, b: float) -> str:
+        if not a:
+            return "n/a"
+        return f"{(b - a) / a * 100:+.1f}%"
+
+    print(f"{'path':<28}{'cpu mean ms':>22}{'wall p50 ms':>22}{'wall p95 ms':>22}")
+    for path in sorted(set(before["per_path"]) | set(after["per_path"])):
+        a = before["per_path"].get(path)
+        b = after["per_path"].get(path)
+        if not a or not b:
+            print(f"{path:<28}  (only in {'after' if b else 'before'})")
+            continue
+        cols = []
+        for key in ("cpu_mean_ms", "wall_p50_ms", "wall_p95_ms"):
+            cols.append(f"{a[key]:.2f}→{b[key]:.2f} {delta(a[key], b[key])}")
+        print(f"{path:<28}" + "".join(f"{c:>22}" for c in cols))
+    print(f"{'TOTAL cpu ms':<28}{before['cpu_ms_total']}→{after['cpu_ms_total']} {delta(before['cpu_ms_total'], after['cpu_ms_total'])}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cassettes", help="cassette directory (default: DEESHA_CASSETTE_DIR or backend/cassettes)")
+    ap.add_argument("--latency", choices=("recorded", "zero"), default="recorded")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--out", help="write the summary JSON here")
+    ap.add_argument("--compare", help="summary JSON from a previous run to compare against")
+    args = ap.parse_args()
+
+    # Must be set before the app reads its settings.
+    os.environ["DEESHA_UPSTREAM_MODE"] = "replay"
+    os.environ["DEESHA_REPLAY_LATENCY"] = args.latency
+    os.environ.setdefault("GOOGLE_MAPS_API_KEY", "replay")
+    if args.cassettes:
+        os.environ["DEESHA_CASSETTE_DIR"] = os.path.abspath(args.cassettes)
+    sys.path.insert(0, BACKEND_DIR)
+
+    from app.config import get_settings
+    from app.services.recording import load_inbound
+
+    items = load_inbound(get_settings().cassette_dir)
+    if not items:
+        print(f"No recorded inbound requests in {get_settings().cassette_dir}", file=sys.stderr)
+        return 1
+
+    summary = asyncio.run(_replay(items, max(1, args.repeat)))
+    summary["latency"] = args.latency
+    print(json.dumps(summary, indent=2))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            _compare(json.load(f), summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""Run the corridor cache warm-up once and print its coverage report.
+
+Caches are per process, so a running server warms itself at startup when
+DEESHA_WARMUP_CORRIDORS is set. Use this command to check a corridor list and budget
+before deploying it (combine with DEESHA_UPSTREAM_MODE=replay to run offline):
+
+    python scripts/warmup.py --corridors corridors.json --budget 150
+    python scripts/warmup.py --corridors traffic --top 10
+
+Exits non-zero when coverage is below --target.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corridors", required=True, help='corridor JSON file, or "traffic" for recorded inbound traffic')
+    ap.add_argument("--budget", type=int, default=200, help="upstream calls to spend at most")
+    ap.add_argument("--target", type=float, default=0.8, help="coverage needed to pass")
+    ap.add_argument("--top", type=int, default=20, help='corridors to take from traffic (with "traffic")')
+    args = ap.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from app import main as app_main
+    from app.services.warmup import WarmupState, corridors_from_traffic, run_warmup
+
+    if args.corridors == "traffic":
+        from app.services.recording import load_inbound
+
+        corridors = corridors_from_traffic(load_inbound(app_main.settings.cassette_dir), top=args.top)
+    else:
+        corridors = app_main._load_warmup_corridors(args.corridors)
+    if not corridors:
+        print("No corridors to warm", file=sys.stderr)
+        return 1
+
+    state = WarmupState(target=args.target)
+    run_warmup(corridors, app_main._warm_corridor, args.budget, state)
+    print(json.dumps(state.to_dict(), indent=2, ensure_ascii=False))
+    return 0 if state.coverage() >= args.target else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "test-key")
+os.environ.setdefault("DEESHA_PLACE_INDEX_PATH", "none")
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from app.services import admission as admission_module
+from app.services.admission import AdmissionController, AdmissionMiddleware
+
+
+async def _call(app, path, query=b""):
+    """Send one GET through `app`; returns (status, headers, body)."""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query, "headers": []}
+    await app(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return start["status"], dict(start["headers"]), body
+
+
+class _App:
+    """Answers 200; requests to /slow hold their slot until `release` is set."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        if scope["path"] == "/slow":
+            await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _middleware(**kwargs):
+    ctl = AdmissionController(upstream_paths=["/slow", "/search"], **kwargs)
+    ctl.register_cache_probe("/search", lambda params, body: params.get("q") == ["cached"])
+    return ctl, AdmissionMiddleware(_App(), ctl)
+
+
+@pytest.fixture(autouse=True)
+def no_recent_latency(monkeypatch):
+    monkeypatch.setattr(admission_module.upstream, "recent_latency", lambda max_age_s=30.0: None)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_queue_timeout_sheds_with_retry_after():
+    async def scenario():
+        ctl, mw = _middleware(upstream_concurrency=1, queue_timeout_s=0.05)
+        held = asyncio.create_task(_call(mw, "/slow"))
+        await asyncio.sleep(0.01)
+        status, headers, _ = await _call(mw, "/search", b"q=new")
+        mw.app.release.set()
+        await held
+        return status, headers
+
+    status, headers = _run(scenario())
+    assert status == 503
+    assert headers[b"retry-after"] == b"1"
+
+
+def test_cacheable_request_skips_the_upstream_wait():
+    async def scenario():
+        ctl, mw = _middleware(upstream_concurrency=1, queue_timeout_s=5.0)
+        held = asyncio.create_task(_call(mw, "/slow"))
+        await asyncio.sleep(0.01)
+        status, _, body = await asyncio.wait_for(_call(mw, "/search", b"q=cached"), timeout=1.0)
+        mw.app.release.set()
+        await held
+        return status, body
+
+    assert _run(scenario()) == (200, b"ok")
+
+
+def test_full_queue_sheds_at_once():
+    async def scenario():
+        ctl, mw = _middleware(upstream_concurrency=1, upstream_queue_depth=0, queue_timeout_s=5.0)
+        held = asyncio.create_task(_call(mw, "/slow"))
+        await asyncio.sleep(0.01)
+        status, _, _ = await asyncio.wait_for(_call(mw, "/search", b"q=new"), timeout=1.0)
+        cached, _, _ = await _call(mw, "/search", b"q=cached")
+        mw.app.release.set()
+        await held
+        return status, cached
+
+    assert _run(scenario()) == (503, 200)
+
+
+def test_degraded_upstream_sheds_beyond_the_trickle(monkeypatch):
+    monkeypatch.setattr(admission_module.upstream, "recent_latency", lambda max_age_s=30.0: 7.2)
+
+    async def scenario():
+        ctl, mw = _middleware(upstream_concurrency=8, shed_latency_s=4.0, degraded_concurrency=1)
+        held = asyncio.create_task(_call(mw, "/slow"))
+        await asyncio.sleep(0.01)
+        shed = await _call(mw, "/search", b"q=new")
+        cheap = await _call(mw, "/health")
+        mw.app.release.set()
+        await held
+        return shed, cheap
+
+    (status, headers, _), (cheap_status, _, _) = _run(scenario())
+    assert status == 503 and headers[b"retry-after"] == b"8"
+    assert cheap_status == 200
@@ -0,0 +1,30 @@
+import importlib.util
+import os
+
+_SPEC = importlib.util.spec_from_file_location(
+    "build_frontend", os.path.join(os.path.dirname(__file__), "..", "scripts", "build_frontend.py")
+)
+build_frontend = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(build_frontend)
+
+
+def test_maps_callback_stub_stays_inline_before_the_maps_script(tmp_path):
+    assets = tmp_path / "assets"
+    assets.mkdir()
+    src = tmp_path / "index.html"
+    src.write_text(
+        "<html><head><title>t</title></head><body>\n"
+        "<script data-inline>window.onGoogleMapsLoaded = function () {};</script>\n"
+        '<script async defer src="https://maps.example/js?callback=onGoogleMapsLoaded"></script>\n'
+        "<script>window.onGoogleMapsLoaded = function () { go(); };</script>\n"
+        "</body></html>\n",
+        encoding="utf-8",
+    )
+    build_frontend.build(str(src), str(assets), str(tmp_path / "out"))
+    html = (tmp_path / "out" / "index.html").read_text(encoding="utf-8")
+
+    stub = html.index("<script data-inline>window.onGoogleMapsLoaded")
+    maps = html.index("callback=onGoogleMapsLoaded")
+    app_js = html.index('<script src="/static/app.')
+    assert stub < maps < app_js
+    assert "go();" not in html
@@ -0,0 +1,138 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import circuit_breaker, upstream
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=c.monotonic))
+    circuit_breaker.reset()
+    yield c
+    circuit_breaker.reset()
+
+
+def _fail(b, n):
+    for _ in range(n):
+        b.before_call()
+        b.record(False)
+
+
+def test_opens_after_consecutive_failures(clock):
+    b = CircuitBreaker("m", failure_threshold=3, open_s=30)
+    _fail(b, 2)
+    b.before_call()
+    b.record(True)  # a success resets the count
+    _fail(b, 2)
+    assert b.state == CLOSED
+    _fail(b, 1)
+    assert b.state == OPEN
+
+    clock.now += 10
+    with pytest.raises(CircuitOpen) as e:
+        b.before_call()
+    assert e.value.status_code == 503
+    assert e.value.headers["Retry-After"] == "20"
+
+
+def test_slow_calls_count_as_failures(clock):
+    b = CircuitBreaker("m", failure_threshold=2, slow_call_s=8.0)
+    b.before_call()
+    b.record(True, elapsed_s=9.0)
+    b.before_call()
+    b.record(True, elapsed_s=8.5)
+    assert b.state == OPEN
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(clock):
+    b = CircuitBreaker("m", failure_threshold=1, open_s=30)
+    _fail(b, 1)
+    clock.now += 30
+    b.before_call()  # the probe
+    assert b.state == HALF_OPEN
+    with pytest.raises(CircuitOpen) as e:
+        b.before_call()  # only one probe at a time
+    assert e.value.headers["Retry-After"] == "1"
+    b.record(True)
+    assert b.state == CLOSED and b.failures == 0
+    b.before_call()
+
+
+def test_failed_probe_opens_again_for_a_full_period(clock):
+    b = CircuitBreaker("m", failure_threshold=1, open_s=30)
+    _fail(b, 1)
+    clock.now += 31
+    b.before_call()
+    b.record(False)
+    assert b.state == OPEN
+    clock.now += 29
+    with pytest.raises(CircuitOpen):
+        b.before_call()
+    clock.now += 1
+    b.before_call()
+    assert b.state == HALF_OPEN
+
+
+# --- legacy fallback in /places/resolve ---
+
+
+class _Response:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def test_places_resolve_falls_back_to_legacy_while_open(clock, monkeypatch):
+    from app import main
+
+    new_api = {"up": False}
+    sent = []
+
+    class Session:
+        def request(self, method, url, **kwargs):
+            sent.append(url)
+            if "searchText" in url:
+                if not new_api["up"]:
+                    return _Response(503, {"error": "unavailable"})
+                return _Response(200, {"places": [{"id": "new", "displayName": {"text": "Austin"}, "location": {"latitude": 30.27, "longitude": -97.74}}]})
+            if "autocomplete" in url:
+                return _Response(200, {"predictions": [{"place_id": "old"}]})
+            return _Response(200, {"result": {"name": "Austin", "geometry": {"location": {"lat": 30.26, "lng": -97.74}}}})
+
+    monkeypatch.setattr(upstream, "_get_session", lambda: Session())
+    req = main.ResolvePlaceRequest(text="Austin, TX")
+    threshold = main.settings.breaker_failures
+
+    for _ in range(threshold):
+        with pytest.raises(HTTPException) as e:
+            main.resolve_place(req)
+        assert e.value.status_code == 502
+    assert circuit_breaker.breaker("places:searchText").state == OPEN
+
+    del sent[:]
+    r = main.resolve_place(req)
+    assert r["fallback"] == "legacy"
+    assert r["place"]["place_id"] == "old" and r["place"]["source"] == "legacy"
+    assert not any("searchText" in u for u in sent)
+
+    # After open_s the next call probes the new API; it is back, so the breaker closes.
+    new_api["up"] = True
+    clock.now += main.settings.breaker_open_s
+    r = main.resolve_place(req)
+    assert "fallback" not in r and r["place"]["place_id"] == "new"
+    assert circuit_breaker.breaker("places:searchText").state == CLOSED
@@ -0,0 +1,106 @@
+import pytest
+
+from app import main
+from app.utils.geo import CorridorWindow, path_length_m, plan_corridor_circles
+
+
+def _path(km):
+    """A straight route north from Austin, about `km` long, one point per ~1.1 km."""
+    n = max(2, int(km / 1.11) + 1)
+    return [{"lat": 30.27 + i * 0.01, "lng": -97.74} for i in range(n)]
+
+
+PATH = _path(400)
+
+
+def test_short_window_gets_one_circle_at_preferred_radius():
+    circles = plan_corridor_circles(PATH, [CorridorWindow("en_route", 100_000, 120_000, 30_000, 50_000)], max_calls=5)
+    assert len(circles) == 1
+    assert circles[0].radius_m == 30_000
+    assert circles[0].along_m == pytest.approx(110_000)
+
+
+def test_long_window_is_split_into_ceil_length_over_diameter_circles():
+    # 200 km at a 40 km max radius → ceil(200 / 80) = 3 circles, 66.7 km apart
+    circles = plan_corridor_circles(PATH, [CorridorWindow("en_route", 0, 200_000, 20_000, 40_000)], max_calls=10)
+    assert len(circles) == 3
+    assert [c.along_m for c in circles] == pytest.approx([200_000 / 6, 200_000 / 2, 200_000 * 5 / 6])
+    # Radius grows just enough to cover each circle's share of the window
+    assert all(c.radius_m == pytest.approx(200_000 / 6) for c in circles)
+    assert all(c.shared_with is None for c in circles)
+
+
+def test_budget_is_shared_round_robin_and_short_windows_use_max_radius():
+    windows = [
+        CorridorWindow("near_destination", 300_000, 380_000, 10_000, 20_000),  # needs 2
+        CorridorWindow("en_route", 0, 240_000, 20_000, 40_000),  # needs 3
+    ]
+    circles = plan_corridor_circles(PATH, windows, max_calls=3)
+    by_window = {w.name: [c for c in circles if c.window == w.name] for w in windows}
+    assert len(by_window["near_destination"]) == 2
+    assert len(by_window["en_route"]) == 1
+    # Fewer circles than needed: spread evenly at max radius, accepting gaps
+    assert by_window["en_route"][0].radius_m == 40_000
+    assert by_window["en_route"][0].along_m == pytest.approx(120_000)
+
+
+def test_budget_smaller_than_windows_serves_earlier_windows_first():
+    windows = [CorridorWindow("near_destination", 300_000, 310_000, 10_000, 20_000), CorridorWindow("en_route", 0, 10_000, 10_000, 20_000)]
+    assert [c.window for c in plan_corridor_circles(PATH, windows, max_calls=1)] == ["near_destination"]
+    assert plan_corridor_circles(PATH, windows, max_calls=0) == []
+    assert plan_corridor_circles([], windows, max_calls=5) == []
+
+
+def test_overlapping_circle_in_another_window_is_shared():
+    windows = [
+        CorridorWindow("en_route", 100_000, 110_000, 40_000, 40_000),
+        CorridorWindow("near_destination", 104_000, 106_000, 10_000, 10_000),
+    ]
+    circles = plan_corridor_circles(PATH, windows, max_calls=5)
+    assert [c.window for c in circles] == ["en_route", "near_destination"]
+    assert circles[0].shared_with is None
+    assert circles[1].shared_with == 0
+
+
+def test_overlapping_circle_in_the_same_window_is_dropped():
+    windows = [
+        CorridorWindow("en_route", 100_000, 110_000, 40_000, 40_000),
+        CorridorWindow("en_route", 104_000, 106_000, 10_000, 10_000),
+    ]
+    circles = plan_corridor_circles(PATH, windows, max_calls=5)
+    assert len(circles) == 1 and circles[0].radius_m == 40_000
+
+
+def test_circles_below_the_overlap_threshold_are_both_issued():
+    windows = [
+        CorridorWindow("en_route", 100_000, 110_000, 20_000, 20_000),
+        CorridorWindow("near_destination", 130_000, 140_000, 20_000, 20_000),
+    ]
+    circles = plan_corridor_circles(PATH, windows, max_calls=5)
+    assert len(circles) == 2 and all(c.shared_with is None for c in circles)
+
+
+def test_corridor_windows_for_short_and_long_routes():
+    short = _path(60)
+    length = path_length_m(short)
+    near, en = main._corridor_windows(short, 3600)
+    assert (en.start_m, en.end_m) == pytest.approx((0.40 * length, 0.50 * length))
+    assert (near.start_m, near.end_m) == pytest.approx((0.85 * length, 0.92 * length))
+
+    length = path_length_m(PATH)
+    m_per_s = length / (4 * 3600)
+    near, en = main._corridor_windows(PATH, 4 * 3600)
+    assert (en.start_m, en.end_m) == pytest.approx((2700 * m_per_s, length - 1800 * m_per_s))
+    assert (near.start_m, near.end_m) == pytest.approx((length - 1800 * m_per_s, length - 1200 * m_per_s))
+    # Small windows never shrink below the minimum radius
+    near, en = main._corridor_windows(PATH, 4 * 3600, radius_scale=0.01)
+    assert near.radius_m == en.radius_m == main.THINGS_TO_DO_MIN_RADIUS_M
+
+
+def test_first_page_budget_scales_with_route_length():
+    assert main._first_page_calls(_path(60), 3600, None) == 2
+    long_route = main._first_page_calls(PATH, 4 * 3600, None)
+    assert long_route == len(main._page_circles(PATH, 4 * 3600, 1, long_route)) == 4
+    assert main._first_page_calls(_path(1200), 12 * 3600, None) == main.THINGS_TO_DO_FIRST_PAGE_CALLS
+    assert main._first_page_calls(PATH, 4 * 3600, 50) == main.THINGS_TO_DO_MAX_CALLS
+    assert main._first_page_calls(PATH, 4 * 3600, 1) == 1
@@ -0,0 +1,36 @@
+import pytest
+from fastapi import HTTPException
+
+from app import main
+from app.utils.cursor import decode_cursor, encode_cursor
+
+SECRET = b"test-secret"
+STATE = {"mood": "scenic", "poly": "_p~iF~ps|U_ulLnnqC", "dur": 3600, "page": 2, "calls": 2, "n": 17, "seen": ["a"]}
+
+
+def test_roundtrip():
+    state = decode_cursor(encode_cursor(STATE, SECRET), SECRET)
+    assert {k: state[k] for k in STATE} == STATE
+
+
+@pytest.mark.parametrize("mangle", [lambda c: c + "x", lambda c: "A" + c, lambda c: c.split(".")[0], lambda c: "garbage"])
+def test_tampered_cursor_is_rejected(mangle):
+    with pytest.raises(ValueError):
+        decode_cursor(mangle(encode_cursor(STATE, SECRET)), SECRET)
+
+
+def test_other_secret_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(STATE, SECRET), b"other-secret")
+
+
+@pytest.mark.parametrize(
+    "override",
+    [{"page": 1}, {"page": main.THINGS_TO_DO_MAX_PAGES + 1}, {"calls": 0}, {"calls": 1000}, {"n": 9}, {"n": 500}, {"dur": "x"}],
+)
+def test_things_to_do_rejects_out_of_range_cursor(override):
+    cursor = encode_cursor({**STATE, **override}, main.CURSOR_SECRET)
+    req = main.ThingsToDoRequest(start={"lat": 0, "lng": 0}, destination={"lat": 1, "lng": 1}, cursor=cursor)
+    with pytest.raises(HTTPException) as e:
+        main._things_to_do_page(req, 12)
+    assert e.value.status_code == 400
@@ -0,0 +1,39 @@
+import time
+
+from app.services import jobs, upstream
+
+
+def _wait(job):
+    deadline = time.time() + 5
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+    return job.to_dict()
+
+
+def test_cancel_after_fn_returned_keeps_the_result():
+    queue = jobs.JobQueue(workers=1)
+
+    def fn():
+        # The cancel lands once the work is done, just before the job is marked finished.
+        queue.cancel(jobs._current_job.get().id)
+        return {"ok": True}
+
+    out = _wait(queue.submit("test", fn))
+    queue.shutdown()
+    assert out["status"] == jobs.DONE
+    assert out["result"] == {"ok": True}
+
+
+def test_cancel_during_fn_cancels_the_job():
+    queue = jobs.JobQueue(workers=1)
+
+    def fn():
+        queue.cancel(jobs._current_job.get().id)
+        upstream.raise_if_cancelled("test")
+        return {"ok": True}
+
+    out = _wait(queue.submit("test", fn))
+    queue.shutdown()
+    assert out["status"] == jobs.CANCELLED
+    assert out["error"] == {"status_code": 499, "detail": "Job cancelled"}
+    assert "result" not in out
@@ -0,0 +1,55 @@
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import upstream
+
+
+def test_legacy_app_maps_cancelled_upstream_to_499():
+    legacy_app = main._load_legacy_app()
+
+    @legacy_app.get("/_cancelled")
+    def cancelled():
+        raise upstream.UpstreamCancelled("client_disconnected")
+
+    r = TestClient(legacy_app).get("/_cancelled")
+    assert r.status_code == 499
+    assert r.json() == {"detail": "Request cancelled: client_disconnected"}
+
+
+def _fake_google(monkeypatch, predictions):
+    def request_json(method, url, **kwargs):
+        if url.endswith("/autocomplete/json"):
+            return {"predictions": predictions}
+        return {"result": {"name": "Dallas", "geometry": {"location": {"lat": 32.78, "lng": -96.8}}}}
+
+    monkeypatch.setattr(upstream, "request_json", request_json)
+
+
+def test_legacy_resolve_answers_as_when_the_router_was_included(monkeypatch):
+    from fastapi import FastAPI
+
+    from app.routes.trip import router as trip_router
+
+    # How the router was served before it moved behind the lazy mount.
+    included = FastAPI()
+    included.include_router(trip_router)
+    for exc_class, handler in main.app.exception_handlers.items():
+        included.add_exception_handler(exc_class, handler)
+
+    for predictions, body in (
+        ([{"place_id": "p1"}], {"text": "Dallas, TX"}),
+        ([{"place_id": "p1"}], {}),
+        ([], {"text": "Nowhere"}),
+    ):
+        _fake_google(monkeypatch, predictions)
+        before = TestClient(included).post("/legacy/places/resolve", json=body)
+        now = TestClient(main.app).post("/legacy/places/resolve", json=body)
+        assert (now.status_code, now.json()) == (before.status_code, before.json())
+    assert before.status_code == 404
+
+
+def test_legacy_routes_are_in_the_openapi_schema():
+    paths = TestClient(main.app).get("/openapi.json").json()["paths"]
+    assert "/legacy/places/resolve" in paths
+    assert "/legacy/places/things-to-do" in paths
+    assert "/places/resolve" in paths
@@ -0,0 +1,17 @@
+from app.utils import metrics
+
+
+def test_summary_max_is_its_own_gauge_family():
+    metrics.reset()
+    metrics.observe("t_latency_seconds", 0.2, route="a")
+    metrics.observe("t_latency_seconds", 0.5, route="a")
+
+    lines = metrics.render_prometheus().splitlines()
+    summary = lines.index("# TYPE t_latency_seconds summary")
+    gauge = lines.index("# TYPE t_latency_seconds_max gauge")
+    assert lines[summary + 1 : gauge] == [
+        't_latency_seconds_count{route="a"} 2',
+        't_latency_seconds_sum{route="a"} 0.7',
+    ]
+    assert lines[gauge + 1] == 't_latency_seconds_max{route="a"} 0.5'
+    metrics.reset()
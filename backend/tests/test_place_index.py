@@ -0,0 +1,152 @@
+import json
+
+from app.model.place import Place
+from app.services.place_index import PlaceIndex
+from app.utils.geo import point_at_distance
+
+CENTER = (32.78, -96.80)
+
+
+def _places(n, radius_m, types=("park",)):
+    """`n` places spread from the centre out to 90% of `radius_m`."""
+    out = []
+    for i in range(n):
+        p = point_at_distance([{"lat": CENTER[0], "lng": CENTER[1]}, {"lat": CENTER[0] + 1, "lng": CENTER[1] + 1}], radius_m * 0.9 * i / max(1, n - 1))
+        out.append(Place(f"p{i}", f"Place {i}", None, p["lat"], p["lng"], types, 4.0, 10 + i))
+    return out
+
+
+def test_identical_repeat_is_answered_locally():
+    for radius in (500, 3000, 20000):
+        idx = PlaceIndex()
+        places = _places(20, radius)
+        idx.record_search(*CENTER, radius, ["park"], 20, places)  # capped answer
+        local = idx.query(*CENTER, radius, ["park"], 20)
+        assert local is not None and {p.place_id for p in local} == {p.place_id for p in places}
+
+
+def test_nested_circle_of_complete_answer_is_answered_locally():
+    for radius in (500, 3000, 20000):
+        idx = PlaceIndex()
+        idx.record_search(*CENTER, radius, ["park"], 20, _places(8, radius))  # complete answer
+        local = idx.query(*CENTER, radius / 2, ["park"], 20)
+        assert local is not None
+        assert all(p.place_id in {f"p{i}" for i in range(8)} for p in local)
+
+
+def test_nested_circle_of_capped_answer_goes_upstream():
+    idx = PlaceIndex()
+    idx.record_search(*CENTER, 3000, ["park"], 20, _places(20, 3000))
+    # Only the top 20 of the big circle are known, not what ranks next inside half of it.
+    assert idx.query(*CENTER, 1500, ["park"], 20) is None
+    assert idx.query(*CENTER, 1500, ["park"], 5) is None
+    assert idx.query(*CENTER, 3000, ["park"], 5) is not None
+
+
+def test_union_with_a_capped_circle_goes_upstream():
+    idx = PlaceIndex()
+    idx.record_search(CENTER[0], CENTER[1] - 0.02, 3000, ["park"], 20, [])
+    idx.record_search(CENTER[0], CENTER[1], 3000, ["park"], 20, _places(20, 3000))
+    idx.record_search(CENTER[0], CENTER[1] + 0.02, 3000, ["park"], 20, [])
+    assert idx.query(*CENTER, 2500, ["park"], 20) is None
+
+
+def test_other_types_and_outside_areas_go_upstream():
+    idx = PlaceIndex()
+    idx.record_search(*CENTER, 3000, ["park"], 20, _places(5, 3000))
+    assert idx.query(*CENTER, 3000, ["museum"], 20) is None
+    assert idx.query(*CENTER, 6000, ["park"], 20) is None
+    assert idx.query(CENTER[0] + 0.5, CENTER[1], 3000, ["park"], 20) is None
+
+
+def test_union_of_circles_covers_a_query():
+    idx = PlaceIndex()
+    for dlng in (-0.02, 0.0, 0.02):
+        idx.record_search(CENTER[0], CENTER[1] + dlng, 3000, ["park"], 20, [])
+    assert idx.query(*CENTER, 2500, ["park"], 20) == []
+
+
+def test_stale_circles_are_ignored():
+    idx = PlaceIndex(fresh_s=0)
+    idx.record_search(*CENTER, 3000, ["park"], 20, _places(5, 3000))
+    assert idx.query(*CENTER, 3000, ["park"], 20) is None
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    path = str(tmp_path / "index.json")
+    idx = PlaceIndex(path=path)
+    idx.record_search(*CENTER, 3000, ["park"], 20, _places(5, 3000))
+    idx.save()
+    loaded = PlaceIndex(path=path)
+    loaded.load()
+    assert loaded.query(*CENTER, 3000, ["park"], 20) is not None
+
+
+def test_load_ignores_files_that_are_not_an_index(tmp_path):
+    for content in ("[1, 2]", "3", "not json"):
+        path = tmp_path / "index.json"
+        path.write_text(content)
+        idx = PlaceIndex(path=str(path))
+        idx.load()
+        assert idx.query(*CENTER, 3000, ["park"], 20) is None
+
+
+def test_repeat_search_nearby_makes_no_upstream_call(monkeypatch):
+    from app import main
+    from app.services import place_index
+
+    monkeypatch.setattr(place_index, "_index", PlaceIndex())
+    sent = []
+    body = {"places": [{"id": f"p{i}", "displayName": {"text": f"P{i}"}, "location": {"latitude": CENTER[0], "longitude": CENTER[1] + i * 1e-4}, "types": ["park"]} for i in range(5)]}
+
+    def fake_post(url, payload, field_mask=None):
+        sent.append(payload)
+        return json.loads(json.dumps(body))
+
+    monkeypatch.setattr(main, "_places_new_post", fake_post)
+    first, local = main._search_nearby(*CENTER, 3000, ["park"], 20)
+    assert not local and len(sent) == 1
+    again, local = main._search_nearby(*CENTER, 3000, ["park"], 20)
+    assert local and len(sent) == 1 and {p.place_id for p in again} == {p.place_id for p in first}
+    nested, local = main._search_nearby(*CENTER, 1000, ["park"], 20)
+    assert local and len(sent) == 1
+
+
+
+def test_things_to_do_page_2_searches_after_capped_page_1(monkeypatch):
+    from app import main
+    from app.services import place_index
+    from app.utils.cache import TTLCache
+
+    monkeypatch.setattr(place_index, "_index", PlaceIndex())
+    monkeypatch.setattr(main, "_NEARBY_CACHE", TTLCache(maxsize=1000, ttl_s=60))
+    sent = []
+
+    def fake_post(url, payload, field_mask=None):
+        # Every circle is capped: 20 new places around its centre.
+        c = payload["locationRestriction"]["circle"]["center"]
+        n = len(sent)
+        sent.append(payload)
+        return {"places": [
+            {"id": f"c{n}p{i}", "displayName": {"text": f"C{n} P{i}"}, "types": ["park"],
+             "location": {"latitude": c["latitude"], "longitude": c["longitude"] + i * 1e-4},
+             "rating": 4.5, "userRatingCount": 100 - i}
+            for i in range(20)
+        ]}
+
+    monkeypatch.setattr(main, "_places_new_post", fake_post)
+    path = [{"lat": 32.78, "lng": -96.80}, {"lat": 30.27, "lng": -97.74}]
+    seen = set()
+
+    def page(n):
+        found = {"en_route": {}, "near_destination": {}}
+        calls = sum(main._search_circles(main._page_circles(path, 4 * 3600, p, 2), ["park"], 20, found)[0] for p in range(1, n + 1))
+        ranked = main._rank_buckets(found, 12, seen)
+        return calls, {p.place_id for bucket in ranked.values() for p in bucket}
+
+    calls_1, ids_1 = page(1)
+    calls_2, ids_2 = page(2)
+    assert calls_1 > 0 and ids_1
+    # Page 2's smaller circles inside page 1's capped ones go to Google and find new places.
+    assert calls_2 == main.THINGS_TO_DO_PAGE_CALLS
+    assert ids_2 and not ids_2 & ids_1
@@ -0,0 +1,47 @@
+from fastapi.testclient import TestClient
+
+from app import main
+from app.model.schemas import TripRequest
+from app.services.itinerary_services import build_itinerary
+
+DALLAS = {"lat": 32.7767, "lng": -96.797}
+WACO = {"lat": 31.5493, "lng": -97.1467}
+AUSTIN = {"lat": 30.2672, "lng": -97.7431}
+
+
+def test_plan_trip_keeps_its_response_shape():
+    body = {
+        "start_city": "Dallas, TX",
+        "destination": "Austin, TX",
+        "days": 3,
+        "interests": ["food"],
+        "start_lat": DALLAS["lat"], "start_lng": DALLAS["lng"],
+        "destination_lat": AUSTIN["lat"], "destination_lng": AUSTIN["lng"],
+        "mid_stops": [{"title": "Waco", **WACO}],
+    }
+    r = TestClient(main.app).post("/plan-trip", json=body)
+    assert r.status_code == 200
+    assert r.json() == {
+        "summary": "Trip from Dallas, TX to Austin, TX with a stop at Waco for 3 days.",
+        "start_city": "Dallas, TX",
+        "destination": "Austin, TX",
+        "days": [
+            {"day": 1, "stops": [{"title": "Dallas, TX", **DALLAS}, {"title": "Waco", "stay": "1 hr", **WACO}, {"title": "Austin, TX", **AUSTIN}]},
+            {"day": 2, "stops": [{"title": "Austin, TX"}]},
+            {"day": 3, "stops": [{"title": "Austin, TX"}]},
+        ],
+        "start": {"title": "Dallas, TX", **DALLAS, "place_id": None},
+        "destination_obj": {"title": "Austin, TX", **AUSTIN, "place_id": None},
+    }
+
+
+def test_build_itinerary_keeps_its_day_template():
+    out = build_itinerary(TripRequest(start_city=" Dallas ", destination="Austin", destination_state="TX", interests=["Food"]))
+    assert out.summary == "Dallas → Austin (TX) • 3 days"
+    assert [d.title for d in out.days] == ["Day 1 in Austin", "Day 2 in Austin", "Day 3 in Austin"]
+    assert all(
+        [(s.title, s.category) for s in d.stops]
+        == [("Start easy + coffee", "warmup"), ("Famous local eats", "highlight"), ("Dinner + chill", "food")]
+        for d in out.days
+    )
+    assert len(build_itinerary(TripRequest(start_city="A", destination="B", days=0)).days) == 3
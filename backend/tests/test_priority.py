@@ -0,0 +1,41 @@
+import threading
+import time
+
+from app.services import priority, upstream
+
+
+def _slow_call(_):
+    with priority.scheduler().slot():
+        time.sleep(0.1)
+
+
+def test_interactive_fanout_is_not_queued_behind_background_fanout():
+    started = threading.Event()
+
+    def background_batch():
+        with priority.priority("background"):
+            started.set()
+            upstream.map_concurrent(_slow_call, range(200))
+
+    batch = threading.Thread(target=background_batch, daemon=True)
+    batch.start()
+    started.wait()
+    time.sleep(0.2)
+
+    t0 = time.perf_counter()
+    with priority.priority("interactive"):
+        upstream.map_concurrent(_slow_call, range(5))
+    elapsed = time.perf_counter() - t0
+
+    assert batch.is_alive()
+    assert elapsed < 1.0
+    batch.join(timeout=30)
+
+
+def test_fanout_pool_follows_priority_class():
+    names = {}
+    for name in priority.PRIORITIES:
+        with priority.priority(name):
+            names[name] = upstream.map_concurrent(lambda _: threading.current_thread().name, range(2))
+    for name, threads in names.items():
+        assert all(t.startswith(f"upstream-fanout-{name}") for t in threads)
@@ -0,0 +1,121 @@
+import pytest
+
+from app import main
+from app.services import upstream
+from app.utils.cache import TTLCache
+from app.utils.geo import decode_polyline, encode_polyline, haversine_m
+
+A, B, C, D, E = ({"lat": 32.7767 - i * 0.5, "lng": -96.797 - i * 0.2} for i in range(5))
+
+
+def _leg(a, b):
+    pts = [a, {"lat": round((a["lat"] + b["lat"]) / 2 + 0.01, 5), "lng": round((a["lng"] + b["lng"]) / 2, 5)}, b]
+    dist = int(haversine_m(a["lat"], a["lng"], b["lat"], b["lng"]) * 1.2)
+    return {"distanceMeters": dist, "duration": f"{dist // 25}s", "polyline": {"encodedPolyline": encode_polyline(pts)}}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Fake computeRoutes: one leg per consecutive pair, the route is their concatenation."""
+    sent = []
+
+    def fake_request_json(method, url, json=None, **kwargs):
+        sent.append(json)
+        pts = [json["origin"], *json.get("intermediates", []), json["destination"]]
+        pts = [{"lat": p["location"]["latLng"]["latitude"], "lng": p["location"]["latLng"]["longitude"]} for p in pts]
+        legs = [_leg(a, b) for a, b in zip(pts, pts[1:])]
+        path = [pts[0]]
+        for lg in legs:
+            path.extend(decode_polyline(lg["polyline"]["encodedPolyline"])[1:])
+        dist = sum(lg["distanceMeters"] for lg in legs)
+        dur = sum(int(lg["duration"][:-1]) for lg in legs)
+        return {"routes": [{"distanceMeters": dist, "duration": f"{dur}s", "polyline": {"encodedPolyline": encode_polyline(path)}, "legs": legs}]}
+
+    monkeypatch.setattr(upstream, "request_json", fake_request_json)
+    _fresh_caches(monkeypatch)
+    return sent
+
+
+def _fresh_caches(monkeypatch):
+    monkeypatch.setattr(main, "_ROUTE_CACHE", TTLCache(maxsize=100, ttl_s=300))
+    monkeypatch.setattr(main, "_LEG_CACHE", TTLCache(maxsize=100, ttl_s=300))
+
+
+def _ll(p):
+    return main.LatLng(**p)
+
+
+def _full(stops):
+    return main._compute_route(_ll(stops[0]), _ll(stops[-1]), [_ll(p) for p in stops[1:-1]])
+
+
+def _incremental(stops, legs, op, index, stop=None):
+    req = main.IncrementalRouteRequest(
+        stops=[_ll(p) for p in stops],
+        legs=[main.RouteLeg(**{k: lg[k] for k in ("distance_meters", "duration_seconds", "polyline")}) for lg in legs],
+        edit=main.StopEdit(op=op, index=index, stop=_ll(stop) if stop else None),
+    )
+    return main.routes_incremental(req)
+
+
+def _assert_same_route(got, want):
+    for k in ("distance_meters", "duration_seconds", "distance_text", "duration_text"):
+        assert got[k] == want[k]
+    assert decode_polyline(got["polyline"]) == decode_polyline(want["polyline"])
+    assert [{k: lg[k] for k in ("distance_meters", "duration_seconds", "polyline")} for lg in got["legs"]] == [
+        {k: lg[k] for k in ("distance_meters", "duration_seconds", "polyline")} for lg in want["legs"]
+    ]
+
+
+@pytest.mark.parametrize(
+    "stops, op, index, stop, want_stops, want_calls",
+    [
+        ([A, B, D], "add", 2, C, [A, B, C, D], 1),
+        ([A, B, C, D], "remove", 2, None, [A, B, D], 1),
+        ([A, B, C, D], "move", 1, E, [A, E, C, D], 1),
+        ([A, D], "add", 1, B, [A, B, D], 1),
+    ],
+)
+def test_incremental_route_matches_full_route(calls, monkeypatch, stops, op, index, stop, want_stops, want_calls):
+    before = _full(stops)
+    _fresh_caches(monkeypatch)  # only the legs the client sends back may be reused
+    del calls[:]
+    got = _incremental(stops, before["legs"], op, index, stop)
+    assert len(calls) == want_calls
+    assert got["incremental"]["upstream_calls"] == want_calls
+
+    _fresh_caches(monkeypatch)
+    _assert_same_route(got, _full(want_stops))
+
+
+def test_consecutive_missing_legs_are_routed_in_one_call(calls):
+    # Moving B changes A→B and B→C: one run, routed A → E → C.
+    got = _incremental([A, B, C, D], [], "move", 1, E)
+    assert len(calls) == 1
+    assert calls[0]["intermediates"][0]["location"]["latLng"] == {"latitude": E["lat"], "longitude": E["lng"]}
+    assert calls[0]["origin"]["location"]["latLng"]["latitude"] == A["lat"]
+    assert calls[0]["destination"]["location"]["latLng"]["latitude"] == D["lat"]
+    assert got["incremental"] == {"legs_reused": 0, "legs_recomputed": 3, "upstream_calls": 1}
+
+
+def test_separate_runs_get_one_call_each(calls):
+    # Only C→D is known: A→B→C and D→E are two runs.
+    _full([C, D])
+    del calls[:]
+    got = _incremental([A, B, C, D], [], "add", 4, E)
+    assert len(calls) == 2
+    assert got["incremental"] == {"legs_reused": 1, "legs_recomputed": 3, "upstream_calls": 2}
+
+
+def test_leg_cache_is_keyed_by_stops_rounded_to_five_decimals(calls):
+    first = _full([A, B, C])
+    nudged = [{"lat": p["lat"] + 2e-6, "lng": p["lng"] - 2e-6} for p in (A, B, C)]
+    del calls[:]
+    got = _incremental(nudged, [], "add", 3, D)
+    assert len(calls) == 1 and got["incremental"]["legs_reused"] == 2
+    assert got["legs"][:2] == first["legs"]
+    # ~1 m is a different stop
+    moved = [{"lat": p["lat"] + 2e-5, "lng": p["lng"]} for p in (A, B)]
+    del calls[:]
+    main._compute_route(_ll(moved[0]), _ll(moved[1]), [])
+    assert len(calls) == 1
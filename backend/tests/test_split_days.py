@@ -0,0 +1,154 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.itinerary_services import OVERNIGHT_STAY, SNAP_TO_STOP_S, ItineraryEngine
+from app.utils.geo import RouteIndex, decode_polyline, encode_polyline, haversine_m, point_at_distance
+
+SPEED = 25.0  # m/s
+
+
+def _line(a, b, n=20):
+    return [{"lat": round(a["lat"] + (b["lat"] - a["lat"]) * i / n, 5), "lng": round(a["lng"] + (b["lng"] - a["lng"]) * i / n, 5)} for i in range(n + 1)]
+
+
+def _leg(a, b, speed=SPEED):
+    dist = haversine_m(a["lat"], a["lng"], b["lat"], b["lng"])
+    return {"distance_meters": int(dist), "duration_seconds": int(dist / speed), "polyline": encode_polyline(_line(a, b))}
+
+
+def _route(stops):
+    legs = [_leg(a, b) for a, b in zip(stops, stops[1:])]
+    return {
+        "distance_meters": sum(lg["distance_meters"] for lg in legs),
+        "duration_seconds": sum(lg["duration_seconds"] for lg in legs),
+        "legs": legs,
+    }
+
+
+# --- RouteIndex ---
+
+
+def test_route_index_spreads_time_per_leg_and_scales_to_road_distance():
+    a, b, c = {"lat": 30.0, "lng": -97.0}, {"lat": 31.0, "lng": -97.0}, {"lat": 32.0, "lng": -97.0}
+    fast = {**_leg(a, b), "distance_meters": 150_000, "duration_seconds": 3600}
+    slow = {**_leg(b, c), "distance_meters": 150_000, "duration_seconds": 7200}
+    index = RouteIndex.from_route({"legs": [fast, slow]})
+
+    assert index.total_m == pytest.approx(300_000)
+    assert index.total_s == pytest.approx(10_800)
+    assert index.stop_seconds() == pytest.approx([0, 3600, 10_800])
+    # Halfway through each leg's time is halfway along its road distance
+    assert index.at_seconds(1800)["along_m"] == pytest.approx(75_000, rel=1e-3)
+    assert index.at_seconds(3600 + 3600)["along_m"] == pytest.approx(225_000, rel=1e-3)
+    assert index.at_seconds(3600 + 3600)["lat"] == pytest.approx(31.5, abs=1e-3)
+    # Out-of-range times clamp to the ends
+    assert index.at_seconds(-5)["lat"] == pytest.approx(30.0)
+    assert index.at_seconds(1e9)["lat"] == pytest.approx(32.0)
+
+
+def test_route_index_without_legs_uses_the_route_polyline():
+    a, b = {"lat": 30.0, "lng": -97.0}, {"lat": 31.0, "lng": -97.0}
+    index = RouteIndex.from_route({"polyline": encode_polyline(_line(a, b)), "distance_meters": 120_000, "duration_seconds": 4000})
+    assert index.total_m == pytest.approx(120_000)
+    assert index.stop_idx == [0, len(index.path) - 1]
+    assert RouteIndex.from_route({"polyline": ""}) is None
+
+
+def test_slice_seconds_returns_the_driven_stretch():
+    a, b = {"lat": 30.0, "lng": -97.0}, {"lat": 32.0, "lng": -97.0}
+    index = RouteIndex.from_route({"legs": [_leg(a, b)]})
+    part = index.slice_seconds(index.total_s / 4, index.total_s / 2)
+    assert part[0]["lat"] == pytest.approx(30.5, abs=1e-3)
+    assert part[-1]["lat"] == pytest.approx(31.0, abs=1e-3)
+    assert all(30.5 - 1e-3 <= p["lat"] <= 31.0 + 1e-3 for p in part)
+
+
+def test_point_at_distance_along_a_path():
+    path = _line({"lat": 30.0, "lng": -97.0}, {"lat": 31.0, "lng": -97.0})
+    length = haversine_m(30.0, -97.0, 31.0, -97.0)
+    assert point_at_distance(path, length / 2)["lat"] == pytest.approx(30.5, abs=1e-4)
+    assert point_at_distance(path, 0)["lat"] == pytest.approx(30.0)
+
+
+# --- split_days ---
+
+
+def _plan(stops, days, max_drive_hours=None, nearby=None):
+    start, *mids, dest = stops
+    req = SimpleNamespace(
+        start_city="Start", destination="End", days=days,
+        start_lat=start["lat"], start_lng=start["lng"], destination_lat=dest["lat"], destination_lng=dest["lng"],
+        mid_stops=[SimpleNamespace(title=m["title"], lat=m["lat"], lng=m["lng"]) for m in mids],
+        split_days=True, max_drive_hours=max_drive_hours,
+    )
+    seen = []
+
+    def default_nearby(lat, lng):
+        seen.append((lat, lng))
+        return [{"title": f"Motel {len(seen)}", "lat": lat, "lng": lng, "place_id": f"m{len(seen)}"}]
+
+    engine = ItineraryEngine(route=_route, nearby=nearby or default_nearby)
+    return engine.plan(req), seen
+
+
+START, END = {"lat": 25.0, "lng": -97.0}, {"lat": 40.0, "lng": -97.0}
+
+
+def test_long_drive_is_cut_into_equal_days_with_overnight_candidates():
+    plan, seen = _plan([START, END], days=3, max_drive_hours=7)
+    days = plan["days"]
+    total_s = _route([START, END])["duration_seconds"]
+    assert [d["day"] for d in days] == [1, 2, 3]
+    assert [d["drive"]["duration_seconds"] for d in days] == pytest.approx([total_s / 3] * 3, abs=2)
+    assert not any(d["drive"]["over_limit"] for d in days)
+    assert sum(d["drive"]["distance_meters"] for d in days) == pytest.approx(_route([START, END])["distance_meters"], abs=3)
+
+    # Day boundaries: one overnight search per cut, at a third and two thirds of the time
+    assert len(seen) == 2
+    assert [d["overnight"]["along_s"] for d in days[:2]] == pytest.approx([total_s / 3, 2 * total_s / 3], abs=2)
+    assert days[0]["stops"][-1] == days[1]["stops"][0]
+    assert days[0]["stops"][-1]["stay"] == OVERNIGHT_STAY
+    assert days[0]["stops"][-1]["title"] == "Motel 1"
+    assert days[2]["stops"][-1]["title"] == "End"
+    assert "overnight" not in days[2]
+    # Each day's polyline starts where the previous one ended
+    assert decode_polyline(days[0]["drive"]["polyline"])[-1] == decode_polyline(days[1]["drive"]["polyline"])[0]
+
+
+def test_days_cap_the_split_and_flag_days_over_the_limit():
+    plan, _ = _plan([START, END], days=2, max_drive_hours=7)
+    drive_days = [d for d in plan["days"] if "drive" in d]
+    assert len(drive_days) == 2
+    assert all(d["drive"]["over_limit"] for d in drive_days)
+
+    plan, seen = _plan([START, END], days=5, max_drive_hours=16)
+    assert len([d for d in plan["days"] if "drive" in d]) == 2  # ceil(18.5 h / 16 h)
+    assert len(plan["days"]) == 5 and len(seen) == 1
+
+
+def test_cut_near_a_mid_stop_snaps_onto_it():
+    total_s = _route([START, END])["duration_seconds"]
+    # A stop 30 min of driving past the halfway point
+    along = (total_s / 2 + 1800) * SPEED
+    mid = {"title": "Midway", "lat": round(START["lat"] + along / 111_195.0, 5), "lng": -97.0}
+    plan, seen = _plan([START, mid, END], days=2, max_drive_hours=12)
+    day1, day2 = plan["days"]
+    assert day1["overnight"]["at_stop"] == "Midway"
+    assert abs(day1["overnight"]["along_s"] - total_s / 2) <= SNAP_TO_STOP_S
+    assert day1["stops"][-1]["title"] == "Midway" and day1["stops"][-1]["stay"] == OVERNIGHT_STAY
+    assert day2["stops"][0]["title"] == "Midway"
+    assert len(seen) == 1
+
+
+def test_failed_overnight_search_keeps_the_split():
+    from fastapi import HTTPException
+
+    def failing(lat, lng):
+        raise HTTPException(status_code=502, detail="down")
+
+    plan, _ = _plan([START, END], days=2, max_drive_hours=12, nearby=failing)
+    overnight = plan["days"][0]["overnight"]
+    assert overnight["error"] == "Overnight search unavailable"
+    assert overnight["candidates"] == []
+    assert plan["days"][0]["stops"][-1]["title"] == "Overnight stop 1"
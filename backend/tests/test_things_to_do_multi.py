@@ -0,0 +1,58 @@
+import pytest
+
+from app import main
+from app.services import place_index
+from app.services.place_index import PlaceIndex
+from app.utils.cache import TTLCache
+from app.utils.geo import encode_polyline
+
+PATH = [{"lat": round(32.78 - i * 0.05, 5), "lng": -96.80} for i in range(40)]
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    monkeypatch.setattr(place_index, "_index", PlaceIndex())
+    monkeypatch.setattr(main, "_NEARBY_CACHE", TTLCache(maxsize=1000, ttl_s=60))
+    monkeypatch.setattr(main, "routes", lambda req: {"polyline": encode_polyline(PATH), "duration_seconds": 3600})
+    return []
+
+
+def _fake_search(sent, answer):
+    def fake_post(url, payload, field_mask=None):
+        sent.append(payload["includedTypes"])
+        c = payload["locationRestriction"]["circle"]["center"]
+        n = len(sent)
+        return {"places": [
+            {"id": f"{t}{n}-{i}", "displayName": {"text": f"{t} {i}"}, "types": [t],
+             "location": {"latitude": c["latitude"], "longitude": c["longitude"] + i * 1e-4},
+             "rating": 4.5, "userRatingCount": 100 - i}
+            for i, t in enumerate(answer(set(payload["includedTypes"])))
+        ]}
+    return fake_post
+
+
+def _req(moods):
+    return main.ThingsToDoRequest(start={"lat": 32.78, "lng": -96.80}, destination={"lat": 30.8, "lng": -96.80}, moods=moods)
+
+
+def test_mood_crowded_out_by_a_dense_one_is_searched_on_its_own(sent, monkeypatch):
+    def answer(types):
+        if "restaurant" in types:
+            return ["restaurant"] * 20  # the merged query: restaurants fill every circle
+        return ["museum"] * 8
+
+    monkeypatch.setattr(main, "_places_new_post", _fake_search(sent, answer))
+    r = main._things_to_do_multi(_req(["food", "culture"]), 12)
+    assert r["search"]["mood_followups"] == ["culture"]
+    assert r["moods"]["culture"]["count"]["en_route"] > 0
+    assert r["moods"]["culture"]["count"]["near_destination"] > 0
+    assert r["moods"]["food"]["count"]["en_route"] == 12
+    assert all("restaurant" not in types for types in sent[-2:])
+
+
+def test_no_followup_when_the_merged_answer_has_room(sent, monkeypatch):
+    monkeypatch.setattr(main, "_places_new_post", _fake_search(sent, lambda types: ["restaurant"] * 5 + ["museum"] * 5))
+    r = main._things_to_do_multi(_req(["food", "culture"]), 12)
+    assert r["search"]["mood_followups"] == []
+    assert r["search"]["upstream_calls"] == len(sent) == 2
+    assert r["moods"]["culture"]["count"]["en_route"] == 5
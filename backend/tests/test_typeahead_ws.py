@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+
+from app import main
+
+
+def test_bad_seq_gets_error_frame_and_keeps_socket_open():
+    client = TestClient(main.app)
+    with client.websocket_connect("/ws/places/suggest") as ws:
+        ws.send_json({"input": "", "seq": "abc"})
+        assert ws.receive_json() == {"input": "", "seq": "abc", "error": "seq must be an integer"}
+        ws.send_json({"input": "", "seq": {"x": 1}})
+        assert "error" in ws.receive_json()
+        ws.send_json({"input": "", "seq": 5})
+        assert ws.receive_json() == {"input": "", "seq": 5, "predictions": []}
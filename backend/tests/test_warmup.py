@@ -0,0 +1,59 @@
+import threading
+
+from app.services import upstream
+from app.services.warmup import Corridor, WarmupState, run_warmup
+
+
+def _fake_call(monkeypatch):
+    """Make upstream.request_json count a call and answer without the network."""
+
+    class Response:
+        status_code = 200
+
+        def json(self):
+            return {}
+
+    class Session:
+        def request(self, *args, **kwargs):
+            return Response()
+
+    monkeypatch.setattr(upstream, "_get_session", lambda: Session())
+    return lambda: upstream.request_json("POST", "https://places.googleapis.com/v1/places:searchNearby", json={})
+
+
+def test_budget_counts_only_warmup_calls(monkeypatch):
+    call = _fake_call(monkeypatch)
+    corridors = [Corridor("A", "B"), Corridor("C", "D"), Corridor("E", "F")]
+
+    def warm(corridor, step):
+        # Live traffic on another thread while each corridor warms.
+        live = threading.Thread(target=lambda: [call() for _ in range(10)])
+        live.start()
+        live.join()
+        step("search", lambda: upstream.map_concurrent(lambda _: call(), range(2)))
+
+    report = run_warmup(corridors, warm, budget=4, state=WarmupState())
+    assert report["upstream_calls"] == 4
+    assert report["corridors_warmed"] == 2
+    assert report["corridors_skipped"] == 1
+
+
+def test_budget_is_enforced_per_call_inside_a_step(monkeypatch):
+    call = _fake_call(monkeypatch)
+    corridors = [Corridor("A", "B"), Corridor("C", "D"), Corridor("E", "F")]
+    left = []
+
+    def warm(corridor, step):
+        # One step that fans out 2 calls; the budget of 3 runs out halfway through the second.
+        def search():
+            left.append(upstream.calls_left())
+            return upstream.map_concurrent(lambda _: call(), range(2))
+
+        step("search", search)
+
+    report = run_warmup(corridors, warm, budget=3, state=WarmupState())
+    assert report["upstream_calls"] == 3
+    assert left == [3, 1]
+    assert report["corridors_warmed"] == 1
+    assert report["corridors_partial"] == 1
+    assert report["corridors_skipped"] == 1